@@ -0,0 +1,72 @@
+# emission time and .tex size of the examples for each tikz number format.
+# run from the root of the repo: python benchmarks/number_formats.py
+
+import io
+import os
+import glob
+import runpy
+import tempfile
+import time
+import sane_tikz.core as stz
+
+formats = [("fixed", 6), ("fixed", 3), ("stripped", 6), ("stripped", 3),
+           ("shortest", None)]
+num_repeats = 20
+
+
+def load_example(filepath):
+    # NOTE: runs the example and keeps the element instead of writing it.
+    out = {}
+
+    def keep(e, _, name2color_in_rgb=None):
+        out["e"] = e
+        out["name2color_in_rgb"] = name2color_in_rgb
+
+    draw_fn = stz.draw_to_tikz_standalone
+    stz.draw_to_tikz_standalone = keep
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            cwd = os.getcwd()
+            os.chdir(d)
+            try:
+                runpy.run_path(filepath)
+            finally:
+                os.chdir(cwd)
+    finally:
+        stz.draw_to_tikz_standalone = draw_fn
+    return out["e"], out["name2color_in_rgb"]
+
+
+def benchmark(e, name2color_in_rgb):
+    start = time.time()
+    for _ in range(num_repeats):
+        f = io.StringIO()
+        stz.write_tikz_standalone(e, f, name2color_in_rgb)
+    elapsed = (time.time() - start) / num_repeats
+    return elapsed, len(f.getvalue().encode("utf-8"))
+
+
+if __name__ == "__main__":
+    filepaths = sorted(glob.glob(os.path.join("examples", "*.py")))
+    header = ["example"] + [
+        "%s(%s)" % (mode, precision) if precision is not None else mode
+        for (mode, precision) in formats
+    ]
+    print("\t".join(header) + "\t(ms / bytes)")
+    totals = [[0.0, 0] for _ in formats]
+    for filepath in filepaths:
+        e, name2color_in_rgb = load_example(os.path.abspath(filepath))
+        row = [os.path.basename(filepath)[:-3]]
+        for i, (mode, precision) in enumerate(formats):
+            if precision is None:
+                stz.set_tikz_number_format(mode)
+            else:
+                stz.set_tikz_number_format(mode, precision)
+            elapsed, size = benchmark(e, name2color_in_rgb)
+            totals[i][0] += elapsed
+            totals[i][1] += size
+            row.append("%.2f / %d" % (1000.0 * elapsed, size))
+        print("\t".join(row))
+    print("\t".join(["total"] +
+                    ["%.2f / %d" % (1000.0 * t, s) for (t, s) in totals]))
+    stz.set_tikz_number_format()
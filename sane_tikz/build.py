@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+# runs figure scripts and compiles the resulting standalone tex files to pdf
+# in parallel. figures whose tex content did not change since the last
+# compilation are skipped, and so are the tex files left over by scripts that
+# failed (reported as stale).
+#
+# usage: python -m sane_tikz.build [dirpath ...] [--jobs N] [--latex pdflatex]
+
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def file_hash(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# NOTE: the hash of the tex file that generated a pdf is kept next to the pdf.
+def pdf_hash_filepath(tex_filepath):
+    return os.path.splitext(tex_filepath)[0] + ".pdf.sha256"
+
+
+def pdf_filepath(tex_filepath):
+    return os.path.splitext(tex_filepath)[0] + ".pdf"
+
+
+def is_pdf_up_to_date(tex_filepath, tex_hash):
+    hash_filepath = pdf_hash_filepath(tex_filepath)
+    if not (os.path.isfile(pdf_filepath(tex_filepath)) and
+            os.path.isfile(hash_filepath)):
+        return False
+    with open(hash_filepath, 'r') as f:
+        return f.read().strip() == tex_hash
+
+
+def find_figure_scripts(dirpath):
+    return sorted([
+        p for p in glob.glob(os.path.join(dirpath, "*.py"))
+        if not os.path.basename(p).startswith("_")
+    ])
+
+
+def is_standalone_tex_file(filepath):
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        return f.readline().startswith("\\documentclass{standalone}")
+
+
+def find_standalone_tex_files(dirpath):
+    return sorted([
+        p for p in glob.glob(os.path.join(dirpath, "*.tex"))
+        if is_standalone_tex_file(p)
+    ])
+
+
+# NOTE: scripts are run from their own folder as they write relative paths.
+def run_figure_script(filepath):
+    start = time.time()
+    p = subprocess.run(
+        [sys.executable, os.path.basename(filepath)],
+        cwd=os.path.dirname(os.path.abspath(filepath)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT)
+    return {
+        "filepath": filepath,
+        "ok": p.returncode == 0,
+        "time": time.time() - start,
+        "output": p.stdout.decode('utf-8', errors='replace')
+    }
+
+
+def tex_file_mtimes(dirpath_lst):
+    return {
+        p: os.stat(p).st_mtime_ns for d in dirpath_lst
+        for p in glob.glob(os.path.join(d, "*.tex"))
+    }
+
+
+# NOTE: scripts may write any tex files, so the ones of a failed script are
+# not known. a tex file is taken as stale if it is in the folder of a failed
+# script, was not written during this run, and is not named after a script
+# that ran (which may have left it unchanged on purpose).
+def stale_tex_filepaths(script_results, mtimes_before):
+    failed_dirpaths = set()
+    ok_names = set()
+    for r in script_results:
+        dirpath = os.path.dirname(os.path.abspath(r["filepath"]))
+        if r["ok"]:
+            ok_names.add(os.path.splitext(os.path.abspath(r["filepath"]))[0])
+        else:
+            failed_dirpaths.add(dirpath)
+    return set([
+        p for p, mtime in mtimes_before.items()
+        if (os.path.dirname(os.path.abspath(p)) in failed_dirpaths and
+            os.path.isfile(p) and os.stat(p).st_mtime_ns == mtime and
+            os.path.splitext(os.path.abspath(p))[0] not in ok_names)
+    ])
+
+
+def stale_tex_result(filepath):
+    return {
+        "filepath": filepath,
+        "ok": False,
+        "skipped": True,
+        "stale": True,
+        "time": 0.0,
+        "output": "Not compiled: left over by a figure script that failed."
+    }
+
+
+def compile_tex(filepath, latex_cmd="pdflatex", force=False):
+    start = time.time()
+    tex_hash = file_hash(filepath)
+    if not force and is_pdf_up_to_date(filepath, tex_hash):
+        return {
+            "filepath": filepath,
+            "ok": True,
+            "skipped": True,
+            "time": time.time() - start,
+            "output": ""
+        }
+
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    name = os.path.basename(filepath)
+    # NOTE: a missing latex binary fails the figure (not the whole build).
+    try:
+        p = subprocess.run(
+            [latex_cmd, "-interaction=nonstopmode", "-halt-on-error", name],
+            cwd=dirpath,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+    except OSError as err:
+        return {
+            "filepath": filepath,
+            "ok": False,
+            "skipped": False,
+            "time": time.time() - start,
+            "output": "Could not run %s: %s" % (latex_cmd, err)
+        }
+    ok = p.returncode == 0
+    if ok:
+        with open(pdf_hash_filepath(filepath), 'w') as f:
+            f.write(tex_hash + "\n")
+        # the log is only kept if compilation fails.
+        for ext in [".aux", ".log"]:
+            aux_filepath = os.path.splitext(filepath)[0] + ext
+            if os.path.isfile(aux_filepath):
+                os.remove(aux_filepath)
+    return {
+        "filepath": filepath,
+        "ok": ok,
+        "skipped": False,
+        "time": time.time() - start,
+        "output": p.stdout.decode('utf-8', errors='replace')
+    }
+
+
+def build(dirpath_lst,
+          num_jobs=None,
+          latex_cmd="pdflatex",
+          run_scripts=True,
+          force=False,
+          log_fn=print):
+    if num_jobs is None:
+        num_jobs = os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        script_results = []
+        stale_filepaths = set()
+        if run_scripts:
+            mtimes_before = tex_file_mtimes(dirpath_lst)
+            script_filepaths = [
+                p for d in dirpath_lst for p in find_figure_scripts(d)
+            ]
+            for r in executor.map(run_figure_script, script_filepaths):
+                log_fn(
+                    "%-40s %-10s %7.2fs" %
+                    (r["filepath"], "ran" if r["ok"] else "FAILED", r["time"]))
+                if not r["ok"]:
+                    log_fn(r["output"])
+                script_results.append(r)
+            stale_filepaths = stale_tex_filepaths(script_results, mtimes_before)
+
+        tex_filepaths = [
+            p for d in dirpath_lst for p in find_standalone_tex_files(d)
+        ]
+
+        def compile_fn(p):
+            if p in stale_filepaths:
+                return stale_tex_result(p)
+            return compile_tex(p, latex_cmd, force)
+
+        compile_results = []
+        for r in executor.map(compile_fn, tex_filepaths):
+            if r.get("stale", False):
+                status = "stale"
+            elif not r["ok"]:
+                status = "FAILED"
+            elif r["skipped"]:
+                status = "unchanged"
+            else:
+                status = "compiled"
+            log_fn("%-40s %-10s %7.2fs" % (r["filepath"], status, r["time"]))
+            if not r["ok"]:
+                log_fn(r["output"])
+            compile_results.append(r)
+
+    return script_results, compile_results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run sane_tikz figure scripts and compile them to pdf.")
+    parser.add_argument("dirpaths", nargs="*", default=["."])
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--latex", default="pdflatex")
+    parser.add_argument("--no-run",
+                        action="store_true",
+                        help="only compile the existing tex files.")
+    parser.add_argument("--force",
+                        action="store_true",
+                        help="compile even if the tex files are unchanged.")
+    args = parser.parse_args(args)
+
+    start = time.time()
+    script_results, compile_results = build(args.dirpaths, args.jobs,
+                                            args.latex, not args.no_run,
+                                            args.force)
+    num_failed = len([
+        r for r in script_results + compile_results
+        if not (r["ok"] or r.get("stale", False))
+    ])
+    num_compiled = len(
+        [r for r in compile_results if r["ok"] and not r["skipped"]])
+    num_skipped = len([r for r in compile_results if r["ok"] and r["skipped"]])
+    num_stale = len([r for r in compile_results if r.get("stale", False)])
+    print(
+        "%d compiled, %d unchanged, %d stale, %d failed in %.2fs" %
+        (num_compiled, num_skipped, num_stale, num_failed, time.time() - start))
+    return 1 if num_failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
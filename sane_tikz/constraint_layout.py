@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# declarative layout. instead of calling place_*, distribute_*, and align_* in
+# order, state the relations between elements and solve them all at once:
+#
+# r_lst = [
+#     cl.above(b, a, 0.2),
+#     cl.aligned_centers_horizontally([a, b]),
+#     cl.aligned_bottoms([b, c]),
+#     cl.to_the_right_at_least(c, b, 0.5),
+# ]
+# cl.layout(r_lst)  # translates each element (at most) once.
+#
+# every relation is of the form pos(e) - pos(e_ref) = delta (exact),
+# >= delta (at least), or <= delta (at most), where pos is a side or the center of
+# the bbox along one axis. the bboxes are computed once. exact relations are
+# solved with a union-find over the elements (with the offset to the root of
+# each set). the remaining relations are difference constraints between these
+# sets, solved by propagating lower bounds in topological order (the least
+# solution, i.e., elements only move as much as needed). the axes are solved
+# independently. in each connected set of elements, the first reference
+# element in the relations does not move (or the origin, if fixed is used).
+
+import sane_tikz.core as stz
+
+# NOTE: side names for each axis (0 for x, 1 for y).
+axis_to_sides = [["left", "center", "right"], ["bottom", "center", "top"]]
+
+# NOTE: the origin is a pseudo-element that never moves (see fixed).
+origin = {"type": "layout_origin"}
+
+
+def relation(kind, axis, e, side, e_ref, side_ref, delta):
+    assert kind in ["exact", "at_least", "at_most"]
+    assert side in axis_to_sides[axis] and side_ref in axis_to_sides[axis]
+    return {
+        "kind": kind,
+        "axis": axis,
+        "e": e,
+        "side": side,
+        "e_ref": e_ref,
+        "side_ref": side_ref,
+        "delta": delta
+    }
+
+
+#### exact relations (same semantics as place_* and distribute_* in core)
+def above(e, e_ref, spacing):
+    return relation("exact", 1, e, "bottom", e_ref, "top", spacing)
+
+
+def below(e, e_ref, spacing):
+    return relation("exact", 1, e, "top", e_ref, "bottom", -spacing)
+
+
+def to_the_left(e, e_ref, spacing):
+    return relation("exact", 0, e, "right", e_ref, "left", -spacing)
+
+
+def to_the_right(e, e_ref, spacing):
+    return relation("exact", 0, e, "left", e_ref, "right", spacing)
+
+
+# NOTE: e does not move w.r.t. where it is now.
+def fixed(e):
+    return [
+        relation("exact", axis, e, "center", origin, "center",
+                 stz.center_coords(e)[axis]) for axis in [0, 1]
+    ]
+
+
+# left to right
+def distributed_horizontally(e_lst, spacing):
+    return [
+        to_the_right(e_lst[i], e_lst[i - 1], spacing)
+        for i in range(1, len(e_lst))
+    ]
+
+
+# bottom to top
+def distributed_vertically(e_lst, spacing):
+    return [
+        above(e_lst[i], e_lst[i - 1], spacing) for i in range(1, len(e_lst))
+    ]
+
+
+def aligned_with_sides(e_lst, axis, side):
+    return [
+        relation("exact", axis, e, side, e_lst[0], side, 0.0) for e in e_lst[1:]
+    ]
+
+
+def aligned_centers_horizontally(e_lst):
+    return aligned_with_sides(e_lst, 0, "center")
+
+
+def aligned_centers_vertically(e_lst):
+    return aligned_with_sides(e_lst, 1, "center")
+
+
+def aligned_lefts(e_lst):
+    return aligned_with_sides(e_lst, 0, "left")
+
+
+def aligned_rights(e_lst):
+    return aligned_with_sides(e_lst, 0, "right")
+
+
+def aligned_tops(e_lst):
+    return aligned_with_sides(e_lst, 1, "top")
+
+
+def aligned_bottoms(e_lst):
+    return aligned_with_sides(e_lst, 1, "bottom")
+
+
+#### minimum spacing relations (the elements may end up further apart)
+def above_at_least(e, e_ref, spacing):
+    return relation("at_least", 1, e, "bottom", e_ref, "top", spacing)
+
+
+def below_at_least(e, e_ref, spacing):
+    return relation("at_most", 1, e, "top", e_ref, "bottom", -spacing)
+
+
+def to_the_left_at_least(e, e_ref, spacing):
+    return relation("at_most", 0, e, "right", e_ref, "left", -spacing)
+
+
+def to_the_right_at_least(e, e_ref, spacing):
+    return relation("at_least", 0, e, "left", e_ref, "right", spacing)
+
+
+#### solver
+def iter_relations(r):
+    if isinstance(r, list):
+        for r_i in r:
+            for r_j in iter_relations(r_i):
+                yield r_j
+    else:
+        yield r
+
+
+def side_value(b, axis, side):
+    (x1, y1), (x2, y2) = b
+    if axis == 0:
+        lo, hi = x1, x2
+    else:
+        lo, hi = y2, y1
+    if side == "center":
+        return (lo + hi) / 2.0
+    elif side == axis_to_sides[axis][0]:
+        return lo
+    else:
+        return hi
+
+
+# NOTE: weighted union-find. offsets[i] is t[i] - t[parents[i]], where t are
+# the translations (0 for roots). the root of a set is its element with the
+# smallest index.
+def find_root(parents, offsets, i):
+    path = []
+    while parents[i] != i:
+        path.append(i)
+        i = parents[i]
+    # path compression (from the node closest to the root).
+    acc = 0.0
+    for j in reversed(path):
+        acc += offsets[j]
+        offsets[j] = acc
+        parents[j] = i
+    return i
+
+
+def union_with_offset(parents, offsets, a, b, c, tol):
+    # t[a] - t[b] = c.
+    ra = find_root(parents, offsets, a)
+    rb = find_root(parents, offsets, b)
+    # t[ra] - t[rb] = c - offsets[a] + offsets[b].
+    d = c - offsets[a] + offsets[b]
+    if ra == rb:
+        if abs(d) > tol:
+            raise ValueError(
+                "inconsistent exact layout relations (off by %g)." % d)
+    elif ra < rb:
+        parents[rb] = ra
+        offsets[rb] = -d
+    else:
+        parents[ra] = rb
+        offsets[ra] = d
+
+
+# NOTE: least t >= 0 with t[a] - t[b] >= c for each (a, b, c). the edges are
+# relaxed in topological order (a single pass if there are no cycles). a cycle
+# with positive total makes the relations infeasible.
+def solve_difference_constraints(num_nodes, edges, tol):
+    out_edges = [[] for _ in range(num_nodes)]
+    in_degree = [0] * num_nodes
+    for (a, b, c) in edges:
+        out_edges[b].append((a, c))
+        in_degree[a] += 1
+    order = [i for i in range(num_nodes) if in_degree[i] == 0]
+    k = 0
+    while k < len(order):
+        for (a, _) in out_edges[order[k]]:
+            in_degree[a] -= 1
+            if in_degree[a] == 0:
+                order.append(a)
+        k += 1
+    in_order = [False] * num_nodes
+    for i in order:
+        in_order[i] = True
+    order.extend([i for i in range(num_nodes) if not in_order[i]])
+
+    t = [0.0] * num_nodes
+    for _ in range(num_nodes + 1):
+        changed = False
+        for b in order:
+            t_b = t[b]
+            for (a, c) in out_edges[b]:
+                if t_b + c > t[a] + tol:
+                    t[a] = t_b + c
+                    changed = True
+        if not changed:
+            return t
+    raise ValueError("infeasible layout relations (cycle of minimum spacings).")
+
+
+def solve_axis(num_nodes, r_lst, id_to_idx, bboxes, axis, tol):
+    parents = list(range(num_nodes))
+    offsets = [0.0] * num_nodes
+    inequalities = []
+    for r in r_lst:
+        if r["axis"] != axis:
+            continue
+        a = id_to_idx[id(r["e"])]
+        b = id_to_idx[id(r["e_ref"])]
+        c = (r["delta"] - side_value(bboxes[a], axis, r["side"]) +
+             side_value(bboxes[b], axis, r["side_ref"]))
+        if r["kind"] == "exact":
+            union_with_offset(parents, offsets, a, b, c, tol)
+        elif r["kind"] == "at_least":
+            inequalities.append((a, b, c))
+        else:
+            inequalities.append((b, a, -c))
+
+    roots = [find_root(parents, offsets, i) for i in range(num_nodes)]
+    root_lst = sorted(set(roots))
+    root_to_k = {r: k for k, r in enumerate(root_lst)}
+    edges = []
+    for (a, b, c) in inequalities:
+        ka = root_to_k[roots[a]]
+        kb = root_to_k[roots[b]]
+        c = c - offsets[a] + offsets[b]
+        if ka == kb:
+            if c > tol:
+                raise ValueError(
+                    "at_least layout relation conflicts with exact ones.")
+        else:
+            edges.append((ka, kb, c))
+    t = solve_difference_constraints(len(root_lst), edges, tol)
+
+    # in each connected set of roots, the first one stays where it is.
+    comp = list(range(len(root_lst)))
+    comp_offsets = [0.0] * len(root_lst)
+    for (a, b, _) in edges:
+        ra = find_root(comp, comp_offsets, a)
+        rb = find_root(comp, comp_offsets, b)
+        if ra != rb:
+            comp[max(ra, rb)] = min(ra, rb)
+    t = [
+        t[k] - t[find_root(comp, comp_offsets, k)] for k in range(len(root_lst))
+    ]
+    return [t[root_to_k[roots[i]]] + offsets[i] for i in range(num_nodes)]
+
+
+# NOTE: returns the elements and their translations [delta_x, delta_y] without
+# moving them. the elements must not contain one another.
+def solve_layout(r_lst, tol=1.0e-9):
+    r_lst = list(iter_relations(r_lst))
+    e_lst = [origin]
+    id_to_idx = {id(origin): 0}
+    for r in r_lst:
+        for e in [r["e_ref"], r["e"]]:
+            if id(e) not in id_to_idx:
+                id_to_idx[id(e)] = len(e_lst)
+                e_lst.append(e)
+    bboxes = [[[0.0, 0.0], [0.0, 0.0]]] + [stz.bbox(e) for e in e_lst[1:]]
+    tx = solve_axis(len(e_lst), r_lst, id_to_idx, bboxes, 0, tol)
+    ty = solve_axis(len(e_lst), r_lst, id_to_idx, bboxes, 1, tol)
+    return e_lst[1:], [[tx[i], ty[i]] for i in range(1, len(e_lst))]
+
+
+def layout(r_lst, tol=1.0e-9):
+    e_lst, deltas_lst = solve_layout(r_lst, tol)
+    for e, (delta_x, delta_y) in zip(e_lst, deltas_lst):
+        if delta_x != 0.0 or delta_y != 0.0:
+            stz.translate(e, delta_x, delta_y)
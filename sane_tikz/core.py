@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import math
+import os
+import hashlib
 from copy import deepcopy
+import numpy as np
 # from pprint import pprint
 
 #### overview
 # - all angles in degrees unless stated otherwise.
 # - all dimensions in cm (even for line width).
 # cs = [x, y], vec = [start_cs, end_cs]
+# cs_lst = [cs1, cs2, ...] or, for large paths, a (n, 2) float64 numpy array.
 
 # nice constants:
 golden_ratio = 1.61803398875
@@ -38,11 +42,12 @@ def normalize_angle_to_standard_interval(angle):
 
 
 def rgb_to_hex(color_in_rgb):
-    raise NotImplementedError
+    return "#%02x%02x%02x" % tuple([int(x) for x in color_in_rgb])
 
 
 def hex_to_rgb(color_in_hex):
-    raise NotImplementedError
+    s = color_in_hex.lstrip("#")
+    return tuple([int(s[i:i + 2], 16) for i in range(0, 6, 2)])
 
 
 #### for coordinates and vectors
@@ -256,57 +261,81 @@ def rotate_coords(cs, axis_cs, angle):
     return [x_out, y_out]
 
 
+#### for lists of coordinates (python lists or (n, 2) numpy arrays)
+def coords_lst_to_array(cs_lst):
+    return np.asarray(cs_lst, dtype=np.float64).reshape(-1, 2)
+
+
+def translate_coords_lst(cs_lst, delta_x, delta_y):
+    if isinstance(cs_lst, np.ndarray):
+        return cs_lst + np.array([delta_x, delta_y], dtype=np.float64)
+    else:
+        return [translate_coords(cs, delta_x, delta_y) for cs in cs_lst]
+
+
+def scale_coords_lst(cs_lst, alpha):
+    if isinstance(cs_lst, np.ndarray):
+        return alpha * cs_lst
+    else:
+        return [scale_coords(cs, alpha) for cs in cs_lst]
+
+
+def rotate_coords_lst(cs_lst, axis_cs, angle):
+    if isinstance(cs_lst, np.ndarray):
+        angle_in_rads = math.pi / 180.0 * angle
+        c = math.cos(angle_in_rads)
+        s = math.sin(angle_in_rads)
+        axis = np.array(axis_cs, dtype=np.float64)
+        m = np.array([[c, s], [-s, c]])
+        return axis + (cs_lst - axis).dot(m)
+    else:
+        return [rotate_coords(cs, axis_cs, angle) for cs in cs_lst]
+
+
+# NOTE: for iterating over the coordinates efficiently (e.g., when drawing).
+def coords_lst_to_tuples(cs_lst):
+    if isinstance(cs_lst, np.ndarray):
+        return cs_lst.tolist()
+    else:
+        return cs_lst
+
+
+def bbox_from_coords_lst(cs_lst):
+    if isinstance(cs_lst, np.ndarray):
+        min_x, min_y = cs_lst.min(axis=0).tolist()
+        max_x, max_y = cs_lst.max(axis=0).tolist()
+    else:
+        xs = [cs[0] for cs in cs_lst]
+        ys = [cs[1] for cs in cs_lst]
+        min_x, min_y, max_x, max_y = min(xs), min(ys), max(xs), max(ys)
+    return [[min_x, max_y], [max_x, min_y]]
+
+
 #### for composite elements
 def bbox(e):
     if isinstance(e, list):
         assert len(e) > 0
-        bboxes = [bbox(e_i) for e_i in e]
-        # [[[top_x1, top_y1], [bottom_x1, bottom_y1]], ...]
-        top_left_xs = [b[0][0] for b in bboxes]
-        top_left_ys = [b[0][1] for b in bboxes]
-        bottom_right_xs = [b[1][0] for b in bboxes]
-        bottom_right_ys = [b[1][1] for b in bboxes]
-        b_out = [[min(top_left_xs), max(top_left_ys)],
-                 [max(bottom_right_xs),
-                  min(bottom_right_ys)]]
-
-    elif e["type"] == 'open_path' or e["type"] == "closed_path":
-        xs = [cs[0] for cs in e["cs_lst"]]
-        ys = [cs[1] for cs in e["cs_lst"]]
-        b_out = [[min(xs), max(ys)], [max(xs), min(ys)]]
-
-    # NOTE: this is not quite correct for circular arcs, but it is a convenient approximation.
-    elif e["type"] == "circle" or e["type"] == "circular_arc":
-        r = e["radius"]
-        cs = e["center_cs"]
-        return [[cs[0] - r, cs[1] + r], [cs[0] + r, cs[1] - r]]
-
-    elif e["type"] == 'ellipse':
-        rx = e["horizontal_radius"]
-        ry = e["vertical_radius"]
-        cs = e["center_cs"]
-        return [[cs[0] - rx, cs[1] + ry], [cs[0] + rx, cs[1] - ry]]
-
-    ### TODO: this is wrong, but simple for now.
-    elif e["type"] == 'bezier':
-        return (top_left_coords(e["from_cs"], e["to_cs"]),
-                bottom_right_coords(e["from_cs"], e["to_cs"]))
-
-    # NOTE: does not influence the bounding box (for simplicity)
-    # TODO: optionally, make it part of text_width explicitly.
-    elif e["type"] == "latex":
-        return [e["cs"], e["cs"]]
-
-    elif e["type"] == "image":
-        return [
-            e["top_left_cs"],
-            translate_coords(e["top_left_cs"], e["width"], -e["height"])
-        ]
-
+        return bbox_union([bbox(e_i) for e_i in e])
     else:
-        raise ValueError("bbox not implemented for element: %s." % e["type"])
+        return element_type_fn(e, "bbox")(e)
+
 
-    return b_out
+def bbox_union(bboxes):
+    # [[[top_x1, top_y1], [bottom_x1, bottom_y1]], ...]
+    top_left_xs = [b[0][0] for b in bboxes]
+    top_left_ys = [b[0][1] for b in bboxes]
+    bottom_right_xs = [b[1][0] for b in bboxes]
+    bottom_right_ys = [b[1][1] for b in bboxes]
+    return [[min(top_left_xs), max(top_left_ys)],
+            [max(bottom_right_xs), min(bottom_right_ys)]]
+
+
+# NOTE: touching bboxes overlap (degenerate bboxes, e.g., of latex, can overlap).
+def do_bboxes_overlap(bbox, other_bbox):
+    (x1, y1), (x2, y2) = bbox
+    (other_x1, other_y1), (other_x2, other_y2) = other_bbox
+    return (x1 <= other_x2 and other_x1 <= x2 and y2 <= other_y1 and
+            other_y2 <= y1)
 
 
 def center_coords(e):
@@ -318,85 +347,118 @@ def coords_from_bbox_with_fn(e, fn):
 
 
 def translate(e, delta_x, delta_y):
-    if isinstance(e, list):
-        assert len(e) > 0
-        for e_i in e:
-            translate(e_i, delta_x, delta_y)
+    transform(e, translation_affine_matrix(delta_x, delta_y))
+
+
+# NOTE: this will move the center of the element. translate to get the appropriate
+# center.
+def scale(e, alpha):
+    transform(e, scaling_affine_matrix(alpha, alpha))
 
-    elif e["type"] == 'open_path':
-        e["cs_lst"] = [
-            translate_coords(cs, delta_x, delta_y) for cs in e["cs_lst"]
-        ]
 
-    elif e["type"] == 'closed_path':
-        e["cs_lst"] = [
-            translate_coords(cs, delta_x, delta_y) for cs in e["cs_lst"]
-        ]
+def scale_coords(cs, alpha):
+    return [alpha * x for x in cs]
 
-    elif e["type"] == "circle":
-        e["center_cs"] = translate_coords(e["center_cs"], delta_x, delta_y)
 
-    elif e["type"] == 'ellipse':
-        e["center_cs"] = translate_coords(e["center_cs"], delta_x, delta_y)
+# NOTE: rotates the element around axis_cs. text keeps its orientation (only
+# its position changes).
+def rotate(e, axis_cs, angle):
+    transform(e, rotation_affine_matrix(axis_cs, angle))
 
-    elif e["type"] == 'bezier':
-        e["from_cs"] = translate_coords(e["from_cs"], delta_x, delta_y)
-        e["to_cs"] = translate_coords(e["to_cs"], delta_x, delta_y)
-        e["c1_cs"] = translate_coords(e["c1_cs"], delta_x, delta_y)
-        e["c2_cs"] = translate_coords(e["c2_cs"], delta_x, delta_y)
 
-    elif e["type"] == "latex":
-        e["cs"] = translate_coords(e["cs"], delta_x, delta_y)
+# NOTE: mirrors the element around the vertical line x = axis_x.
+def reflect_horizontally(e, axis_x):
+    transform(e, [[-1.0, 0.0, 2.0 * axis_x], [0.0, 1.0, 0.0]])
 
-    elif e["type"] == "image":
-        e["top_left_cs"] = translate_coords(e["top_left_cs"], delta_x, delta_y)
-    else:
-        raise ValueError("tranlate not implemented for element: %s." %
-                         e["type"])
 
+# NOTE: mirrors the element around the horizontal line y = axis_y.
+def reflect_vertically(e, axis_y):
+    transform(e, [[1.0, 0.0, 0.0], [0.0, -1.0, 2.0 * axis_y]])
 
-# NOTE: this will move the center of the element. translate to get the appropriate
-# center.
-# TODO: test this function.
-def scale(e, alpha):
+
+#### affine transforms
+# NOTE: applies the affine matrix m (see transform_group) to the element in
+# place with a single traversal of the subtree. each element is transformed by
+# the function of its type. groups keep their cached bbox if m does not rotate
+# or shear. transform groups and symbol instances only update their matrix.
+def transform(e, m):
     if isinstance(e, list):
-        assert len(e) > 0
         for e_i in e:
-            scale(e_i, alpha)
+            transform(e_i, m)
+    else:
+        fns = type_to_fns.get(e["type"])
+        if fns is not None and fns["transform"] is not None:
+            fns["transform"](e, m)
+        else:
+            transform_with_translate_scale_rotate_fns(e, m)
+        mark_parent_caches_dirty(e)
+
+
+# NOTE: for element types registered with translate, scale, and rotate
+# functions only (m must be a rotation and scaling followed by a translation).
+def transform_with_translate_scale_rotate_fns(e, m):
+    if not is_rotation_scaling_matrix(m):
+        raise ValueError("transform not implemented for element: %s." %
+                         e["type"])
+    deltas, angle, alpha = affine_matrix_to_translation_rotation_scaling(m)
+    if abs(angle) > 1.0e-12:
+        element_type_fn(e, "rotate")(e, [0.0, 0.0], angle)
+    if alpha != 1.0:
+        element_type_fn(e, "scale")(e, alpha)
+    if deltas[0] != 0.0 or deltas[1] != 0.0:
+        element_type_fn(e, "translate")(e, deltas[0], deltas[1])
+
+
+# NOTE: same arithmetic (in the same order) as affine_transform_coords.
+def affine_transform_coords_lst(cs_lst, m):
+    (a, b, tx), (c, d, ty) = m
+    if isinstance(cs_lst, np.ndarray):
+        x = cs_lst[:, 0]
+        y = cs_lst[:, 1]
+        return np.stack([a * x + b * y + tx, c * x + d * y + ty], axis=1)
+    # NOTE: translations are by far the most common case.
+    elif a == 1.0 and b == 0.0 and c == 0.0 and d == 1.0:
+        return [[cs[0] + tx, cs[1] + ty] for cs in cs_lst]
+    else:
+        return [[a * cs[0] + b * cs[1] + tx, c * cs[0] + d * cs[1] + ty]
+                for cs in cs_lst]
 
-    elif e["type"] == 'open_path':
-        e["cs_lst"] = [scale_coords(cs, alpha) for cs in e["cs_lst"]]
 
-    elif e["type"] == 'closed_path':
-        e["cs_lst"] = [scale_coords(cs, alpha) for cs in e["cs_lst"]]
+def is_axis_aligned_matrix(m):
+    return m[0][1] == 0.0 and m[1][0] == 0.0
 
-    elif e["type"] == "circle":
-        e["center_cs"] = scale_coords(e["center_cs"], alpha)
-        e["radius"] *= alpha
 
-    elif e["type"] == 'ellipse':
-        e["center_cs"] = scale_coords(e["center_cs"], alpha)
-        e["horizontal_radius"] *= alpha
+# NOTE: whether m is a rotation and uniform scaling (no reflection or shear)
+# followed by a translation.
+def is_rotation_scaling_matrix(m):
+    tol = 1.0e-12 * max(1.0, abs(m[0][0]) + abs(m[1][0]))
+    return (abs(m[0][0] - m[1][1]) <= tol and abs(m[0][1] + m[1][0]) <= tol and
+            m[0][0]**2 + m[1][0]**2 > 0.0)
 
-    elif e["type"] == 'bezier':
-        e["from_cs"] = scale_coords(e["from_cs"], alpha)
-        e["to_cs"] = scale_coords(e["to_cs"], alpha)
-        e["c1_cs"] = scale_coords(e["c1_cs"], alpha)
-        e["c2_cs"] = scale_coords(e["c2_cs"], alpha)
 
-    elif e["type"] == "latex":
-        e["cs"] = scale_coords(e["cs"], alpha)
+# NOTE: whether m preserves angles (possibly with a reflection).
+def is_similarity_matrix(m):
+    tol = 1.0e-12 * max(1.0, abs(m[0][0]) + abs(m[1][0]))
+    a, b, c, d = m[0][0], m[0][1], m[1][0], m[1][1]
+    return (a**2 + c**2 > 0.0 and abs(a * b + c * d) <= tol and
+            abs(a**2 + c**2 - b**2 - d**2) <= tol)
 
-    elif e["type"] == "image":
-        e["top_left_cs"] = scale_coords(e["top_left_cs"], alpha)
-        e["width"] *= alpha
-        e["height"] *= alpha
-    else:
-        raise ValueError("scale not implemented for element: %s." % e["type"])
 
+def affine_matrix_determinant(m):
+    return m[0][0] * m[1][1] - m[0][1] * m[1][0]
 
-def scale_coords(cs, alpha):
-    return [alpha * x for x in cs]
+
+# NOTE: radii of the image of an axis aligned ellipse under m if the image is
+# also axis aligned (None otherwise).
+def transformed_ellipse_radii(horizontal_radius, vertical_radius, m):
+    rx2 = horizontal_radius**2
+    ry2 = vertical_radius**2
+    s00 = m[0][0]**2 * rx2 + m[0][1]**2 * ry2
+    s11 = m[1][0]**2 * rx2 + m[1][1]**2 * ry2
+    s01 = m[0][0] * m[1][0] * rx2 + m[0][1] * m[1][1] * ry2
+    if abs(s01) > 1.0e-12 * max(1.0, s00, s11):
+        return None
+    return math.sqrt(s00), math.sqrt(s11)
 
 
 def translate_horizontally(e, delta):
@@ -660,10 +722,251 @@ def align_bottoms(e_lst, y):
         translate_vertically(e, y - bottom_right_cs[1])
 
 
+# NOTE: copies share their coordinates (and numpy arrays) with the original.
+# this is safe because the functions in this library never modify coordinates
+# in place (they always replace them). only the elements (dicts) and the lists
+# that group them are copied. use deep_copy if coordinates will be modified in
+# place.
 def copy(e):
+    if isinstance(e, list):
+        return [copy(e_i) for e_i in e]
+    else:
+        e_out = dict(e)
+        # NOTE: the copy is not in the groups of the original.
+        e_out.pop("parent_caches", None)
+        if "e_lst" in e:
+            e_out["e_lst"] = copy(e["e_lst"])
+        if "bbox_cache" in e:
+            e_out["bbox_cache"] = bbox_cache(e["bbox_cache"]["bbox"])
+            add_parent_cache(e_out["e_lst"], e_out["bbox_cache"])
+        return e_out
+
+
+def deep_copy(e):
     return deepcopy(e)
 
 
+#### groups with cached bounding boxes (opt-in; useful for large figures)
+# NOTE: a group behaves like a list of elements, but it remembers its bbox.
+# translate keeps the cached bbox up to date; scale marks it dirty. transforming
+# an element of a group (e.g., with translate or place_*) marks the caches of
+# the groups that contain it dirty. if the elements of a group are changed
+# directly (e.g., by assigning coordinates or appending to e_lst), call
+# invalidate_bbox on the group.
+def group(e_lst):
+    assert len(e_lst) > 0
+    g = {"type": "group", "e_lst": e_lst, "bbox_cache": bbox_cache()}
+    add_parent_cache(e_lst, g["bbox_cache"])
+    return g
+
+
+# NOTE: the cached bbox of a group (or transform group) and the caches of the
+# groups that contain it. elements keep the caches of the groups that contain
+# them (rather than the groups) so that copying an element does not copy its
+# groups.
+def bbox_cache(bbox=None):
+    return {"bbox": bbox, "parent_caches": []}
+
+
+def add_parent_cache(e, cache):
+    if isinstance(e, list):
+        for e_i in e:
+            add_parent_cache(e_i, cache)
+    elif isinstance(e, dict):
+        if "bbox_cache" in e:
+            e["bbox_cache"]["parent_caches"].append(cache)
+        else:
+            e.setdefault("parent_caches", []).append(cache)
+
+
+# NOTE: if a cache is dirty, the caches of the groups that contain it are also
+# dirty (a cached bbox is only computed from clean caches).
+def mark_bbox_cache_dirty(cache):
+    if cache["bbox"] is not None:
+        cache["bbox"] = None
+        for c in cache["parent_caches"]:
+            mark_bbox_cache_dirty(c)
+
+
+def mark_parent_caches_dirty(e):
+    if "bbox_cache" in e:
+        parent_caches = e["bbox_cache"]["parent_caches"]
+    else:
+        parent_caches = e.get("parent_caches", [])
+    for c in parent_caches:
+        mark_bbox_cache_dirty(c)
+
+
+def group_append(g, e):
+    g["e_lst"].append(e)
+    add_parent_cache(e, g["bbox_cache"])
+    if g["bbox_cache"]["bbox"] is not None:
+        g["bbox_cache"]["bbox"] = bbox_union([g["bbox_cache"]["bbox"], bbox(e)])
+    mark_parent_caches_dirty(g)
+
+
+def group_extend(g, e_lst):
+    for e in e_lst:
+        group_append(g, e)
+
+
+def invalidate_bbox(e):
+    if isinstance(e, list):
+        for e_i in e:
+            invalidate_bbox(e_i)
+        return
+    elif e["type"] == "group" or e["type"] == "transform_group":
+        e["bbox_cache"]["bbox"] = None
+        invalidate_bbox(e["e_lst"])
+    elif e["type"] == "symbol_instance":
+        e["symbol"]["bbox"] = None
+        invalidate_bbox(e["symbol"]["e_lst"])
+    mark_parent_caches_dirty(e)
+
+
+#### lazy transforms (opt-in; useful for placing large elements many times)
+# NOTE: a transform group keeps its elements untouched and accumulates
+# the transforms applied to it (e.g., translate, scale, and rotate) into an affine matrix
+# [[m00, m01, tx], [m10, m11, ty]], i.e., x' = m00 * x + m01 * y + tx and
+# y' = m10 * x + m11 * y + ty. these operations are O(1). the matrix is only
+# applied when computing the bbox or drawing. if emit_as_scope is True, it is
+# drawn as a tikz scope (the elements are written once in local coordinates).
+def transform_group(e_lst, emit_as_scope=True):
+    assert len(e_lst) > 0
+    e = {
+        "type": "transform_group",
+        "e_lst": e_lst,
+        "matrix": identity_affine_matrix(),
+        "bbox_cache": bbox_cache(),
+        "emit_as_scope": emit_as_scope
+    }
+    add_parent_cache(e_lst, e["bbox_cache"])
+    return e
+
+
+def identity_affine_matrix():
+    return [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+
+
+def translation_affine_matrix(delta_x, delta_y):
+    return [[1.0, 0.0, delta_x], [0.0, 1.0, delta_y]]
+
+
+def scaling_affine_matrix(alpha_x, alpha_y):
+    return [[alpha_x, 0.0, 0.0], [0.0, alpha_y, 0.0]]
+
+
+def rotation_affine_matrix(axis_cs, angle):
+    angle_in_rads = math.pi / 180.0 * angle
+    c = math.cos(angle_in_rads)
+    s = math.sin(angle_in_rads)
+    x_axis, y_axis = axis_cs
+    return [[c, -s, x_axis - c * x_axis + s * y_axis],
+            [s, c, y_axis - s * x_axis - c * y_axis]]
+
+
+# NOTE: returns the matrix that applies m_first and then m_second.
+def compose_affine_matrices(m_second, m_first):
+    a, b = m_second, m_first
+    m_out = []
+    for i in range(2):
+        row = [a[i][0] * b[0][j] + a[i][1] * b[1][j] for j in range(3)]
+        row[2] += a[i][2]
+        m_out.append(row)
+    return m_out
+
+
+def affine_transform_coords(cs, m):
+    x, y = cs[0], cs[1]
+    return [
+        m[0][0] * x + m[0][1] * y + m[0][2], m[1][0] * x + m[1][1] * y + m[1][2]
+    ]
+
+
+# NOTE: only for matrices that are a translation of a rotation of a uniform
+# scaling (see is_rotation_scaling_matrix); transform groups are emitted with
+# a general tikz transformation (cm) otherwise.
+def affine_matrix_to_translation_rotation_scaling(m):
+    alpha = math.sqrt(m[0][0]**2 + m[1][0]**2)
+    angle = radians_to_degrees(math.atan2(m[1][0], m[0][0]))
+    return [m[0][2], m[1][2]], angle, alpha
+
+
+# NOTE: returns a transformed copy of the elements.
+def apply_affine_matrix(e_lst, m):
+    e_out = copy(e_lst)
+    transform(e_out, m)
+    return e_out
+
+
+def apply_transform_group(e):
+    return apply_affine_matrix(e["e_lst"], e["matrix"])
+
+
+#### symbols (opt-in; for drawings that are repeated many times)
+# NOTE: a symbol is defined once and drawn through its instances. if
+# emit_as_pic is True, the symbol is written once as a tikz pic and each
+# instance is a single \pic command, so the size of the tex file depends on
+# the number of symbols rather than on the number of instances. the name must
+# be unique among the symbols of the figure and valid as a tikz key. instances
+# start at the coordinates of the symbol and can be placed (and rotated and
+# scaled) as any other element.
+def symbol(name, e_lst, emit_as_pic=True):
+    assert len(e_lst) > 0
+    assert not any(ch in name for ch in "{}[]/\\,=%#")
+    return {
+        "type": "symbol",
+        "name": name,
+        "e_lst": e_lst,
+        "bbox": None,
+        "emit_as_pic": emit_as_pic
+    }
+
+
+def symbol_instance(sym):
+    return {
+        "type": "symbol_instance",
+        "symbol": sym,
+        "matrix": identity_affine_matrix()
+    }
+
+
+# NOTE: yields the elements that are not composed of other elements. groups
+# and lists are unpacked; transform groups and symbol instances are leaves as
+# their bboxes are cheap to compute.
+def iter_leaf_elements(e):
+    if isinstance(e, list):
+        for e_i in e:
+            for e_j in iter_leaf_elements(e_i):
+                yield e_j
+    elif e["type"] == "group":
+        for e_j in iter_leaf_elements(e["e_lst"]):
+            yield e_j
+    else:
+        yield e
+
+
+# NOTE: returns the symbols drawn by the element (nested symbols first). symbols
+# are identified by name.
+def collect_symbols(e, symbols=None, names=None):
+    if symbols is None:
+        symbols = []
+        names = set()
+
+    if isinstance(e, list):
+        for e_i in e:
+            collect_symbols(e_i, symbols, names)
+    elif e["type"] == "group" or e["type"] == "transform_group":
+        collect_symbols(e["e_lst"], symbols, names)
+    elif e["type"] == "symbol_instance":
+        sym = e["symbol"]
+        if sym["name"] not in names:
+            names.add(sym["name"])
+            collect_symbols(sym["e_lst"], symbols, names)
+            symbols.append(sym)
+    return symbols
+
+
 #### these are some of the graphical primitives used for drawing.
 def line_segment(start_cs, end_cs, tikz_str=""):
     return open_path([start_cs, end_cs], tikz_str)
@@ -777,6 +1080,25 @@ def closed_path(cs_lst, tikz_str=""):
     return {"type": "closed_path", "cs_lst": cs_lst, "tikz_str": tikz_str}
 
 
+# NOTE: array-backed paths are much faster to transform for many vertices.
+def open_path_from_array(cs_arr, tikz_str=""):
+    return open_path(coords_lst_to_array(cs_arr), tikz_str)
+
+
+def closed_path_from_array(cs_arr, tikz_str=""):
+    return closed_path(coords_lst_to_array(cs_arr), tikz_str)
+
+
+def convert_paths_to_arrays(e):
+    if isinstance(e, list):
+        for e_i in e:
+            convert_paths_to_arrays(e_i)
+    elif e["type"] == "group" or e["type"] == "transform_group":
+        convert_paths_to_arrays(e["e_lst"])
+    elif e["type"] == 'open_path' or e["type"] == 'closed_path':
+        e["cs_lst"] = coords_lst_to_array(e["cs_lst"])
+
+
 def circle(center_cs, radius, tikz_str=""):
     return {
         "type": "circle",
@@ -1115,8 +1437,167 @@ def coords_on_right_edge(top_left_cs, bottom_right_cs, alpha):
 
 
 # t in [0, 1]. for symmetric curves, it should be 0.5 for the middle
+# NOTE: t can also be an array of values (returns a (n, 2) array of coords).
 def coords_on_bezier(from_cs, to_cs, c1_cs, c2_cs, t):
-    raise NotImplementedError
+    t_arr = np.asarray(t, dtype=np.float64).reshape(-1, 1)
+    p0, p1, p2, p3 = [
+        np.asarray(cs, dtype=np.float64).reshape(1, 2)
+        for cs in [from_cs, c1_cs, c2_cs, to_cs]
+    ]
+    u = 1.0 - t_arr
+    cs_arr = (u * u * u * p0 + 3.0 * u * u * t_arr * p1 +
+              3.0 * u * t_arr * t_arr * p2 + t_arr * t_arr * t_arr * p3)
+    if np.ndim(t) == 0:
+        return cs_arr[0].tolist()
+    else:
+        return cs_arr
+
+
+# NOTE: the arrays have shape (n, 2) (one row per curve). returns the bboxes as
+# a (n, 2, 2) array (top left and bottom right coords for each curve). the
+# extremes of each coordinate are at the endpoints or at the roots of the
+# derivative (a quadratic) in [0, 1].
+def bezier_bboxes_array(from_cs_arr, to_cs_arr, c1_cs_arr, c2_cs_arr):
+    p0, p1, p2, p3 = [
+        np.asarray(a, dtype=np.float64).reshape(-1, 2)
+        for a in [from_cs_arr, c1_cs_arr, c2_cs_arr, to_cs_arr]
+    ]
+    a = 3.0 * (-p0 + 3.0 * p1 - 3.0 * p2 + p3)
+    b = 6.0 * (p0 - 2.0 * p1 + p2)
+    c = 3.0 * (p1 - p0)
+    eps = 1.0e-12
+    is_quadratic = np.abs(a) > eps
+    disc = b * b - 4.0 * a * c
+    sqrt_disc = np.sqrt(np.maximum(disc, 0.0))
+    safe_a = np.where(is_quadratic, a, 1.0)
+    safe_b = np.where(np.abs(b) > eps, b, 1.0)
+    r1 = np.where(is_quadratic, (-b + sqrt_disc) / (2.0 * safe_a), -c / safe_b)
+    r2 = np.where(is_quadratic, (-b - sqrt_disc) / (2.0 * safe_a), -c / safe_b)
+    has_roots = np.where(is_quadratic, disc >= 0.0, np.abs(b) > eps)
+
+    # NOTE: candidates outside [0, 1] are replaced by an endpoint.
+    ts = np.stack([
+        np.zeros_like(a),
+        np.ones_like(a),
+        np.where(has_roots & (r1 >= 0.0) & (r1 <= 1.0), r1, 0.0),
+        np.where(has_roots & (r2 >= 0.0) & (r2 <= 1.0), r2, 0.0)
+    ])
+    u = 1.0 - ts
+    vals = (u * u * u * p0 + 3.0 * u * u * ts * p1 + 3.0 * u * ts * ts * p2 +
+            ts * ts * ts * p3)
+    lo = vals.min(axis=0)
+    hi = vals.max(axis=0)
+    top_left = np.stack([lo[:, 0], hi[:, 1]], axis=1)
+    bottom_right = np.stack([hi[:, 0], lo[:, 1]], axis=1)
+    return np.stack([top_left, bottom_right], axis=1)
+
+
+# NOTE: tikz draws the arc starting at start_cs (not centered at it) from
+# start_angle to end_angle (clockwise if end_angle < start_angle).
+def circular_arc_center_coords(start_cs, radius, start_angle):
+    a = start_angle * math.pi / 180.0
+    return [
+        start_cs[0] - radius * math.cos(a), start_cs[1] - radius * math.sin(a)
+    ]
+
+
+# NOTE: same as bezier_bboxes_array, but for circular arcs (start_cs_arr is
+# (n, 2); the others are (n,)). the extremes are at the endpoints or at the
+# multiples of 90 degrees between the start and end angles.
+def circular_arc_bboxes_array(start_cs_arr, radius_arr, start_angle_arr,
+                              end_angle_arr):
+    start_cs_arr = np.asarray(start_cs_arr, dtype=np.float64).reshape(-1, 2)
+    r = np.asarray(radius_arr, dtype=np.float64).reshape(-1)
+    a0 = np.asarray(start_angle_arr, dtype=np.float64).reshape(-1)
+    a1 = np.asarray(end_angle_arr, dtype=np.float64).reshape(-1)
+    lo_angle = np.minimum(a0, a1)
+    hi_angle = np.maximum(a0, a1)
+    rad0 = np.radians(a0)
+    cx = start_cs_arr[:, 0] - r * np.cos(rad0)
+    cy = start_cs_arr[:, 1] - r * np.sin(rad0)
+
+    def covers(k):
+        # whether some angle k * 90 + 360 * m is in [lo_angle, hi_angle].
+        first = k * 90.0 + 360.0 * np.ceil((lo_angle - k * 90.0) / 360.0)
+        return first <= hi_angle
+
+    xs = np.stack([r * np.cos(rad0), r * np.cos(np.radians(a1))])
+    ys = np.stack([r * np.sin(rad0), r * np.sin(np.radians(a1))])
+    x_hi = np.where(covers(0), r, xs.max(axis=0))
+    y_hi = np.where(covers(1), r, ys.max(axis=0))
+    x_lo = np.where(covers(2), -r, xs.min(axis=0))
+    y_lo = np.where(covers(3), -r, ys.min(axis=0))
+    top_left = np.stack([cx + x_lo, cy + y_hi], axis=1)
+    bottom_right = np.stack([cx + x_hi, cy + y_lo], axis=1)
+    return np.stack([top_left, bottom_right], axis=1)
+
+
+# NOTE: same as bezier_bboxes_array for a single curve (without numpy, which
+# is slow for a single row).
+def bezier_bbox(from_cs, to_cs, c1_cs, c2_cs):
+    eps = 1.0e-12
+    lo = []
+    hi = []
+    for i in range(2):
+        p0, p1, p2, p3 = from_cs[i], c1_cs[i], c2_cs[i], to_cs[i]
+        a = 3.0 * (-p0 + 3.0 * p1 - 3.0 * p2 + p3)
+        b = 6.0 * (p0 - 2.0 * p1 + p2)
+        c = 3.0 * (p1 - p0)
+        ts = [0.0, 1.0]
+        if abs(a) > eps:
+            disc = b * b - 4.0 * a * c
+            if disc >= 0.0:
+                sqrt_disc = math.sqrt(disc)
+                ts.extend([(-b + sqrt_disc) / (2.0 * a),
+                           (-b - sqrt_disc) / (2.0 * a)])
+        elif abs(b) > eps:
+            ts.append(-c / b)
+        vals = []
+        for t in ts:
+            if t >= 0.0 and t <= 1.0:
+                u = 1.0 - t
+                vals.append(u * u * u * p0 + 3.0 * u * u * t * p1 +
+                            3.0 * u * t * t * p2 + t * t * t * p3)
+        lo.append(min(vals))
+        hi.append(max(vals))
+    return [[lo[0], hi[1]], [hi[0], lo[1]]]
+
+
+# NOTE: same as circular_arc_bboxes_array for a single arc.
+def circular_arc_bbox(start_cs, radius, start_angle, end_angle):
+    lo_angle = min(start_angle, end_angle)
+    hi_angle = max(start_angle, end_angle)
+    rad0 = math.radians(start_angle)
+    rad1 = math.radians(end_angle)
+    cx = start_cs[0] - radius * math.cos(rad0)
+    cy = start_cs[1] - radius * math.sin(rad0)
+
+    def covers(k):
+        first = k * 90.0 + 360.0 * math.ceil((lo_angle - k * 90.0) / 360.0)
+        return first <= hi_angle
+
+    xs = [radius * math.cos(rad0), radius * math.cos(rad1)]
+    ys = [radius * math.sin(rad0), radius * math.sin(rad1)]
+    x_hi = radius if covers(0) else max(xs)
+    y_hi = radius if covers(1) else max(ys)
+    x_lo = -radius if covers(2) else min(xs)
+    y_lo = -radius if covers(3) else min(ys)
+    return [[cx + x_lo, cy + y_hi], [cx + x_hi, cy + y_lo]]
+
+
+# NOTE: bboxes for many bezier or circular arc elements at once.
+def bboxes_of_beziers(e_lst):
+    return bezier_bboxes_array([e["from_cs"] for e in e_lst],
+                               [e["to_cs"] for e in e_lst],
+                               [e["c1_cs"] for e in e_lst],
+                               [e["c2_cs"] for e in e_lst]).tolist()
+
+
+def bboxes_of_circular_arcs(e_lst):
+    return circular_arc_bboxes_array([e["center_cs"] for e in e_lst],
+                                     [e["radius"] for e in e_lst],
+                                     [e["start_angle"] for e in e_lst],
+                                     [e["end_angle"] for e in e_lst]).tolist()
 
 
 def coords_on_line_segment(start_cs, end_cs, t):
@@ -1219,79 +1700,561 @@ def canvas_value_to_axis_value(canvas_v, axis_v, other_canvas_v, other_axis_v,
     return m * queried_canvas_v + b
 
 
-def draw_to_tikz(e):
-    cmd_lst = []
-    if isinstance(e, list):
-        assert len(e) > 0
-        for e_i in e:
-            cmd_lst.extend(draw_to_tikz(e_i))
-
-    elif e["type"] == 'open_path':
-        cmd_lst.append(
-            "\\draw[%s] " % e["tikz_str"] +
-            " -- ".join(["(%f, %f)" % tuple(cs) for cs in e["cs_lst"]]) + ";")
-
-    elif e["type"] == 'closed_path':
-        # print e
-        cmd_lst.append(
-            "\\draw[%s] " % e["tikz_str"] +
-            " -- ".join(["(%f, %f)" % (cs[0], cs[1]) for cs in e["cs_lst"]]) +
-            " -- cycle;")
-
-    elif e["type"] == "circle":
-        cmd_lst.append(
-            "\\draw[%s] (%f, %f) circle (%f);" %
-            (e["tikz_str"], e["center_cs"][0], e["center_cs"][1], e["radius"]))
-
-    elif e["type"] == 'ellipse':
-        cmd_lst.append("\\draw[%s] (%f, %f) ellipse (%f and %f);" %
-                       (e["tikz_str"], e["center_cs"][0], e["center_cs"][1],
-                        e["horizontal_radius"], e["vertical_radius"]))
-
-    elif e["type"] == "bezier":
-        cmd_lst.append(
-            "\\draw[%s] (%f, %f) .. controls (%f, %f) and (%f, %f) .. (%f, %f);"
-            % tuple([e["tikz_str"]] + e["from_cs"] + e["c1_cs"] + e["c2_cs"] +
-                    e["to_cs"]))
-
-    elif e["type"] == "circular_arc":
-        cmd_lst.append("\\draw[%s] (%f,%f) arc (%f:%f:%f);" %
-                       (e["tikz_str"], e["center_cs"][0], e["center_cs"][1],
-                        e["start_angle"], e["end_angle"], e["radius"]))
-
-    elif e["type"] == "elliptical_arc":
-        cmd_lst.append("\\draw[%s] (%f,%f) arc (%f:%f:%f and %f);" %
-                       (e["tikz_str"], e["center_cs"][0], e["center_cs"][1],
-                        e["start_angle"], e["end_angle"],
-                        e["horizontal_radius"], e["vertical_radius"]))
-
-    elif e["type"] == "latex":
-        cmd_lst.append("\\node[%s] at (%f,%f) {%s};" %
-                       (e["tikz_str"], e["cs"][0], e["cs"][1], e["expr"]))
-
-    elif e["type"] == "image":
-        center_cs = translate_coords(e["top_left_cs"], e["width"] / 2.0,
-                                     -e["height"] / 2.0)
-        cmd_lst.append(
-            "\\node[inner sep=0pt, %s] at (%f,%f) {\\includegraphics[height=%f, width=%f]{%s}};"
-            % (e["tikz_str"], center_cs[0], center_cs[1], e["height"],
-               e["width"], e["filepath"]))
+#### number formatting for tikz output
+# NOTE: the mode determines how numbers are written to the tikz file:
+# - "fixed": always precision decimals (precision=6 is the same as %f).
+# - "stripped": precision decimals without trailing zeros (smaller files).
+# - "shortest": shortest decimal string that reads back as the same float.
+def fixed_number_to_str_fn(precision):
+    return ("%%.%df" % precision).__mod__
+
+
+def stripped_number_to_str_fn(precision):
+    num_fmt = "%%.%df" % precision
+
+    def fn(x):
+        s = num_fmt % x
+        if "." in s:
+            s = s.rstrip("0").rstrip(".")
+        if s == "-0":
+            s = "0"
+        return s
+
+    return fn
+
+
+def shortest_number_to_str(x):
+    s = repr(float(x))
+    # scientific notation is not parsed reliably by tikz.
+    if "e" in s:
+        s = np.format_float_positional(float(x), trim="-")
+    elif s.endswith(".0"):
+        s = s[:-2]
+    if s == "-0":
+        s = "0"
+    return s
+
+
+tikz_number_format = {}
+
+
+def set_tikz_number_format(mode="fixed", precision=6):
+    if mode == "fixed":
+        fn = fixed_number_to_str_fn(precision)
+        # used to format whole lists of coordinates at once.
+        num_fmt = "%%.%df" % precision
+    elif mode == "stripped":
+        fn = stripped_number_to_str_fn(precision)
+        num_fmt = None
+    elif mode == "shortest":
+        fn = shortest_number_to_str
+        num_fmt = None
+    else:
+        raise ValueError("unknown number format: %s." % mode)
+    tikz_number_format.update({
+        "mode": mode,
+        "precision": precision,
+        "fn": fn,
+        "num_fmt": num_fmt
+    })
+
+
+set_tikz_number_format()
+
+
+def coords_lst_to_tikz_str(cs_lst, joiner, sep=", "):
+    num_fmt = tikz_number_format["num_fmt"]
+    if num_fmt is not None:
+        # NOTE: formats all the numbers in a single string operation.
+        if isinstance(cs_lst, np.ndarray):
+            xs = tuple(cs_lst.ravel().tolist())
+        else:
+            xs = tuple([x for cs in cs_lst for x in cs[:2]])
+        cs_fmt = "(" + num_fmt + sep + num_fmt + ")"
+        return joiner.join([cs_fmt] * (len(xs) // 2)) % xs
+    else:
+        num = tikz_number_format["fn"]
+        return joiner.join([
+            "(%s%s%s)" % (num(cs[0]), sep, num(cs[1]))
+            for cs in coords_lst_to_tuples(cs_lst)
+        ])
+
+
+#### element types
+# NOTE: each element type maps to the functions that implement the operations
+# on it (tikz, bbox, and transform). operations that are not supported for a
+# type are None. new element types (i.e., dicts with a "type" key) can be added
+# with register_element_type. types without a transform function can give
+# translate, scale, and rotate functions instead (used for the transforms
+# that decompose into these).
+type_to_fns = {}
+
+
+def register_element_type(type_name,
+                          tikz_fn,
+                          bbox_fn,
+                          translate_fn=None,
+                          scale_fn=None,
+                          rotate_fn=None,
+                          transform_fn=None):
+    type_to_fns[type_name] = {
+        "tikz": tikz_fn,
+        "bbox": bbox_fn,
+        "translate": translate_fn,
+        "scale": scale_fn,
+        "rotate": rotate_fn,
+        "transform": transform_fn
+    }
+
+
+def element_type_fn(e, op_name):
+    fns = type_to_fns.get(e["type"])
+    if fns is None or fns[op_name] is None:
+        raise ValueError("%s not implemented for element: %s." %
+                         (op_name, e["type"]))
+    return fns[op_name]
+
+
+def tikz_command(e):
+    return element_type_fn(e, "tikz")(e)
+
+
+#===> group
+def tikz_group(e):
+    return "\n".join(iter_tikz(e["e_lst"]))
+
+
+# NOTE: the bbox of a group is cached and only recomputed when it is dirty.
+def bbox_group(e):
+    cache = e["bbox_cache"]
+    if cache["bbox"] is None:
+        cache["bbox"] = bbox(e["e_lst"])
+    top_left_cs, bottom_right_cs = cache["bbox"]
+    return [list(top_left_cs), list(bottom_right_cs)]
+
+
+# NOTE: the cached bbox is transformed along with the elements (stays clean)
+# if m does not rotate or shear.
+def affine_transform_group(e, m):
+    cache = e["bbox_cache"]
+    b = cache["bbox"]
+    # NOTE: transforming the elements marks the cache dirty.
+    transform(e["e_lst"], m)
+    if b is not None and is_axis_aligned_matrix(m):
+        cache["bbox"] = bbox_from_coords_lst(
+            [affine_transform_coords(cs, m) for cs in b])
+    else:
+        cache["bbox"] = None
+
+
+#===> transform_group
+def tikz_rotation_and_scaling_options(angle, alpha):
+    num = tikz_number_format["fn"]
+    opts = []
+    if abs(angle) > 1.0e-9:
+        opts.append("rotate=%s" % num(angle))
+    if abs(alpha - 1.0) > 1.0e-9:
+        opts.append("scale=%s" % num(alpha))
+    return opts
+
+
+# NOTE: tikz cm={a,b,c,d,(tx,ty)} maps (x, y) to (a x + c y + tx, b x + d y + ty).
+def tikz_cm_option(m):
+    num = tikz_number_format["fn"]
+    return "cm={%s,%s,%s,%s,(%s,%s)}" % (num(m[0][0]), num(m[1][0]), num(
+        m[0][1]), num(m[1][1]), num(m[0][2]), num(m[1][2]))
+
+
+def tikz_scope_begin(m):
+    num = tikz_number_format["fn"]
+    if not is_rotation_scaling_matrix(m):
+        return "\\begin{scope}[%s]" % tikz_cm_option(m)
+    deltas, angle, alpha = affine_matrix_to_translation_rotation_scaling(m)
+    opts = []
+    if deltas[0] != 0.0 or deltas[1] != 0.0:
+        opts.append("shift={(%s,%s)}" % (num(deltas[0]), num(deltas[1])))
+    opts.extend(tikz_rotation_and_scaling_options(angle, alpha))
+    return "\\begin{scope}[%s]" % ", ".join(opts)
+
+
+def tikz_scope_end():
+    return "\\end{scope}"
+
+
+def tikz_transform_group(e):
+    return "\n".join(iter_tikz(e))
+
+
+# NOTE: the bbox of the elements (in local coordinates) is cached. it is exact
+# for translations and scalings; for rotations, the elements are transformed.
+# the cache is computed in both cases (see mark_bbox_cache_dirty).
+def bbox_transform_group(e):
+    m = e["matrix"]
+    cache = e["bbox_cache"]
+    if cache["bbox"] is None:
+        cache["bbox"] = bbox(e["e_lst"])
+    if abs(m[0][1]) < 1.0e-12 and abs(m[1][0]) < 1.0e-12:
+        return bbox_from_coords_lst(
+            [affine_transform_coords(cs, m) for cs in cache["bbox"]])
+    else:
+        return bbox(apply_transform_group(e))
+
+
+def affine_transform_transform_group(e, m):
+    e["matrix"] = compose_affine_matrices(m, e["matrix"])
+
+
+#===> symbol_instance
+def iter_tikz_symbol_definition(sym):
+    yield "\\tikzset{%s/.pic={" % sym["name"]
+    for line in iter_tikz_commands(sym["e_lst"]):
+        yield line
+    yield "}}"
+
+
+def tikz_symbol_instance(e):
+    num = tikz_number_format["fn"]
+    if not is_rotation_scaling_matrix(e["matrix"]):
+        return "\\pic[%s] at (0,0) {%s};" % (tikz_cm_option(
+            e["matrix"]), e["symbol"]["name"])
+    deltas, angle, alpha = affine_matrix_to_translation_rotation_scaling(
+        e["matrix"])
+    return "\\pic[%s] at (%s,%s) {%s};" % (", ".join(
+        tikz_rotation_and_scaling_options(angle, alpha)), num(
+            deltas[0]), num(deltas[1]), e["symbol"]["name"])
+
+
+# NOTE: the bbox of the symbol is cached in the symbol (shared by instances).
+def bbox_symbol_instance(e):
+    sym = e["symbol"]
+    m = e["matrix"]
+    if abs(m[0][1]) < 1.0e-12 and abs(m[1][0]) < 1.0e-12:
+        if sym["bbox"] is None:
+            sym["bbox"] = bbox(sym["e_lst"])
+        return bbox_from_coords_lst(
+            [affine_transform_coords(cs, m) for cs in sym["bbox"]])
     else:
-        raise ValueError("draw not implemented for element: %s" % e["type"])
+        return bbox(apply_affine_matrix(sym["e_lst"], m))
+
+
+#===> open_path and closed_path
+def tikz_open_path(e):
+    return ("\\draw[%s] " % e["tikz_str"] +
+            coords_lst_to_tikz_str(e["cs_lst"], " -- ") + ";")
+
+
+def tikz_closed_path(e):
+    return ("\\draw[%s] " % e["tikz_str"] +
+            coords_lst_to_tikz_str(e["cs_lst"], " -- ") + " -- cycle;")
+
+
+def bbox_path(e):
+    return bbox_from_coords_lst(e["cs_lst"])
+
 
-    return cmd_lst
+def affine_transform_path(e, m):
+    e["cs_lst"] = affine_transform_coords_lst(e["cs_lst"], m)
+
+
+#===> circle and circular_arc
+def tikz_circle(e):
+    num = tikz_number_format["fn"]
+    return ("\\draw[%s] (%s, %s) circle (%s);" %
+            (e["tikz_str"], num(e["center_cs"][0]), num(
+                e["center_cs"][1]), num(e["radius"])))
+
+
+def tikz_circular_arc(e):
+    num = tikz_number_format["fn"]
+    return ("\\draw[%s] (%s,%s) arc (%s:%s:%s);" %
+            (e["tikz_str"], num(e["center_cs"][0]), num(e["center_cs"][1]),
+             num(e["start_angle"]), num(e["end_angle"]), num(e["radius"])))
+
+
+def bbox_circle(e):
+    r = e["radius"]
+    cs = e["center_cs"]
+    return [[cs[0] - r, cs[1] + r], [cs[0] + r, cs[1] - r]]
+
+
+# NOTE: a circle becomes an ellipse under a non-uniform scaling.
+def affine_transform_circle(e, m):
+    radii = transformed_ellipse_radii(e["radius"], e["radius"], m)
+    if radii is None:
+        raise ValueError(
+            "transform not implemented for element: circle (sheared).")
+    e["center_cs"] = affine_transform_coords(e["center_cs"], m)
+    if abs(radii[0] - radii[1]) <= 1.0e-12 * max(1.0, radii[0]):
+        e["radius"] = radii[0]
+    else:
+        del e["radius"]
+        e["type"] = "ellipse"
+        e["horizontal_radius"] = radii[0]
+        e["vertical_radius"] = radii[1]
+
+
+def bbox_circular_arc(e):
+    return circular_arc_bbox(e["center_cs"], e["radius"], e["start_angle"],
+                             e["end_angle"])
+
+
+# NOTE: center_cs is the start of the arc (see circular_arc_center_coords).
+# a reflection reverses the direction of the arc.
+def affine_transform_circular_arc(e, m):
+    if not is_similarity_matrix(m):
+        raise ValueError(
+            "transform not implemented for element: circular_arc (not a similarity)."
+        )
+    angle = radians_to_degrees(math.atan2(m[1][0], m[0][0]))
+    e["center_cs"] = affine_transform_coords(e["center_cs"], m)
+    e["radius"] *= math.sqrt(abs(affine_matrix_determinant(m)))
+    if affine_matrix_determinant(m) > 0.0:
+        e["start_angle"] += angle
+        e["end_angle"] += angle
+    else:
+        e["start_angle"] = angle - e["start_angle"]
+        e["end_angle"] = angle - e["end_angle"]
+
+
+#===> ellipse and elliptical_arc
+def tikz_ellipse(e):
+    num = tikz_number_format["fn"]
+    return ("\\draw[%s] (%s, %s) ellipse (%s and %s);" %
+            (e["tikz_str"], num(e["center_cs"][0]), num(e["center_cs"][1]),
+             num(e["horizontal_radius"]), num(e["vertical_radius"])))
+
+
+def tikz_elliptical_arc(e):
+    num = tikz_number_format["fn"]
+    return ("\\draw[%s] (%s,%s) arc (%s:%s:%s and %s);" %
+            (e["tikz_str"], num(e["center_cs"][0]), num(
+                e["center_cs"][1]), num(e["start_angle"]), num(e["end_angle"]),
+             num(e["horizontal_radius"]), num(e["vertical_radius"])))
+
+
+def bbox_ellipse(e):
+    rx = e["horizontal_radius"]
+    ry = e["vertical_radius"]
+    cs = e["center_cs"]
+    return [[cs[0] - rx, cs[1] + ry], [cs[0] + rx, cs[1] - ry]]
+
+
+def affine_transform_ellipse(e, m):
+    radii = transformed_ellipse_radii(e["horizontal_radius"],
+                                      e["vertical_radius"], m)
+    if radii is None:
+        raise ValueError(
+            "transform not implemented for element: ellipse (not axis aligned)."
+        )
+    e["center_cs"] = affine_transform_coords(e["center_cs"], m)
+    e["horizontal_radius"], e["vertical_radius"] = radii
+
+
+# NOTE: the angles of an elliptical arc are parametric (reflections change
+# them; scalings do not).
+def affine_transform_elliptical_arc(e, m):
+    if not is_axis_aligned_matrix(m):
+        raise ValueError(
+            "transform not implemented for element: elliptical_arc (not axis aligned)."
+        )
+    e["center_cs"] = affine_transform_coords(e["center_cs"], m)
+    e["horizontal_radius"] *= abs(m[0][0])
+    e["vertical_radius"] *= abs(m[1][1])
+    if m[0][0] < 0.0:
+        e["start_angle"] = 180.0 - e["start_angle"]
+        e["end_angle"] = 180.0 - e["end_angle"]
+    if m[1][1] < 0.0:
+        e["start_angle"] = -e["start_angle"]
+        e["end_angle"] = -e["end_angle"]
+
+
+#===> bezier
+def tikz_bezier(e):
+    num = tikz_number_format["fn"]
+    xs = [
+        num(cs[i])
+        for cs in [e["from_cs"], e["c1_cs"], e["c2_cs"], e["to_cs"]]
+        for i in range(2)
+    ]
+    return (
+        "\\draw[%s] (%s, %s) .. controls (%s, %s) and (%s, %s) .. (%s, %s);" %
+        tuple([e["tikz_str"]] + xs))
+
+
+def bbox_bezier(e):
+    return bezier_bbox(e["from_cs"], e["to_cs"], e["c1_cs"], e["c2_cs"])
+
+
+def affine_transform_bezier(e, m):
+    for k in ["from_cs", "to_cs", "c1_cs", "c2_cs"]:
+        e[k] = affine_transform_coords(e[k], m)
+
+
+#===> latex
+def tikz_latex(e):
+    num = tikz_number_format["fn"]
+    return ("\\node[%s] at (%s,%s) {%s};" %
+            (e["tikz_str"], num(e["cs"][0]), num(e["cs"][1]), e["expr"]))
+
+
+# NOTE: does not influence the bounding box (for simplicity)
+# TODO: optionally, make it part of text_width explicitly.
+def bbox_latex(e):
+    return [e["cs"], e["cs"]]
+
+
+def affine_transform_latex(e, m):
+    e["cs"] = affine_transform_coords(e["cs"], m)
+
+
+#===> image
+def tikz_image(e):
+    center_cs = translate_coords(e["top_left_cs"], e["width"] / 2.0,
+                                 -e["height"] / 2.0)
+    num = tikz_number_format["fn"]
+    return (
+        "\\node[inner sep=0pt, %s] at (%s,%s) {\\includegraphics[height=%s, width=%s]{%s}};"
+        % (e["tikz_str"], num(center_cs[0]), num(center_cs[1]), num(
+            e["height"]), num(e["width"]), e["filepath"]))
+
+
+def bbox_image(e):
+    return [
+        e["top_left_cs"],
+        translate_coords(e["top_left_cs"], e["width"], -e["height"])
+    ]
+
+
+# NOTE: images are not mirrored by reflections (only their box is moved).
+def affine_transform_image(e, m):
+    if not is_axis_aligned_matrix(m):
+        raise ValueError(
+            "transform not implemented for element: image (not axis aligned).")
+    top_left_cs, _ = bbox_from_coords_lst(
+        [affine_transform_coords(cs, m) for cs in bbox_image(e)])
+    e["top_left_cs"] = top_left_cs
+    e["width"] *= abs(m[0][0])
+    e["height"] *= abs(m[1][1])
+
+
+register_element_type("group",
+                      tikz_group,
+                      bbox_group,
+                      transform_fn=affine_transform_group)
+register_element_type("transform_group",
+                      tikz_transform_group,
+                      bbox_transform_group,
+                      transform_fn=affine_transform_transform_group)
+register_element_type("symbol_instance",
+                      tikz_symbol_instance,
+                      bbox_symbol_instance,
+                      transform_fn=affine_transform_transform_group)
+register_element_type("open_path",
+                      tikz_open_path,
+                      bbox_path,
+                      transform_fn=affine_transform_path)
+register_element_type("closed_path",
+                      tikz_closed_path,
+                      bbox_path,
+                      transform_fn=affine_transform_path)
+register_element_type("circle",
+                      tikz_circle,
+                      bbox_circle,
+                      transform_fn=affine_transform_circle)
+register_element_type("circular_arc",
+                      tikz_circular_arc,
+                      bbox_circular_arc,
+                      transform_fn=affine_transform_circular_arc)
+register_element_type("ellipse",
+                      tikz_ellipse,
+                      bbox_ellipse,
+                      transform_fn=affine_transform_ellipse)
+register_element_type("elliptical_arc",
+                      tikz_elliptical_arc,
+                      None,
+                      transform_fn=affine_transform_elliptical_arc)
+register_element_type("bezier",
+                      tikz_bezier,
+                      bbox_bezier,
+                      transform_fn=affine_transform_bezier)
+register_element_type("latex",
+                      tikz_latex,
+                      bbox_latex,
+                      transform_fn=affine_transform_latex)
+register_element_type("image",
+                      tikz_image,
+                      bbox_image,
+                      transform_fn=affine_transform_image)
+
+
+#### drawing to tikz
+# NOTE: yields the commands depth-first without building intermediate lists;
+# memory is proportional to the nesting depth of the element.
+# NOTE: the symbols used are defined before the commands that draw them.
+def iter_tikz(e):
+    for sym in collect_symbols(e):
+        if sym["emit_as_pic"]:
+            for line in iter_tikz_symbol_definition(sym):
+                yield line
+    for line in iter_tikz_commands(e):
+        yield line
+
+
+def iter_tikz_commands(e):
+    iter_stack = [iter([e])]
+    while len(iter_stack) > 0:
+        for e_i in iter_stack[-1]:
+            if isinstance(e_i, list):
+                assert len(e_i) > 0
+                iter_stack.append(iter(e_i))
+                break
+            # NOTE: strings are written as they are (e.g., to close scopes).
+            elif isinstance(e_i, str):
+                yield e_i
+            elif e_i["type"] == "group":
+                iter_stack.append(iter(e_i["e_lst"]))
+                break
+            elif e_i["type"] == "transform_group":
+                if e_i["emit_as_scope"]:
+                    yield tikz_scope_begin(e_i["matrix"])
+                    iter_stack.append(iter([e_i["e_lst"], tikz_scope_end()]))
+                else:
+                    iter_stack.append(iter([apply_transform_group(e_i)]))
+                break
+            elif (e_i["type"] == "symbol_instance" and
+                  not e_i["symbol"]["emit_as_pic"]):
+                iter_stack.append(
+                    iter([
+                        apply_affine_matrix(e_i["symbol"]["e_lst"],
+                                            e_i["matrix"])
+                    ]))
+                break
+            else:
+                yield tikz_command(e_i)
+        else:
+            iter_stack.pop()
+
+
+def draw_to_tikz(e):
+    return list(iter_tikz(e))
+
+
+def write_lines(f, lines):
+    for line in lines:
+        f.write(line + "\n")
 
 
 def write_textfile(filepath, lines):
     with open(filepath, 'w') as f:
-        for line in lines:
-            f.write(line + "\n")
+        write_lines(f, lines)
 
 
-# TODO: have to define colors by hand.
-def draw_to_tikz_standalone(e, filepath, name2color_in_rgb=None):
-    tikz_lines = []
-    tikz_lines.extend([
+def write_tikz(e, f):
+    write_lines(f, iter_tikz(e))
+
+
+def tikz_standalone_header_lines(name2color_in_rgb=None):
+    tikz_lines = [
         '\\documentclass{standalone}',
         "\\usepackage[T1]{fontenc}"
         '\\usepackage{tikz}',
@@ -1299,7 +2262,7 @@ def draw_to_tikz_standalone(e, filepath, name2color_in_rgb=None):
         '\\usetikzlibrary{arrows.meta}',
         '\\begin{document}',
         '\\begin{tikzpicture}',
-    ])
+    ]
 
     # define the colors used.
     if name2color_in_rgb is not None:
@@ -1307,13 +2270,84 @@ def draw_to_tikz_standalone(e, filepath, name2color_in_rgb=None):
             '\\definecolor{%s}{RGB}{%d,%d,%d}' % (name, rgb[0], rgb[1], rgb[2])
             for (name, rgb) in name2color_in_rgb.items()
         ])
+    return tikz_lines
 
-    tikz_lines.extend(draw_to_tikz(e))
-    tikz_lines.extend([
+
+def tikz_standalone_footer_lines():
+    return [
         '\\end{tikzpicture}',
         '\\end{document}',
-    ])
-    write_textfile(filepath, tikz_lines)
+    ]
+
+
+def iter_tikz_standalone(e, name2color_in_rgb=None):
+    for line in tikz_standalone_header_lines(name2color_in_rgb):
+        yield line
+    for line in iter_tikz(e):
+        yield line
+    for line in tikz_standalone_footer_lines():
+        yield line
+
+
+# NOTE: f is a file-like object opened for writing text.
+def write_tikz_standalone(e, f, name2color_in_rgb=None):
+    write_lines(f, iter_tikz_standalone(e, name2color_in_rgb))
+
+
+# NOTE: the hash of the content of a tex file is kept next to it.
+def tikz_hash_filepath(filepath):
+    return filepath + ".sha256"
+
+
+def read_tikz_hash(filepath):
+    hash_filepath = tikz_hash_filepath(filepath)
+    if not (os.path.isfile(filepath) and os.path.isfile(hash_filepath)):
+        return None
+    with open(hash_filepath, 'r') as f:
+        return f.read().strip()
+
+
+# TODO: have to define colors by hand.
+# NOTE: with only_if_changed=True, the file (and its mtime) is left untouched if
+# the generated content has the same hash as the last time it was written.
+# returns True if the file was written and False otherwise.
+def draw_to_tikz_standalone(e,
+                            filepath,
+                            name2color_in_rgb=None,
+                            only_if_changed=False):
+    if not only_if_changed:
+        # NOTE: the hash of the previous content no longer matches the file.
+        hash_filepath = tikz_hash_filepath(filepath)
+        if os.path.isfile(hash_filepath):
+            os.remove(hash_filepath)
+        with open(filepath, 'w') as f:
+            write_tikz_standalone(e, f, name2color_in_rgb)
+        return True
+
+    # write to a temporary file while hashing, and only replace if changed.
+    h = hashlib.sha256()
+    tmp_filepath = filepath + ".tmp"
+    try:
+        with open(tmp_filepath, 'w') as f:
+            for line in iter_tikz_standalone(e, name2color_in_rgb):
+                line = line + "\n"
+                h.update(line.encode('utf-8'))
+                f.write(line)
+    except BaseException:
+        # NOTE: a partially written temporary file is not left behind.
+        if os.path.isfile(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+    digest = h.hexdigest()
+
+    if digest == read_tikz_hash(filepath):
+        os.remove(tmp_filepath)
+        return False
+    else:
+        os.replace(tmp_filepath, filepath)
+        with open(tikz_hash_filepath(filepath), 'w') as f:
+            f.write(digest + "\n")
+        return True
 
 
 #### tikz reference
@@ -1483,4 +2517,4 @@ def draw_to_tikz_standalone(e, filepath, name2color_in_rgb=None):
 
 # how to surround an equation with a text bounding box. see that I can do it consistently.
 # can I compile animations to manim.
-# can I set properties easily, e.g., color.
\ No newline at end of file
+# can I set properties easil
\ No newline at end of file
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+# layered layout of directed graphs (sugiyama style), e.g., for architecture
+# diagrams. the graph is given by a list of elements and a list of edges
+# (i, j) from e_lst[i] to e_lst[j]. the steps are:
+# - cycles are broken by reversing the back edges of a depth first search.
+# - each node gets the layer of the longest path from a source to it.
+# - edges spanning several layers go through dummy nodes (one per layer).
+# - the order of the nodes in each layer is found with barycenter sweeps
+#   (down and up); the order with the fewest crossings is kept.
+# - the position of the nodes in each layer is the closest (in the least
+#   squares sense) to the mean position of their neighbors that keeps the
+#   nodes apart (isotonic regression), alternating down and up sweeps.
+# each element is translated once. the dummy nodes give the waypoints of the
+# edges (see dag_connectors).
+#
+# waypoints_lst = dag_layout(e_lst, edge_lst, [0.0, 0.0], "bottom_up")
+# edges = dag_connectors(e_lst, edge_lst, waypoints_lst, "bottom_up")
+
+import numpy as np
+import sane_tikz.core as stz
+import sane_tikz.tree_layout as tl
+
+
+# NOTE: returns the edges that close a cycle in a depth first search (from
+# the nodes in order). reversing them makes the graph acyclic.
+def back_edges(num_nodes, edge_lst):
+    out_edges = [[] for _ in range(num_nodes)]
+    for k, (i, j) in enumerate(edge_lst):
+        out_edges[i].append((j, k))
+    # 0: not visited; 1: in the current path; 2: done.
+    state = [0] * num_nodes
+    is_back = [False] * len(edge_lst)
+    for s in range(num_nodes):
+        if state[s] != 0:
+            continue
+        state[s] = 1
+        stack = [(s, 0)]
+        while len(stack) > 0:
+            v, idx = stack[-1]
+            if idx < len(out_edges[v]):
+                stack[-1] = (v, idx + 1)
+                w, k = out_edges[v][idx]
+                if state[w] == 0:
+                    state[w] = 1
+                    stack.append((w, 0))
+                elif state[w] == 1:
+                    is_back[k] = True
+            else:
+                state[v] = 2
+                stack.pop()
+    return is_back
+
+
+# NOTE: longest path layering (sources are in layer 0).
+def longest_path_layers(num_nodes, edge_lst):
+    out_edges = [[] for _ in range(num_nodes)]
+    in_degree = [0] * num_nodes
+    for (i, j) in edge_lst:
+        out_edges[i].append(j)
+        in_degree[j] += 1
+    layer = [0] * num_nodes
+    order = [v for v in range(num_nodes) if in_degree[v] == 0]
+    k = 0
+    while k < len(order):
+        v = order[k]
+        for w in out_edges[v]:
+            if layer[v] + 1 > layer[w]:
+                layer[w] = layer[v] + 1
+            in_degree[w] -= 1
+            if in_degree[w] == 0:
+                order.append(w)
+        k += 1
+    assert len(order) == num_nodes
+    return layer
+
+
+# NOTE: least squares non-decreasing fit to y (pool adjacent violators).
+def isotonic_regression(y):
+    values = []
+    counts = []
+    for v in y:
+        values.append(v)
+        counts.append(1)
+        while len(values) > 1 and values[-2] > values[-1]:
+            v = values.pop()
+            c = counts.pop()
+            values[-1] = (values[-1] * counts[-1] + v * c) / (counts[-1] + c)
+            counts[-1] += c
+    out = []
+    for v, c in zip(values, counts):
+        out.extend([v] * c)
+    return out
+
+
+# NOTE: closest positions to desired_lst (in order) with x[i + 1] - x[i] >=
+# separation_lst[i].
+def separated_positions(desired_lst, separation_lst):
+    offsets = [0.0]
+    for s in separation_lst:
+        offsets.append(offsets[-1] + s)
+    y = isotonic_regression([d - o for d, o in zip(desired_lst, offsets)])
+    return [v + o for v, o in zip(y, offsets)]
+
+
+# NOTE: number of crossings between two consecutive layers (inversions of the
+# positions of the lower ends when sorted by the upper ends).
+def num_crossings(upper_pos, lower_pos, num_lower):
+    order = np.lexsort((lower_pos, upper_pos))
+    tree = [0] * (num_lower + 1)
+    count = 0
+    seen = 0
+    for p in lower_pos[order].tolist():
+        # number of seen edges with a lower end to the right of p.
+        i = p + 1
+        s = 0
+        while i > 0:
+            s += tree[i]
+            i -= i & (-i)
+        count += seen - s
+        seen += 1
+        i = p + 1
+        while i <= num_lower:
+            tree[i] += 1
+            i += i & (-i)
+    return count
+
+
+def dag_layout(e_lst,
+               edge_lst,
+               top_left_cs,
+               orientation="top_down",
+               node_spacing=0.5,
+               layer_spacing=1.0,
+               edge_spacing=0.2,
+               num_order_sweeps=8,
+               num_position_sweeps=8):
+    assert orientation in tl.orientations
+    n = len(e_lst)
+    edge_lst = [(i, j) for (i, j) in edge_lst if i != j]
+    if n == 0:
+        return []
+    is_back = back_edges(n, edge_lst)
+    dag_edge_lst = [
+        (j, i) if b else (i, j) for (i, j), b in zip(edge_lst, is_back)
+    ]
+    layer = longest_path_layers(n, dag_edge_lst)
+
+    bboxes = [stz.bbox(e) for e in e_lst]
+    is_vertical = orientation in ["top_down", "bottom_up"]
+    if is_vertical:
+        breadth_lst = [x2 - x1 for ((x1, _), (x2, _)) in bboxes]
+        length_lst = [y1 - y2 for ((_, y1), (_, y2)) in bboxes]
+    else:
+        breadth_lst = [y1 - y2 for ((_, y1), (_, y2)) in bboxes]
+        length_lst = [x2 - x1 for ((x1, _), (x2, _)) in bboxes]
+
+    # dummy nodes (zero breadth) for the edges spanning several layers.
+    segments = []
+    dummies_lst = []
+    for (i, j) in dag_edge_lst:
+        dummies = []
+        u = i
+        for l in range(layer[i] + 1, layer[j]):
+            v = len(layer)
+            layer.append(l)
+            breadth_lst.append(0.0)
+            length_lst.append(0.0)
+            segments.append((u, v))
+            dummies.append(v)
+            u = v
+        segments.append((u, j))
+        dummies_lst.append(dummies)
+    num_nodes = len(layer)
+    num_layers = max(layer) + 1
+    is_dummy = [v >= n for v in range(num_nodes)]
+
+    layers = [[] for _ in range(num_layers)]
+    for v in range(num_nodes):
+        layers[layer[v]].append(v)
+    layers = [np.array(nodes, dtype=np.int64) for nodes in layers]
+    # slot of each node in its layer (fixed) and position (changes).
+    slot = np.zeros(num_nodes, dtype=np.int64)
+    pos = np.zeros(num_nodes, dtype=np.int64)
+    for nodes in layers:
+        slot[nodes] = np.arange(len(nodes))
+        pos[nodes] = np.arange(len(nodes))
+
+    # segments between layer l and l + 1 (upper and lower ends).
+    seg = np.array(segments, dtype=np.int64).reshape(-1, 2)
+    seg_layer = np.array(layer, dtype=np.int64)[seg[:, 0]]
+    seg_order = np.argsort(seg_layer, kind="stable")
+    seg = seg[seg_order]
+    bounds = np.searchsorted(seg_layer[seg_order], np.arange(num_layers + 1))
+    upper = [seg[bounds[l]:bounds[l + 1], 0] for l in range(num_layers - 1)]
+    lower = [seg[bounds[l]:bounds[l + 1], 1] for l in range(num_layers - 1)]
+
+    def total_crossings():
+        return sum(
+            num_crossings(pos[upper[l]], pos[lower[l]], len(layers[l + 1]))
+            for l in range(num_layers - 1))
+
+    def reorder(l, nbrs, nodes_of_nbrs):
+        nodes = layers[l]
+        num = np.bincount(slot[nodes_of_nbrs], minlength=len(nodes))
+        total = np.bincount(slot[nodes_of_nbrs],
+                            weights=pos[nbrs],
+                            minlength=len(nodes))
+        # NOTE: nodes without neighbors keep their position.
+        bary = np.where(num > 0, total / np.maximum(num, 1),
+                        pos[nodes].astype(np.float64))
+        ordered = nodes[np.lexsort((pos[nodes], bary[slot[nodes]]))]
+        pos[ordered] = np.arange(len(nodes))
+
+    best_pos = pos.copy()
+    best_crossings = total_crossings()
+    for _ in range(num_order_sweeps):
+        if best_crossings == 0:
+            break
+        for l in range(1, num_layers):
+            reorder(l, upper[l - 1], lower[l - 1])
+        for l in range(num_layers - 2, -1, -1):
+            reorder(l, lower[l], upper[l])
+        c = total_crossings()
+        if c < best_crossings:
+            best_crossings = c
+            best_pos = pos.copy()
+    pos = best_pos
+
+    # positions along the layers.
+    ordered_layers = [
+        nodes[np.argsort(pos[nodes])].tolist() for nodes in layers
+    ]
+    separations = []
+    for nodes in ordered_layers:
+        separations.append([
+            (breadth_lst[u] + breadth_lst[v]) / 2.0 +
+            (edge_spacing if is_dummy[u] or is_dummy[v] else node_spacing)
+            for u, v in zip(nodes[:-1], nodes[1:])
+        ])
+    x = np.zeros(num_nodes)
+    for nodes, seps in zip(ordered_layers, separations):
+        xs = separated_positions([0.0] * len(nodes), seps)
+        x[nodes] = xs
+
+    def place(l, nbrs, nodes_of_nbrs):
+        nodes = ordered_layers[l]
+        num = np.bincount(slot[nodes_of_nbrs], minlength=len(nodes))
+        total = np.bincount(slot[nodes_of_nbrs],
+                            weights=x[nbrs],
+                            minlength=len(nodes))
+        s = slot[nodes]
+        desired = np.where(num[s] > 0, total[s] / np.maximum(num[s], 1),
+                           x[nodes])
+        x[nodes] = separated_positions(desired.tolist(), separations[l])
+
+    for _ in range(num_position_sweeps):
+        for l in range(1, num_layers):
+            place(l, upper[l - 1], lower[l - 1])
+        for l in range(num_layers - 2, -1, -1):
+            place(l, lower[l], upper[l])
+
+    level_pos = tl.level_positions(layer, length_lst, layer_spacing)
+    sign = 1.0 if orientation in ["bottom_up", "left_right"] else -1.0
+
+    def center_cs(v):
+        if is_vertical:
+            return [float(x[v]), sign * level_pos[layer[v]]]
+        else:
+            return [sign * level_pos[layer[v]], -float(x[v])]
+
+    # NOTE: the top left corner of the laid out elements goes to top_left_cs.
+    centers = [center_cs(v) for v in range(n)]
+    moved_bboxes = [[[cs[0] - (x2 - x1) / 2.0, cs[1] + (y1 - y2) / 2.0],
+                     [cs[0] + (x2 - x1) / 2.0, cs[1] - (y1 - y2) / 2.0]]
+                    for cs, ((x1, y1), (x2, y2)) in zip(centers, bboxes)]
+    (left_x, top_y), _ = stz.bbox_union(moved_bboxes)
+    delta_x = top_left_cs[0] - left_x
+    delta_y = top_left_cs[1] - top_y
+    for e, cs, ((x1, y1), (x2, y2)) in zip(e_lst, centers, bboxes):
+        stz.translate(e, cs[0] + delta_x - (x1 + x2) / 2.0,
+                      cs[1] + delta_y - (y1 + y2) / 2.0)
+
+    waypoints_lst = []
+    for dummies, b in zip(dummies_lst, is_back):
+        cs_lst = [
+            stz.translate_coords(center_cs(v), delta_x, delta_y)
+            for v in dummies
+        ]
+        waypoints_lst.append(cs_lst[::-1] if b else cs_lst)
+    return waypoints_lst
+
+
+# NOTE: one open path per edge (from the side of the source bbox facing the
+# next layer, through the waypoints, to the side of the target bbox). edges
+# that go against the orientation (e.g., reversed to break cycles) connect the
+# opposite sides.
+def dag_connectors(e_lst,
+                   edge_lst,
+                   waypoints_lst,
+                   orientation="top_down",
+                   tikz_str=""):
+    edge_lst = [(i, j) for (i, j) in edge_lst if i != j]
+    assert len(edge_lst) == len(waypoints_lst)
+    forward_fn, backward_fn = {
+        "top_down": (stz.bottom_center_coords, stz.top_center_coords),
+        "bottom_up": (stz.top_center_coords, stz.bottom_center_coords),
+        "left_right": (stz.right_center_coords, stz.left_center_coords),
+        "right_left": (stz.left_center_coords, stz.right_center_coords)
+    }[orientation]
+    axis = 1 if orientation in ["top_down", "bottom_up"] else 0
+    sign = 1.0 if orientation in ["bottom_up", "left_right"] else -1.0
+    paths = []
+    for (i, j), cs_lst in zip(edge_lst, waypoints_lst):
+        from_cs = stz.center_coords(e_lst[i])
+        to_cs = stz.center_coords(e_lst[j])
+        if sign * (to_cs[axis] - from_cs[axis]) >= 0.0:
+            from_fn, to_fn = forward_fn, backward_fn
+        else:
+            from_fn, to_fn = backward_fn, forward_fn
+        paths.append(
+            stz.open_path(
+                [stz.coords_from_bbox_with_fn(e_lst[i], from_fn)] + cs_lst +
+                [stz.coords_from_bbox_with_fn(e_lst[j], to_fn)], tikz_str))
+    return paths
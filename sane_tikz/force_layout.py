@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+# force-directed layout of graphs (fruchterman-reingold), e.g., for factor
+# graphs. the graph is given by a list of node elements and a list of edges
+# (i, j). nodes repel each other and edges pull their nodes together; the
+# displacement of each node is limited by a step that adapts to the progress
+# of the energy (hu, "efficient and high quality force-directed graph
+# drawing", 2005). large graphs are first coarsened by matching neighbors and
+# laid out from the coarsest graph up. the repulsion between far away nodes is
+# approximated with a grid (a convolution of the binned nodes with fft); nearby
+# pairs get the exact repulsion. forces are computed with numpy over all the
+# nodes and edges at once. overlapping nodes are pushed apart at the end, and
+# each node is translated once.
+#
+# force_layout(e_lst, edge_lst, [0.0, 0.0])
+# edges = force_connectors(e_lst, edge_lst)
+
+import numpy as np
+import sane_tikz.core as stz
+import sane_tikz.spatial_index as si
+
+
+# NOTE: a few times the size of a typical node.
+def default_ideal_length(bbox_arr):
+    sizes = np.maximum(bbox_arr[:, 2] - bbox_arr[:, 0],
+                       bbox_arr[:, 1] - bbox_arr[:, 3])
+    return max(2.5 * float(np.median(sizes)), 1.0e-3)
+
+
+def add_pair_forces(disp, ids, other_ids, vecs):
+    n = len(disp)
+    disp[:, 0] += (np.bincount(ids, weights=vecs[:, 0], minlength=n) -
+                   np.bincount(other_ids, weights=vecs[:, 0], minlength=n))
+    disp[:, 1] += (np.bincount(ids, weights=vecs[:, 1], minlength=n) -
+                   np.bincount(other_ids, weights=vecs[:, 1], minlength=n))
+
+
+# NOTE: repulsion kernels r / |r|^2 (for the x and y components) on the
+# offsets (in cells) of a grid of shape (grid_size, grid_size), together with
+# their ffts. the offsets are in the wrapped order of np.fft on a grid twice
+# as large (so that convolutions do not wrap around).
+def repulsion_kernels(grid_size):
+    n = 2 * grid_size
+    dx = np.fft.fftfreq(n, 1.0 / n)[:, None]
+    dy = np.fft.fftfreq(n, 1.0 / n)[None, :]
+    d2 = dx * dx + dy * dy
+    d2[0, 0] = 1.0
+    kx = dx / d2
+    ky = dy / d2
+    kx[0, 0] = 0.0
+    ky[0, 0] = 0.0
+    return kx, ky, np.fft.rfft2(kx), np.fft.rfft2(ky)
+
+
+# NOTE: returns arrays (ids, other_ids) with the pairs of nodes (each pair
+# once) whose cells are at most max_offset cells apart along each axis.
+def nearby_pairs(cells, grid_size, max_offset):
+    keys = cells[:, 0] * grid_size + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    # NOTE: the nodes of cell c are order[cell_starts[c]:cell_starts[c + 1]].
+    cell_starts = np.concatenate(
+        [[0],
+         np.cumsum(np.bincount(keys, minlength=grid_size * grid_size))])
+    ids_lst = []
+    other_ids_lst = []
+    for dx in range(0, max_offset + 1):
+        for dy in range(-max_offset, max_offset + 1):
+            if dx == 0 and dy < 0:
+                continue
+            m = ((cells[:, 0] + dx < grid_size) & (cells[:, 1] + dy >= 0) &
+                 (cells[:, 1] + dy < grid_size))
+            ids = np.nonzero(m)[0]
+            other_keys = keys[ids] + (dx * grid_size + dy)
+            lo = cell_starts[other_keys]
+            counts = cell_starts[other_keys + 1] - lo
+            starts = np.cumsum(counts) - counts
+            k = np.arange(int(counts.sum())) - np.repeat(starts, counts)
+            a = np.repeat(ids, counts)
+            b = order[np.repeat(lo, counts) + k]
+            if dx == 0 and dy == 0:
+                keep = a < b
+                a, b = a[keep], b[keep]
+            ids_lst.append(a)
+            other_ids_lst.append(b)
+    return np.concatenate(ids_lst), np.concatenate(other_ids_lst)
+
+
+# NOTE: repulsion between all pairs of nodes. far away pairs go through a grid:
+# the nodes are binned into cells, the binned masses are convolved with the
+# repulsion kernel (with fft), and each node gets the force at its cell. pairs
+# of nodes at most two cells apart get the exact force instead (the force the
+# grid gives them is subtracted).
+def add_repulsion_forces(disp, pos, k, kernels, rng):
+    kx, ky, fkx, fky = kernels
+    grid_size = kx.shape[0] // 2
+    lo = pos.min(axis=0)
+    extent = float((pos.max(axis=0) - lo).max())
+    cell_size = max(extent / (grid_size - 1), 1.0e-6 * k)
+    c = k * k / cell_size
+    cells = np.floor((pos - lo) / cell_size).astype(np.int64)
+    cells = np.minimum(cells, grid_size - 1)
+
+    # far field (all pairs, through the grid).
+    masses = np.bincount(cells[:, 0] * grid_size + cells[:, 1],
+                         minlength=grid_size * grid_size).reshape(
+                             grid_size, grid_size)
+    shape = kx.shape
+    fm = np.fft.rfft2(masses, s=shape)
+    fx = np.fft.irfft2(fm * fkx, s=shape)
+    fy = np.fft.irfft2(fm * fky, s=shape)
+    disp[:, 0] += c * fx[cells[:, 0], cells[:, 1]]
+    disp[:, 1] += c * fy[cells[:, 0], cells[:, 1]]
+
+    # near field (exact, minus what the grid gave).
+    ids, other_ids = nearby_pairs(cells, grid_size, 2)
+    dc = cells[ids] - cells[other_ids]
+    delta = pos[ids] - pos[other_ids]
+    d2 = (delta * delta).sum(axis=1)
+    # NOTE: nodes at the same position are pushed in a random direction.
+    same = d2 < 1.0e-18 * k * k
+    if same.any():
+        delta[same] = rng.normal(scale=1.0e-3 * k, size=(same.sum(), 2))
+        d2[same] = (delta[same] * delta[same]).sum(axis=1)
+    vecs = delta * (k * k / d2)[:, None]
+    vecs[:, 0] -= c * kx[dc[:, 0], dc[:, 1]]
+    vecs[:, 1] -= c * ky[dc[:, 0], dc[:, 1]]
+    add_pair_forces(disp, ids, other_ids, vecs)
+
+
+# NOTE: moves the nodes (pos is a (n, 2) array) along their forces. all the
+# nodes move the same step; the step grows after a few iterations that reduce
+# the energy (sum of squared forces) and shrinks otherwise (see hu, "efficient
+# and high quality force-directed graph drawing", 2005).
+def refine_positions(pos, edges, k, step, num_iterations, repulsion_strength,
+                     gravity, max_grid_size, rng):
+    n = len(pos)
+    # NOTE: a few nodes per cell on average.
+    grid_size = int(min(max(2.0 * np.sqrt(n), 16), max_grid_size))
+    kernels = repulsion_kernels(grid_size)
+    # NOTE: the repulsion strength scales the k^2 of the repulsion force.
+    k_rep = k * np.sqrt(repulsion_strength)
+    energy = np.inf
+    progress = 0
+    for _ in range(num_iterations):
+        disp = np.zeros((n, 2))
+        add_repulsion_forces(disp, pos, k_rep, kernels, rng)
+
+        # attraction along the edges: d^2 / k along delta / d.
+        if len(edges) > 0:
+            delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+            d = np.sqrt((delta * delta).sum(axis=1))
+            add_pair_forces(disp, edges[:, 0], edges[:, 1],
+                            -delta * (d / k)[:, None])
+
+        if gravity > 0.0:
+            disp -= gravity * (pos - pos.mean(axis=0))
+
+        length2 = (disp * disp).sum(axis=1)
+        pos += disp * (step / np.sqrt(np.maximum(length2, 1.0e-24)))[:, None]
+
+        prev_energy = energy
+        energy = float(length2.sum())
+        if energy < prev_energy:
+            progress += 1
+            if progress >= 5:
+                progress = 0
+                step /= 0.9
+        else:
+            progress = 0
+            step *= 0.9
+        if step < 1.0e-2 * k:
+            break
+    return pos
+
+
+# NOTE: merges pairs of neighbors (a greedy matching, preferring neighbors of
+# low degree). returns the coarse node of each node, the number of coarse
+# nodes, and the coarse edges (without duplicates).
+def coarsen_graph(num_nodes, edges, rng):
+    nbrs = [[] for _ in range(num_nodes)]
+    for (i, j) in edges.tolist():
+        nbrs[i].append(j)
+        nbrs[j].append(i)
+    match = [-1] * num_nodes
+    for v in rng.permutation(num_nodes).tolist():
+        if match[v] >= 0:
+            continue
+        best = v
+        for w in nbrs[v]:
+            if match[w] < 0 and w != v and (best == v or
+                                            len(nbrs[w]) < len(nbrs[best])):
+                best = w
+        match[v] = best
+        match[best] = v
+    coarse_of = [-1] * num_nodes
+    num_coarse = 0
+    for v in range(num_nodes):
+        if coarse_of[v] < 0:
+            coarse_of[v] = num_coarse
+            coarse_of[match[v]] = num_coarse
+            num_coarse += 1
+    coarse_of = np.array(coarse_of, dtype=np.int64)
+    a = coarse_of[edges[:, 0]]
+    b = coarse_of[edges[:, 1]]
+    m = a != b
+    keys = np.unique(
+        np.minimum(a[m], b[m]) * num_coarse + np.maximum(a[m], b[m]))
+    coarse_edges = np.stack([keys // num_coarse, keys % num_coarse], axis=1)
+    return coarse_of, num_coarse, coarse_edges
+
+
+# NOTE: returns the positions of the nodes as a (n, 2) array. if init_cs_arr
+# (the initial positions) is None, the graph is coarsened a few times, the
+# coarsest graph is laid out from random positions, and each finer graph
+# starts from the positions of the coarser one (this avoids most of the folds
+# that a single level layout of a large graph ends up with). num_iterations is
+# for the coarsest graph (or the single level) and num_refinement_iterations
+# for each of the finer ones.
+def force_positions(num_nodes,
+                    edge_lst,
+                    ideal_length,
+                    num_iterations=100,
+                    num_refinement_iterations=30,
+                    init_cs_arr=None,
+                    repulsion_strength=0.2,
+                    gravity=0.0,
+                    seed=0,
+                    max_grid_size=256):
+    rng = np.random.RandomState(seed)
+    k = ideal_length
+    edges = np.array([(i, j) for (i, j) in edge_lst if i != j],
+                     dtype=np.int64).reshape(-1, 2)
+    if init_cs_arr is not None:
+        pos = np.array(init_cs_arr, dtype=np.float64).reshape(num_nodes, 2)
+        step = max(float((pos.max(axis=0) - pos.min(axis=0)).max()) / 10.0, k)
+        return refine_positions(pos, edges, k, step, num_iterations,
+                                repulsion_strength, gravity, max_grid_size, rng)
+
+    levels = [(num_nodes, edges, None)]
+    while levels[-1][0] > 100:
+        n, e, _ = levels[-1]
+        coarse_of, num_coarse, coarse_edges = coarsen_graph(n, e, rng)
+        # NOTE: stops if the graph barely shrinks (e.g., many isolated nodes).
+        if num_coarse > 0.8 * n:
+            break
+        levels[-1] = (n, e, coarse_of)
+        levels.append((num_coarse, coarse_edges, None))
+
+    n, e, _ = levels[-1]
+    pos = rng.uniform(0.0, k * np.sqrt(n), size=(n, 2))
+    pos = refine_positions(pos, e, k,
+                           k * np.sqrt(n) / 10.0, num_iterations,
+                           repulsion_strength, gravity, max_grid_size, rng)
+    for n, e, coarse_of in levels[-2::-1]:
+        pos = pos[coarse_of] + rng.uniform(-0.1 * k, 0.1 * k, size=(n, 2))
+        pos = refine_positions(pos, e, k, k, num_refinement_iterations,
+                               repulsion_strength, gravity, max_grid_size, rng)
+    return pos
+
+
+# NOTE: pushes apart the nodes (with the given half widths and heights) whose
+# bboxes (grown by spacing / 2) overlap. each overlapping pair moves apart
+# along the line between their centers (a bit more than needed, which helps
+# dense clusters spread). only the nodes that moved are checked again.
+def separate_overlapping_nodes(pos, half_arr, spacing, max_num_iterations=200):
+    n = len(pos)
+    half = half_arr + spacing / 2.0
+    active = np.arange(n)
+    for _ in range(max_num_iterations):
+        box = np.concatenate([pos - half, pos + half], axis=1)[:, [0, 3, 2, 1]]
+        ids, other_ids = si.overlapping_pairs_between(box[active], box)
+        ids = active[ids]
+        # NOTE: pairs of active nodes show up twice.
+        is_active = np.zeros(n, dtype=bool)
+        is_active[active] = True
+        m = (ids < other_ids) | ~is_active[other_ids]
+        ids, other_ids = ids[m], other_ids[m]
+        delta = pos[ids] - pos[other_ids]
+        overlap = (half[ids] + half[other_ids] - np.abs(delta)).min(axis=1)
+        m = overlap > 1.0e-9 * max(spacing, 1.0e-6)
+        if not m.any():
+            break
+        ids, other_ids, delta, overlap = ids[m], other_ids[m], delta[
+            m], overlap[m]
+        d = np.sqrt((delta * delta).sum(axis=1))
+        # NOTE: nodes at the same position are pushed in spread out directions.
+        same = d < 1.0e-12
+        if same.any():
+            angle = 2.39996 * np.arange(same.sum())
+            delta[same] = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+            d[same] = 1.0
+        disp = np.zeros((n, 2))
+        add_pair_forces(disp, ids, other_ids,
+                        delta * (0.6 * overlap / d)[:, None])
+        pos += disp
+        active = np.unique(np.concatenate([ids, other_ids]))
+    return pos
+
+
+# NOTE: the center of the bbox of the laid out nodes goes to center_cs.
+# ideal_length is the distance between the centers of connected nodes that
+# the forces aim for (a few times the size of the nodes by default). nodes
+# that still overlap at the end are pushed apart (to node_spacing).
+def force_layout(e_lst,
+                 edge_lst,
+                 center_cs,
+                 ideal_length=None,
+                 node_spacing=0.1,
+                 num_iterations=100,
+                 num_refinement_iterations=30,
+                 init_cs_lst=None,
+                 repulsion_strength=0.2,
+                 gravity=0.0,
+                 seed=0):
+    n = len(e_lst)
+    if n == 0:
+        return
+    bbox_arr = si.bboxes_to_array([stz.bbox(e) for e in e_lst])
+    if ideal_length is None:
+        ideal_length = default_ideal_length(bbox_arr)
+    pos = force_positions(n, edge_lst, ideal_length, num_iterations,
+                          num_refinement_iterations, init_cs_lst,
+                          repulsion_strength, gravity, seed)
+
+    centers = np.stack([(bbox_arr[:, 0] + bbox_arr[:, 2]) / 2.0,
+                        (bbox_arr[:, 1] + bbox_arr[:, 3]) / 2.0],
+                       axis=1)
+    half = np.stack([(bbox_arr[:, 2] - bbox_arr[:, 0]) / 2.0,
+                     (bbox_arr[:, 1] - bbox_arr[:, 3]) / 2.0],
+                    axis=1)
+    pos = separate_overlapping_nodes(pos, half, node_spacing)
+    lo = (pos - half).min(axis=0)
+    hi = (pos + half).max(axis=0)
+    pos += np.array(center_cs, dtype=np.float64) - (lo + hi) / 2.0
+    for e, (delta_x, delta_y) in zip(e_lst, (pos - centers).tolist()):
+        stz.translate(e, delta_x, delta_y)
+
+
+# NOTE: connects the centers of the nodes, stopping at their bboxes (or at
+# circles of the given radius).
+def force_connectors(e_lst, edge_lst, tikz_str="", radius=None):
+    out = []
+    for (i, j) in edge_lst:
+        if i == j:
+            continue
+        from_cs = stz.center_coords(e_lst[i])
+        to_cs = stz.center_coords(e_lst[j])
+        angle = stz.vector_to_angle([from_cs, to_cs])
+        if radius is not None:
+            out.append(
+                stz.line_segment_between_circles(from_cs, radius, angle, to_cs,
+                                                 radius, angle + 180.0,
+                                                 tikz_str))
+        else:
+            out.append(
+                stz.line_segment(
+                    stz.coords_on_rectangle(*stz.bbox(e_lst[i]), angle),
+                    stz.coords_on_rectangle(*stz.bbox(e_lst[j]), angle + 180.0),
+                    tikz_str))
+    return out
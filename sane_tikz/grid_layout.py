@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# grid (table) layout. the elements are given as a list of rows (None or []
+# for empty cells). a first pass computes the bbox of each cell, the width of
+# each column, and the height of each row (max over the cells). a second pass
+# translates each cell once to its place in the grid (with the requested
+# alignment). the corners of the cells are returned as in
+# stz.coords_on_irregular_grid, e.g., to draw the lines of a table.
+#
+# grid_cs = grid_layout(e_grid, [0.0, 0.0], horizontal_padding=0.1)
+# lines = grid_lines(grid_cs)
+
+import sane_tikz.core as stz
+
+horizontal_aligns = ["left", "center", "right"]
+vertical_aligns = ["top", "center", "bottom"]
+
+
+def is_empty_cell(e):
+    return e is None or (isinstance(e, list) and len(e) == 0)
+
+
+# NOTE: returns the bboxes of the cells (None for empty cells), the width of
+# each column, and the height of each row (without padding).
+def grid_cell_sizes(e_grid):
+    num_columns = max([len(row) for row in e_grid] + [0])
+    column_width_lst = [0.0] * num_columns
+    row_height_lst = []
+    bbox_grid = []
+    for row in e_grid:
+        row_height = 0.0
+        row_bboxes = []
+        for j, e in enumerate(row):
+            if is_empty_cell(e):
+                row_bboxes.append(None)
+                continue
+            b = stz.bbox(e)
+            (x1, y1), (x2, y2) = b
+            if x2 - x1 > column_width_lst[j]:
+                column_width_lst[j] = x2 - x1
+            if y1 - y2 > row_height:
+                row_height = y1 - y2
+            row_bboxes.append(b)
+        row_height_lst.append(row_height)
+        bbox_grid.append(row_bboxes)
+    return bbox_grid, column_width_lst, row_height_lst
+
+
+# NOTE: an alignment can be given for all the columns (rows) or as a list with
+# one per column (row).
+def alignment_lst(align, n, valid_aligns):
+    align_lst = [align] * n if isinstance(align, str) else align
+    assert len(align_lst) == n and all(a in valid_aligns for a in align_lst)
+    return align_lst
+
+
+def aligned_start(start, cell_length, length, align, sign):
+    if align == "center":
+        return start + sign * (cell_length - length) / 2.0
+    elif align in ["right", "bottom"]:
+        return start + sign * (cell_length - length)
+    else:
+        return start
+
+
+# NOTE: places the elements in place and returns the corners of the cells
+# (num_rows + 1 lists with num_columns + 1 coordinates). the padding is added
+# on both sides of the contents of each cell. min_column_width and
+# min_row_height also count the padding.
+def grid_layout(e_grid,
+                top_left_cs,
+                horizontal_padding=0.0,
+                vertical_padding=0.0,
+                horizontal_align="center",
+                vertical_align="center",
+                min_column_width=0.0,
+                min_row_height=0.0):
+    bbox_grid, column_width_lst, row_height_lst = grid_cell_sizes(e_grid)
+    column_width_lst = [
+        max(w + 2.0 * horizontal_padding, min_column_width)
+        for w in column_width_lst
+    ]
+    row_height_lst = [
+        max(h + 2.0 * vertical_padding, min_row_height) for h in row_height_lst
+    ]
+    column_align_lst = alignment_lst(horizontal_align, len(column_width_lst),
+                                     horizontal_aligns)
+    row_align_lst = alignment_lst(vertical_align, len(row_height_lst),
+                                  vertical_aligns)
+
+    grid_cs = stz.coords_on_irregular_grid(top_left_cs, column_width_lst,
+                                           row_height_lst)
+    for i, row in enumerate(e_grid):
+        y = grid_cs[i][0][1] - vertical_padding
+        h = row_height_lst[i] - 2.0 * vertical_padding
+        for j, e in enumerate(row):
+            b = bbox_grid[i][j]
+            if b is None:
+                continue
+            (x1, y1), (x2, y2) = b
+            x = grid_cs[i][j][0] + horizontal_padding
+            w = column_width_lst[j] - 2.0 * horizontal_padding
+            to_x = aligned_start(x, w, x2 - x1, column_align_lst[j], 1.0)
+            to_y = aligned_start(y, h, y1 - y2, row_align_lst[i], -1.0)
+            if to_x != x1 or to_y != y1:
+                stz.translate(e, to_x - x1, to_y - y1)
+    return grid_cs
+
+
+# NOTE: for panel grids; e_lst is split into rows of num_columns elements.
+def grid_layout_from_lst(e_lst, num_columns, top_left_cs, **kwargs):
+    e_grid = [
+        e_lst[i:i + num_columns] for i in range(0, len(e_lst), num_columns)
+    ]
+    return grid_layout(e_grid, top_left_cs, **kwargs)
+
+
+# NOTE: horizontal and vertical lines between the cells (e.g., for a table).
+def grid_lines(grid_cs, tikz_str=""):
+    (x1, y1) = grid_cs[0][0]
+    (x2, y2) = grid_cs[-1][-1]
+    horizontal_lines = [
+        stz.line_segment([x1, row_cs[0][1]], [x2, row_cs[0][1]], tikz_str)
+        for row_cs in grid_cs
+    ]
+    vertical_lines = [
+        stz.line_segment([cs[0], y1], [cs[0], y2], tikz_str)
+        for cs in grid_cs[0]
+    ]
+    return [horizontal_lines, vertical_lines]
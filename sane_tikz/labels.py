@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# automatic placement of labels (e.g., latex elements) next to anchor
+# elements. each label has a few candidate positions around its anchor. a
+# greedy pass picks, for each label, the candidate with the least overlap with
+# the shapes of the figure and with the labels already placed (labels with
+# fewer good candidates go first). a few refinement passes then move labels to
+# better candidates given the positions of all the others. the overlapping
+# pairs (candidate-shape and candidate-candidate) are found once with a
+# uniform grid (see spatial_index.py) over the bboxes of the labels (with all
+# their candidates), so each evaluation only looks at the few candidates that
+# conflict with it.
+
+import numpy as np
+import sane_tikz.core as stz
+import sane_tikz.spatial_index as si
+import sane_tikz.text_extent as te
+
+# in order of preference (dx, dy); relative to the anchor bbox.
+candidate_directions = [
+    (1, 1),
+    (-1, 1),
+    (1, -1),
+    (-1, -1),
+    (1, 0),
+    (-1, 0),
+    (0, 1),
+    (0, -1),
+]
+
+
+# NOTE: uses the bbox of the label if it has an extent. otherwise, estimates it
+# from the font metrics (see text_extent.py).
+def estimated_label_size(label):
+    b = stz.bbox(label)
+    width = stz.x_length(b)
+    height = stz.y_length(b)
+    if width > 0.0 and height > 0.0:
+        return width, height
+    else:
+        return te.estimated_size(label)
+
+
+# NOTE: returns a (num_anchors * len(candidate_directions), 4) array with the
+# candidate bboxes of each label (see si.bboxes_to_array) in order.
+def candidate_bboxes_array(anchor_arr, size_arr, spacing):
+    dirs = np.array(candidate_directions, dtype=np.float64)
+    dx = dirs[None, :, 0]
+    dy = dirs[None, :, 1]
+    x1, y1, x2, y2 = [anchor_arr[:, k, None] for k in range(4)]
+    w = size_arr[:, 0, None]
+    h = size_arr[:, 1, None]
+    x = np.where(dx > 0, x2 + spacing + w / 2.0,
+                 np.where(dx < 0, x1 - spacing - w / 2.0, (x1 + x2) / 2.0))
+    y = np.where(dy > 0, y1 + spacing + h / 2.0,
+                 np.where(dy < 0, y2 - spacing - h / 2.0, (y1 + y2) / 2.0))
+    return np.stack([x - w / 2.0, y + h / 2.0, x + w / 2.0, y - h / 2.0],
+                    axis=-1).reshape(-1, 4)
+
+
+# NOTE: bbox of the candidates of each label (see candidate_bboxes_array).
+def label_bboxes_array(cand_arr, num_dirs):
+    arr = cand_arr.reshape(-1, num_dirs, 4)
+    return np.stack([
+        arr[:, :, 0].min(axis=1), arr[:, :, 1].max(axis=1),
+        arr[:, :, 2].max(axis=1), arr[:, :, 3].min(axis=1)
+    ],
+                    axis=1)
+
+
+# NOTE: overlap area of each row of bboxes_arr with the corresponding row of
+# other_bboxes_arr (see si.bboxes_to_array).
+def overlap_areas_array(arr, other_arr):
+    dx = np.minimum(arr[:, 2], other_arr[:, 2]) - np.maximum(
+        arr[:, 0], other_arr[:, 0])
+    dy = np.minimum(arr[:, 1], other_arr[:, 1]) - np.maximum(
+        arr[:, 3], other_arr[:, 3])
+    return np.maximum(dx, 0.0) * np.maximum(dy, 0.0)
+
+
+# NOTE: labels are moved in place (their bbox center goes to the chosen
+# candidate). returns the index of the chosen candidate for each label (see
+# candidate_directions).
+def place_labels(label_lst,
+                 anchor_lst,
+                 obstacles=None,
+                 spacing=0.1,
+                 label_size_fn=estimated_label_size,
+                 num_refinement_passes=2,
+                 obstacle_weight=1.0,
+                 label_weight=2.0,
+                 preference_weight=1.0e-4):
+    assert len(label_lst) == len(anchor_lst)
+    if obstacles is None:
+        obstacles = anchor_lst
+    num_labels = len(label_lst)
+    num_dirs = len(candidate_directions)
+    if num_labels == 0:
+        return []
+
+    size_arr = np.array([label_size_fn(lab) for lab in label_lst],
+                        dtype=np.float64)
+    cand_arr = candidate_bboxes_array(
+        si.bboxes_to_array([stz.bbox(a) for a in anchor_lst]), size_arr,
+        spacing)
+    obstacle_arr = si.bboxes_to_array(
+        [stz.bbox(e) for e in stz.iter_leaf_elements(obstacles)])
+    # NOTE: the joins are done with the bbox of all the candidates of each
+    # label (eight times fewer bboxes than candidates, and the candidates of
+    # the same label are never paired); the pairs of candidates are then
+    # checked for each pair of labels found.
+    label_arr = label_bboxes_array(cand_arr, num_dirs)
+    # NOTE: the cell size is chosen from the label sizes (labels are often
+    # elongated, so the mean of the sides works better than the longest side).
+    cell_size = max(float(np.median(size_arr.mean(axis=1))), 1.0e-3)
+    dir_ids = np.arange(num_dirs)
+
+    # the overlap with the shapes does not change, so it is computed once.
+    label_ids, other_ids = si.overlapping_pairs_between(label_arr, obstacle_arr,
+                                                        cell_size)
+    ids = (label_ids[:, None] * num_dirs + dir_ids[None, :]).ravel()
+    other_ids = np.repeat(other_ids, num_dirs)
+    obstacle_area = np.bincount(ids,
+                                weights=overlap_areas_array(
+                                    cand_arr[ids], obstacle_arr[other_ids]),
+                                minlength=len(cand_arr))
+    base_cost = (
+        obstacle_weight * obstacle_area +
+        preference_weight * np.tile(np.arange(num_dirs), num_labels)).tolist()
+
+    # conflicting candidates of different labels (sorted by candidate).
+    label_ids, other_label_ids = si.overlapping_pairs_between(
+        label_arr, label_arr, cell_size)
+    # NOTE: if the labels are crowded, most pairs of candidates of
+    # overlapping labels do not overlap, so the candidates are joined directly.
+    if len(label_ids) * num_dirs <= 4 * len(cand_arr):
+        pair_shape = (len(label_ids), num_dirs, num_dirs)
+        ids = np.broadcast_to(
+            label_ids[:, None, None] * num_dirs + dir_ids[None, :, None],
+            pair_shape).ravel()
+        other_ids = np.broadcast_to(
+            other_label_ids[:, None, None] * num_dirs + dir_ids[None, None, :],
+            pair_shape).ravel()
+        areas = overlap_areas_array(cand_arr[ids], cand_arr[other_ids])
+        keep = areas > 0.0
+    else:
+        ids, other_ids = si.overlapping_pairs_between(cand_arr, cand_arr,
+                                                      cell_size)
+        areas = overlap_areas_array(cand_arr[ids], cand_arr[other_ids])
+        keep = (ids // num_dirs != other_ids // num_dirs) & (areas > 0.0)
+    ids, other_ids = (np.concatenate([ids[keep], other_ids[keep]]),
+                      np.concatenate([other_ids[keep], ids[keep]]))
+    areas = np.tile(label_weight * areas[keep], 2)
+    order = np.argsort(ids, kind="stable")
+    other_ids = other_ids[order].tolist()
+    areas = areas[order].tolist()
+    indptr = np.concatenate([[0],
+                             np.cumsum(np.bincount(ids,
+                                                   minlength=len(cand_arr)))
+                            ]).tolist()
+
+    # label_cost[c] is the overlap of candidate c with the placed labels.
+    label_cost = [0.0] * len(cand_arr)
+
+    def add_label(c, sign):
+        for k in range(indptr[c], indptr[c + 1]):
+            label_cost[other_ids[k]] += sign * areas[k]
+
+    def best_candidate(i):
+        lo = i * num_dirs
+        costs = [base_cost[c] + label_cost[c] for c in range(lo, lo + num_dirs)]
+        return costs.index(min(costs))
+
+    # labels with fewer free candidates (w.r.t. the shapes) go first.
+    num_free = (obstacle_area.reshape(num_labels, num_dirs) == 0.0).sum(axis=1)
+    order = np.argsort(num_free, kind="stable").tolist()
+
+    choices = [None] * num_labels
+    for i in order:
+        choices[i] = best_candidate(i)
+        add_label(i * num_dirs + choices[i], 1.0)
+
+    for _ in range(num_refinement_passes):
+        num_changed = 0
+        for i in order:
+            c = i * num_dirs + choices[i]
+            # NOTE: a label without overlaps at its preferred spot stays.
+            if label_cost[c] == 0.0 and base_cost[c] == base_cost[i * num_dirs]:
+                continue
+            add_label(c, -1.0)
+            j = best_candidate(i)
+            if j != choices[i]:
+                num_changed += 1
+                choices[i] = j
+            add_label(i * num_dirs + j, 1.0)
+        if num_changed == 0:
+            break
+
+    for i, lab in enumerate(label_lst):
+        x1, y1, x2, y2 = cand_arr[i * num_dirs + choices[i]].tolist()
+        stz.translate_bbox_center_to_coords(lab, [(x1 + x2) / 2.0,
+                                                  (y1 + y2) / 2.0])
+    return choices
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# obstacle-avoiding orthogonal connectors. the bboxes of the obstacles (grown
+# by a margin) give the horizontal and vertical lines along which connectors
+# may run. the router (built once and shared by all the connectors) keeps
+# these lines and, for each cell of the grid that they form, whether it is
+# inside an obstacle. each connector is routed with a* over the sparse graph of
+# the crossings of these lines (plus the lines through its own endpoints),
+# with a cost of length plus a penalty per bend.
+#
+# router = obstacle_router(module_lst, margin=0.1)
+# e = routed_connector(router, from_cs, to_cs, from_side="right",
+#                      to_side="left")
+
+import heapq
+from bisect import bisect_left, bisect_right
+import numpy as np
+import sane_tikz.core as stz
+import sane_tikz.spatial_index as si
+
+sides = ["right", "top", "left", "bottom"]
+
+# NOTE: unit vectors for the directions of movement (in the order of sides,
+# i.e., leaving through a side moves in its direction).
+direction_vecs = [(1.0, 0.0), (0.0, 1.0), (-1.0, 0.0), (0.0, -1.0)]
+
+
+# NOTE: lines and strips between them are numbered together (2 * i for the
+# line vs[i] and 2 * i + 1 for the strip between vs[i] and vs[i + 1]). returns
+# None outside of the lines.
+def line_or_strip(vs, v):
+    i = bisect_left(vs, v)
+    if i < len(vs) and vs[i] == v:
+        return 2 * i
+    if i == 0 or i == len(vs):
+        return None
+    return 2 * i - 1
+
+
+def obstacle_router(obstacle_lst, margin=0.1):
+    bbox_arr = si.bboxes_to_array([stz.bbox(e) for e in obstacle_lst])
+    bbox_arr += np.array([-margin, margin, margin, -margin])
+    xs = np.unique(np.concatenate([bbox_arr[:, 0], bbox_arr[:, 2]]))
+    ys = np.unique(np.concatenate([bbox_arr[:, 3], bbox_arr[:, 1]]))
+    # NOTE: counts the obstacles whose interior covers each line or strip (a
+    # 2d difference array with one extra row and column).
+    diff = np.zeros((2 * len(xs), 2 * len(ys)), dtype=np.int32)
+    if len(bbox_arr) > 0:
+        i1 = 2 * np.searchsorted(xs, bbox_arr[:, 0]) + 1
+        i2 = 2 * np.searchsorted(xs, bbox_arr[:, 2])
+        j1 = 2 * np.searchsorted(ys, bbox_arr[:, 3]) + 1
+        j2 = 2 * np.searchsorted(ys, bbox_arr[:, 1])
+        np.add.at(diff, (i1, j1), 1)
+        np.add.at(diff, (i2, j1), -1)
+        np.add.at(diff, (i1, j2), -1)
+        np.add.at(diff, (i2, j2), 1)
+    is_covered = diff.cumsum(axis=0).cumsum(axis=1) > 0
+    return {
+        "margin": margin,
+        "bbox_arr": bbox_arr,
+        "xs": xs.tolist(),
+        "ys": ys.tolist(),
+        "is_covered": is_covered
+    }
+
+
+def is_inside_obstacle(router, cs):
+    arr = router["bbox_arr"]
+    x, y = cs
+    return ((arr[:, 0] < x) & (x < arr[:, 2]) & (arr[:, 3] < y) &
+            (y < arr[:, 1]))
+
+
+# NOTE: the side of the (grown) obstacle around cs that is closest to it, or
+# None if cs is not inside an obstacle.
+def closest_side(router, cs):
+    ids = np.nonzero(is_inside_obstacle(router, cs))[0]
+    if len(ids) == 0:
+        return None
+    x1, y1, x2, y2 = router["bbox_arr"][ids[0]]
+    x, y = cs
+    distances = [x2 - x, y1 - y, x - x1, y - y2]
+    return sides[int(np.argmin(distances))]
+
+
+# NOTE: moves cs in the direction of side until it is out of the obstacles.
+def stub_end_coords(router, cs, side):
+    arr = router["bbox_arr"]
+    k = sides.index(side)
+    x, y = cs
+    while True:
+        ids = np.nonzero(is_inside_obstacle(router, [x, y]))[0]
+        if len(ids) == 0:
+            return [x, y]
+        if k == 0:
+            x = float(arr[ids, 2].max())
+        elif k == 1:
+            y = float(arr[ids, 1].max())
+        elif k == 2:
+            x = float(arr[ids, 0].min())
+        else:
+            y = float(arr[ids, 3].min())
+
+
+def next_coord(vs, extra_vs, v, sign):
+    candidates = []
+    for lst in [vs, extra_vs]:
+        if sign > 0:
+            i = bisect_right(lst, v)
+            if i < len(lst):
+                candidates.append(lst[i])
+        else:
+            i = bisect_left(lst, v) - 1
+            if i >= 0:
+                candidates.append(lst[i])
+    if len(candidates) == 0:
+        return None
+    return min(candidates) if sign > 0 else max(candidates)
+
+
+# NOTE: lower bound on the number of bends to reach a point at (dx, dy) when
+# moving in direction k.
+def min_num_bends(k, dx, dy):
+    ux, uy = direction_vecs[k]
+    ahead = dx * ux + dy * uy
+    across = dx * uy - dy * ux
+    if across == 0.0:
+        return 0 if ahead >= 0.0 else 2
+    return 1 if ahead >= 0.0 else 2
+
+
+# NOTE: removes the points in the middle of straight runs.
+def simplified_cs_lst(cs_lst):
+    out = []
+    for cs in cs_lst:
+        if len(out) > 0 and out[-1] == cs:
+            continue
+        if len(out) >= 2:
+            (x0, y0), (x1, y1) = out[-2], out[-1]
+            if (x0 == x1 == cs[0]) or (y0 == y1 == cs[1]):
+                out[-1] = cs
+                continue
+        out.append(cs)
+    return out
+
+
+# NOTE: returns the coordinates of an orthogonal path from from_cs to to_cs
+# that does not go through the (grown) obstacles. from_side and to_side are the
+# sides of the endpoint elements where the connector attaches (inferred for
+# endpoints inside an obstacle; any direction for the ones outside). raises
+# ValueError if there is no such path.
+def route(router,
+          from_cs,
+          to_cs,
+          from_side=None,
+          to_side=None,
+          bend_penalty=0.5):
+    from_cs = [float(v) for v in from_cs]
+    to_cs = [float(v) for v in to_cs]
+    if from_side is None:
+        from_side = closest_side(router, from_cs)
+    if to_side is None:
+        to_side = closest_side(router, to_cs)
+    assert from_side is None or from_side in sides
+    assert to_side is None or to_side in sides
+
+    start_cs = from_cs
+    if from_side is not None:
+        start_cs = stub_end_coords(router, from_cs, from_side)
+        start_ks = [sides.index(from_side)]
+    else:
+        start_ks = [0, 1, 2, 3]
+    goal_cs = to_cs
+    arrival_k = None
+    if to_side is not None:
+        goal_cs = stub_end_coords(router, to_cs, to_side)
+        arrival_k = (sides.index(to_side) + 2) % 4
+    goal_x, goal_y = goal_cs
+
+    xs = router["xs"]
+    ys = router["ys"]
+    is_covered = router["is_covered"]
+    extra_xs = sorted(set([start_cs[0], goal_x]))
+    extra_ys = sorted(set([start_cs[1], goal_y]))
+
+    def priority(x, y, k, g):
+        dx = goal_x - x
+        dy = goal_y - y
+        return g + abs(dx) + abs(dy) + bend_penalty * min_num_bends(k, dx, dy)
+
+    # NOTE: ties go to the longest partial paths (straight towards the goal).
+    heap = []
+    count = 0
+    for k in start_ks:
+        s = (start_cs[0], start_cs[1], k)
+        heapq.heappush(
+            heap,
+            (priority(start_cs[0], start_cs[1], k, 0.0), 0.0, count, s, None))
+        count += 1
+    parents = {}
+    goal_state = (goal_x, goal_y, None)
+    while len(heap) > 0:
+        _, neg_g, _, s, parent = heapq.heappop(heap)
+        if s in parents:
+            continue
+        parents[s] = parent
+        if s == goal_state:
+            break
+        g = -neg_g
+        x, y, k = s
+        if x == goal_x and y == goal_y:
+            if arrival_k is not None and k != arrival_k:
+                final_g = g + bend_penalty
+            else:
+                final_g = g
+            heapq.heappush(heap, (final_g, -final_g, count, goal_state, s))
+            count += 1
+            continue
+
+        for next_k in [k, (k + 1) % 4, (k + 3) % 4]:
+            ux, uy = direction_vecs[next_k]
+            if uy == 0.0:
+                next_x = next_coord(xs, extra_xs, x, ux)
+                if next_x is None:
+                    continue
+                next_y = y
+                i = line_or_strip(xs, (x + next_x) / 2.0)
+                j = line_or_strip(ys, y)
+                step = abs(next_x - x)
+            else:
+                next_y = next_coord(ys, extra_ys, y, uy)
+                if next_y is None:
+                    continue
+                next_x = x
+                i = line_or_strip(xs, x)
+                j = line_or_strip(ys, (y + next_y) / 2.0)
+                step = abs(next_y - y)
+            if i is not None and j is not None and is_covered[i, j]:
+                continue
+            t = (next_x, next_y, next_k)
+            if t in parents:
+                continue
+            next_g = g + step + (bend_penalty if next_k != k else 0.0)
+            heapq.heappush(heap, (priority(next_x, next_y, next_k,
+                                           next_g), -next_g, count, t, s))
+            count += 1
+    else:
+        raise ValueError("no orthogonal route from %s to %s." %
+                         (from_cs, to_cs))
+
+    cs_lst = []
+    s = parents[goal_state]
+    while s is not None:
+        cs_lst.append([s[0], s[1]])
+        s = parents[s]
+    cs_lst.reverse()
+    return simplified_cs_lst([from_cs] + cs_lst + [to_cs])
+
+
+def routed_connector(router,
+                     from_cs,
+                     to_cs,
+                     from_side=None,
+                     to_side=None,
+                     tikz_str="",
+                     bend_penalty=0.5):
+    cs_lst = route(router, from_cs, to_cs, from_side, to_side, bend_penalty)
+    return stz.open_path(cs_lst, tikz_str)
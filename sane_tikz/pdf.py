@@ -0,0 +1,666 @@
+# -*- coding: utf-8 -*-
+
+# pdf backend (no tex needed). writes a one page pdf with the figure as vector
+# graphics: the content stream is generated as the elements are visited (as in
+# iter_tikz) and compressed as it is written, so memory does not grow with the
+# size of the figure. the coordinates are kept in cm (the content stream
+# starts by scaling cm to pt). the tikz options of each element are mapped to
+# pdf graphics state with tikz_style.py (opacities through extended graphics
+# states). circles, ellipses, arcs, and rounded corners are cubic beziers.
+# latex elements become text in the standard pdf fonts (times, helvetica,
+# courier, and symbol for greek letters and math symbols) with the expression
+# approximated as in text_extent.text_runs; lines are placed with the widths
+# estimated by text_extent.py, so they are only approximately centered. images
+# are drawn as gray boxes. symbols emitted as pics become form xobjects.
+# strings (raw tikz code) are skipped.
+#
+# draw_to_pdf(e, "figure.pdf", name2color)
+
+import itertools
+import math
+import zlib
+import sane_tikz.core as stz
+import sane_tikz.text_extent as te
+import sane_tikz.tikz_style as ts
+
+num = stz.stripped_number_to_str_fn(4)
+
+cm_in_pt = 72.0 / 2.54
+
+# NOTE: fonts of text_extent.py to the standard 14 pdf fonts (no embedding).
+base_fonts = {
+    "rm": "Times-Roman",
+    "it": "Times-Italic",
+    "bf": "Times-Bold",
+    "sf": "Helvetica",
+    "tt": "Courier",
+    "sym": "Symbol"
+}
+
+# NOTE: codes in the symbol font for the characters of
+# text_extent.symbol_to_unicode that are not in the text fonts.
+symbol_font_codes = {
+    "\u03b1": 0x61, "\u03b2": 0x62, "\u03b3": 0x67, "\u03b4": 0x64,
+    "\u03f5": 0x65, "\u03b5": 0x65, "\u03b6": 0x7a, "\u03b7": 0x68,
+    "\u03b8": 0x71, "\u03b9": 0x69, "\u03ba": 0x6b, "\u03bb": 0x6c,
+    "\u03bc": 0x6d, "\u03bd": 0x6e, "\u03be": 0x78, "\u03c0": 0x70,
+    "\u03c1": 0x72, "\u03c3": 0x73, "\u03c4": 0x74, "\u03c5": 0x75,
+    "\u03d5": 0x6a, "\u03c6": 0x66, "\u03c7": 0x63, "\u03c8": 0x79,
+    "\u03c9": 0x77, "\u0393": 0x47, "\u0394": 0x44, "\u0398": 0x51,
+    "\u039b": 0x4c, "\u039e": 0x58, "\u03a0": 0x50, "\u03a3": 0x53,
+    "\u03a6": 0x46, "\u03a8": 0x59, "\u03a9": 0x57, "\u2212": 0x2d,
+    "\u22c5": 0xd7, "\u2213": 0xb1, "\u2264": 0xa3, "\u2265": 0xb3,
+    "\u2260": 0xb9, "\u2248": 0xbb, "\u223c": 0x7e, "\u2261": 0xba,
+    "\u2208": 0xce, "\u2209": 0xcf, "\u2282": 0xcc, "\u2286": 0xcd,
+    "\u222a": 0xc8, "\u2229": 0xc7, "\u2192": 0xae, "\u2190": 0xac,
+    "\u21a6": 0xae, "\u21d2": 0xde, "\u2194": 0xab, "\u221e": 0xa5,
+    "\u2202": 0xb6, "\u2207": 0xd1, "\u2200": 0x22, "\u2203": 0x24,
+    "\u22ef": 0xbc, "\u2211": 0xe5, "\u220f": 0xd5, "\u222b": 0xf2,
+    "\u2032": 0xa2, "\u27e8": 0xe1, "\u27e9": 0xf1, "\u2016": 0x7c,
+    "\u221a": 0xd6
+} # yapf: disable
+
+# NOTE: characters that are written as others (\ell is an l).
+text_fallbacks = {"\u2113": "l"}
+
+# NOTE: thin spaces (around math operators) are kerns of 1/6 em.
+thin_space_kern = 167
+
+# NOTE: circles and quarter arcs as cubic beziers.
+bezier_circle_factor = 4.0 / 3.0 * (math.sqrt(2.0) - 1.0)
+
+image_placeholder_rgb = (220, 220, 220)
+
+
+def pdf_coords(cs):
+    return "%s %s" % (num(cs[0]), num(cs[1]))
+
+
+def pdf_matrix(m):
+    return "%s %s %s %s %s %s cm" % (num(m[0][0]), num(m[1][0]), num(
+        m[0][1]), num(m[1][1]), num(m[0][2]), num(m[1][2]))
+
+
+def pdf_rgb(rgb):
+    return " ".join([num(v / 255.0) for v in rgb])
+
+
+# NOTE: the state of a drawing (styles are parsed once per tikz_str and the
+# resources are collected for the page).
+def pdf_context(name2color_in_rgb=None):
+    return {
+        "name2color": name2color_in_rgb,
+        "styles": {},
+        "fonts": set(),
+        "gstates": {},
+        "symbols": {}
+    }
+
+
+def gstate_name(ctx, stroke_opacity, fill_opacity):
+    key = (stroke_opacity, fill_opacity)
+    if key not in ctx["gstates"]:
+        ctx["gstates"][key] = "GS%d" % (len(ctx["gstates"]) + 1)
+    return ctx["gstates"][key]
+
+
+def font_name(ctx, font):
+    ctx["fonts"].add(font)
+    return "F" + font
+
+
+# NOTE: returns the style, the operators that set it, and the operator that
+# paints the path (nonzero rule, as in tikz).
+def context_style(ctx, tikz_str, draw=True):
+    key = (tikz_str, draw)
+    if key not in ctx["styles"]:
+        style = ts.parse_style(tikz_str, ctx["name2color"], draw)
+        ops = []
+        if style["stroke"] is not None:
+            ops.append("%s RG %s w" %
+                       (pdf_rgb(style["stroke"]), num(style["line_width"])))
+            dashes = ts.dash_lengths(style)
+            if len(dashes) > 0:
+                ops.append("[%s] 0 d" % " ".join([num(x) for x in dashes]))
+            if style["line_cap"] != "butt":
+                ops.append("%d J" % (1 if style["line_cap"] == "round" else 2))
+            if style["line_join"] != "miter":
+                ops.append("%d j" % (1 if style["line_join"] == "round" else 2))
+        if style["fill"] is not None:
+            ops.append("%s rg" % pdf_rgb(style["fill"]))
+        if style["stroke_opacity"] != 1.0 or style["fill_opacity"] != 1.0:
+            ops.append("/%s gs" % gstate_name(ctx, style["stroke_opacity"],
+                                              style["fill_opacity"]))
+        if style["stroke"] is not None:
+            paint = "B" if style["fill"] is not None else "S"
+        else:
+            paint = "f" if style["fill"] is not None else "n"
+        ctx["styles"][key] = (style, " ".join(ops), paint)
+    return ctx["styles"][key]
+
+
+#### paths as lists of segments (op, coords) with op in m, l, c, and h.
+def path_ops(segs):
+    return " ".join([
+        " ".join([pdf_coords(cs)
+                  for cs in cs_lst] + [op])
+        for op, cs_lst in segs
+    ])
+
+
+def polyline_segments(cs_lst, is_closed):
+    cs_lst = stz.coords_lst_to_tuples(cs_lst)
+    segs = [("m", [cs_lst[0]])] + [("l", [cs]) for cs in cs_lst[1:]]
+    return segs + [("h", [])] if is_closed else segs
+
+
+def quadratic_to_cubic(from_cs, c_cs, to_cs):
+    f = 2.0 / 3.0
+    c1_cs = [
+        from_cs[0] + f * (c_cs[0] - from_cs[0]),
+        from_cs[1] + f * (c_cs[1] - from_cs[1])
+    ]
+    c2_cs = [
+        to_cs[0] + f * (c_cs[0] - to_cs[0]), to_cs[1] + f * (c_cs[1] - to_cs[1])
+    ]
+    return [c1_cs, c2_cs, to_cs]
+
+
+# NOTE: rounded corners are curves between the points at distance radius from
+# each corner (at most half of each side), as in svg.path_data.
+def rounded_segments(cs_lst, is_closed, radius):
+    cs_lst = stz.coords_lst_to_tuples(cs_lst)
+    n = len(cs_lst)
+    if radius <= 0.0 or n < 3:
+        return polyline_segments(cs_lst, is_closed)
+
+    def cut(cs, other_cs):
+        dx = other_cs[0] - cs[0]
+        dy = other_cs[1] - cs[1]
+        length = math.sqrt(dx * dx + dy * dy)
+        if length == 0.0:
+            return cs
+        t = min(radius, length / 2.0) / length
+        return [cs[0] + t * dx, cs[1] + t * dy]
+
+    segs = [] if is_closed else [("m", [cs_lst[0]])]
+    for i in range(n) if is_closed else range(1, n - 1):
+        cs = cs_lst[i]
+        from_cs = cut(cs, cs_lst[i - 1])
+        segs.append(("m" if len(segs) == 0 else "l", [from_cs]))
+        segs.append(
+            ("c", quadratic_to_cubic(from_cs, cs, cut(cs,
+                                                      cs_lst[(i + 1) % n]))))
+    if is_closed:
+        return segs + [("h", [])]
+    return segs + [("l", [cs_lst[-1]])]
+
+
+# NOTE: the arc starts at start_cs (as in tikz) and is split into pieces of at
+# most 90 degrees (of the parametric angle for ellipses).
+def arc_segments(start_cs, rx, ry, start_angle, end_angle):
+    a0 = stz.degrees_to_radians(start_angle)
+    a1 = stz.degrees_to_radians(end_angle)
+    cx = start_cs[0] - rx * math.cos(a0)
+    cy = start_cs[1] - ry * math.sin(a0)
+    num_pieces = max(1, int(math.ceil(abs(a1 - a0) / (math.pi / 2.0) - 1.0e-9)))
+    da = (a1 - a0) / num_pieces
+    k = 4.0 / 3.0 * math.tan(da / 4.0)
+    segs = [("m", [[cx + rx * math.cos(a0), cy + ry * math.sin(a0)]])]
+    for i in range(num_pieces):
+        a = a0 + i * da
+        b = a + da
+        segs.append(("c", [[
+            cx + rx * (math.cos(a) - k * math.sin(a)),
+            cy + ry * (math.sin(a) + k * math.cos(a))
+        ],
+                           [
+                               cx + rx * (math.cos(b) + k * math.sin(b)),
+                               cy + ry * (math.sin(b) - k * math.cos(b))
+                           ], [cx + rx * math.cos(b), cy + ry * math.sin(b)]]))
+    return segs
+
+
+def ellipse_segments(center_cs, rx, ry):
+    x, y = center_cs
+    kx = bezier_circle_factor * rx
+    ky = bezier_circle_factor * ry
+    return [("m", [[x + rx, y]]),
+            ("c", [[x + rx, y + ky], [x + kx, y + ry], [x, y + ry]]),
+            ("c", [[x - kx, y + ry], [x - rx, y + ky], [x - rx, y]]),
+            ("c", [[x - rx, y - ky], [x - kx, y - ry], [x, y - ry]]),
+            ("c", [[x + kx, y - ry], [x + rx, y - ky], [x + rx, y]]), ("h", [])]
+
+
+def reversed_segments(segs):
+    out = [("m", [segs[-1][1][-1]])]
+    for i in range(len(segs) - 1, 0, -1):
+        op, cs_lst = segs[i]
+        end_cs = segs[i - 1][1][-1]
+        out.append((op, list(reversed(cs_lst[:-1])) + [end_cs]))
+    return out
+
+
+# NOTE: the arrow head is drawn at the end of the path and the end is moved
+# back to the base of the head (curves keep their direction at the end).
+def end_arrow_head(segs, line_width):
+    op, cs_lst = segs[-1]
+    tip_cs = cs_lst[-1]
+    from_lst = list(reversed(cs_lst[:-1])) + [segs[-2][1][-1]]
+    from_cs = None
+    for cs in from_lst:
+        if cs[0] != tip_cs[0] or cs[1] != tip_cs[1]:
+            from_cs = cs
+            break
+    if from_cs is None:
+        return segs, None
+    head = ts.arrow_head_coords(tip_cs, from_cs, line_width)
+    dx = tip_cs[0] - from_cs[0]
+    dy = tip_cs[1] - from_cs[1]
+    length = math.sqrt(dx * dx + dy * dy)
+    back = min(8.0 * line_width, length) / length
+    shift_x = -back * dx
+    shift_y = -back * dy
+    if op == "c":
+        cs_lst = [
+            cs_lst[0], [cs_lst[1][0] + shift_x, cs_lst[1][1] + shift_y],
+            [tip_cs[0] + shift_x, tip_cs[1] + shift_y]
+        ]
+    else:
+        cs_lst = [[tip_cs[0] + shift_x, tip_cs[1] + shift_y]]
+    return segs[:-1] + [(op, cs_lst)], head
+
+
+def segments_with_arrow_heads(segs, style):
+    heads = []
+    if len(segs) < 2:
+        return segs, heads
+    if style["end_arrow"]:
+        segs, head = end_arrow_head(segs, style["line_width"])
+        heads.append(head)
+    if style["start_arrow"]:
+        segs, head = end_arrow_head(reversed_segments(segs),
+                                    style["line_width"])
+        segs = reversed_segments(segs)
+        heads.append(head)
+    return segs, [h for h in heads if h is not None]
+
+
+def pdf_shape(ctx, segs, tikz_str, with_arrows=False):
+    style, ops, paint = context_style(ctx, tikz_str)
+    heads = []
+    if (with_arrows and style["stroke"] is not None and
+        (style["start_arrow"] or style["end_arrow"])):
+        segs, heads = segments_with_arrow_heads(segs, style)
+    lines = ["q " + ops, path_ops(segs) + " " + paint]
+    if len(heads) > 0:
+        head_ops = ["%s rg" % pdf_rgb(style["stroke"])]
+        if style["stroke_opacity"] != 1.0:
+            head_ops.append("/%s gs" % gstate_name(ctx, style["stroke_opacity"],
+                                                   style["stroke_opacity"]))
+        lines.append(" ".join(head_ops))
+        for head in heads:
+            lines.append(path_ops(polyline_segments(head, True)) + " f")
+    lines.append("Q")
+    return "\n".join(lines)
+
+
+def pdf_open_path(ctx, e):
+    style, _, _ = context_style(ctx, e["tikz_str"])
+    segs = rounded_segments(e["cs_lst"], False, style["rounded_corners"])
+    return pdf_shape(ctx, segs, e["tikz_str"], True)
+
+
+def pdf_closed_path(ctx, e):
+    style, _, _ = context_style(ctx, e["tikz_str"])
+    segs = rounded_segments(e["cs_lst"], True, style["rounded_corners"])
+    return pdf_shape(ctx, segs, e["tikz_str"])
+
+
+def pdf_circle(ctx, e):
+    return pdf_shape(ctx,
+                     ellipse_segments(e["center_cs"], e["radius"], e["radius"]),
+                     e["tikz_str"])
+
+
+def pdf_ellipse(ctx, e):
+    return pdf_shape(
+        ctx,
+        ellipse_segments(e["center_cs"], e["horizontal_radius"],
+                         e["vertical_radius"]), e["tikz_str"])
+
+
+def pdf_circular_arc(ctx, e):
+    segs = arc_segments(e["center_cs"], e["radius"], e["radius"],
+                        e["start_angle"], e["end_angle"])
+    return pdf_shape(ctx, segs, e["tikz_str"], True)
+
+
+def pdf_elliptical_arc(ctx, e):
+    segs = arc_segments(e["center_cs"], e["horizontal_radius"],
+                        e["vertical_radius"], e["start_angle"], e["end_angle"])
+    return pdf_shape(ctx, segs, e["tikz_str"], True)
+
+
+def pdf_bezier(ctx, e):
+    segs = [("m", [e["from_cs"]]), ("c", [e["c1_cs"], e["c2_cs"], e["to_cs"]])]
+    return pdf_shape(ctx, segs, e["tikz_str"], True)
+
+
+#### text
+def node_alignment(tikz_str):
+    for s in te.split_tikz_options(tikz_str):
+        if s.startswith("align"):
+            return s.split("=", 1)[1].strip()
+    return "center"
+
+
+# NOTE: splits the text of a run into pieces (font, hex string) and kerns
+# (for thin spaces). characters that are not in the fonts become ?.
+def text_pieces(text, font):
+    pieces = []
+    for c in text:
+        if c == "\u2009":
+            pieces.append(thin_space_kern)
+            continue
+        c = text_fallbacks.get(c, c)
+        try:
+            c_font, code = font, ord(c.encode("cp1252"))
+        except UnicodeEncodeError:
+            c_font, code = "sym", symbol_font_codes.get(c, ord("?"))
+        if (len(pieces) > 0 and not isinstance(pieces[-1], int) and
+                pieces[-1][0] == c_font):
+            pieces[-1] = (c_font, pieces[-1][1] + "%02x" % code)
+        else:
+            pieces.append((c_font, "%02x" % code))
+    return pieces
+
+
+# NOTE: the width estimated by text_extent.py (in pt).
+def run_width_in_pt(run):
+    text, font, size, _ = run
+    state = {"size": size, "font": font, "math": False, "shift": 0.0}
+    w = 0.0
+    for c in text:
+        if c == "\u2009":
+            w += size * thin_space_kern / 1000.0
+        else:
+            w += te.char_metrics(c, state)[0]
+    return w
+
+
+# NOTE: the operators that show the runs of a line (with the text matrix
+# already at the start of the line).
+def line_text_ops(ctx, line):
+    ops = []
+    current_font = None
+    current_shift = 0.0
+    for text, font, size, shift in line:
+        if shift != current_shift:
+            ops.append("%s Ts" % num(shift * te.pt_in_cm))
+            current_shift = shift
+        tj = []
+        for piece in text_pieces(text, font):
+            c_font, hex_str = ((font,
+                                None) if isinstance(piece, int) else piece)
+            # NOTE: kerns are relative to the size of the current font.
+            if (current_font is None or current_font[1] != size or
+                    hex_str is not None and c_font != current_font[0]):
+                if len(tj) > 0:
+                    ops.append("[%s] TJ" % " ".join(tj))
+                    tj = []
+                ops.append("/%s %s Tf" %
+                           (font_name(ctx, c_font), num(size * te.pt_in_cm)))
+                current_font = (c_font, size)
+            tj.append("-%d" % piece if hex_str is None else "<%s>" % hex_str)
+        if len(tj) > 0:
+            ops.append("[%s] TJ" % " ".join(tj))
+    if current_shift != 0.0:
+        ops.append("0 Ts")
+    return ops
+
+
+# NOTE: the box of the node is the one estimated by text_extent.py (the text
+# is not wrapped for text width). the lines are aligned with the align option
+# and rotated around the coordinates of the node.
+def pdf_latex(ctx, e):
+    ((x1, y1), (x2, y2)), xsep, ysep, h, opts, state = te.estimated_node_box(
+        e["expr"], e["tikz_str"])
+    em = state["size"]
+    lines = ["q 1 0 0 1 %s cm" % pdf_coords(e["cs"])]
+    if opts["rotate"] != 0.0:
+        a = stz.degrees_to_radians(opts["rotate"])
+        lines.append("%s %s %s %s 0 0 cm" % (num(math.cos(a)), num(
+            math.sin(a)), num(-math.sin(a)), num(math.cos(a))))
+    style, ops, paint = context_style(ctx, e["tikz_str"], draw=False)
+    if style["stroke"] is not None or style["fill"] is not None:
+        lines.append("q %s %s %s %s %s re %s Q" %
+                     (ops, num(x1), num(y2), num(x2 - x1), num(y1 - y2), paint))
+
+    text_rgb = style["text"] if style["text"] is not None else (0, 0, 0)
+    text_ops = ["%s rg" % pdf_rgb(text_rgb)]
+    if style["text_opacity"] != 1.0:
+        text_ops.append("/%s gs" % gstate_name(ctx, 1.0, style["text_opacity"]))
+    lines.append(" ".join(text_ops) + " BT")
+    align = node_alignment(e["tikz_str"])
+    baseline_y = y1 - ysep - h
+    for line in te.text_runs(e["expr"], em, state["font"]):
+        if len(line) > 0:
+            w = sum([run_width_in_pt(run) for run in line]) * te.pt_in_cm
+            if align == "left":
+                text_x = x1 + xsep
+            elif align == "right":
+                text_x = x2 - xsep - w
+            else:
+                text_x = (x1 + x2 - w) / 2.0
+            lines.append("1 0 0 1 %s Tm" % pdf_coords([text_x, baseline_y]))
+            lines.extend(line_text_ops(ctx, line))
+        baseline_y -= te.baselineskip_factor * em * te.pt_in_cm
+    lines.append("ET Q")
+    return "\n".join(lines)
+
+
+def pdf_image(ctx, e):
+    (x1, y1), (x2, y2) = stz.bbox_image(e)
+    return "q %s rg %s %s %s %s re f Q" % (pdf_rgb(image_placeholder_rgb),
+                                           num(x1), num(y2), num(x2 - x1),
+                                           num(y1 - y2))
+
+
+def pdf_symbol_instance(ctx, e):
+    return "q %s /%s Do Q" % (pdf_matrix(
+        e["matrix"]), ctx["symbols"][e["symbol"]["name"]][0])
+
+
+# NOTE: new element types can be drawn by registering a function of the
+# context and the element that returns the content stream operators.
+type_to_pdf_fn = {
+    "open_path": pdf_open_path,
+    "closed_path": pdf_closed_path,
+    "circle": pdf_circle,
+    "ellipse": pdf_ellipse,
+    "circular_arc": pdf_circular_arc,
+    "elliptical_arc": pdf_elliptical_arc,
+    "bezier": pdf_bezier,
+    "latex": pdf_latex,
+    "image": pdf_image,
+    "symbol_instance": pdf_symbol_instance
+}
+
+
+def register_pdf_fn(type_name, pdf_fn):
+    type_to_pdf_fn[type_name] = pdf_fn
+
+
+def pdf_command(ctx, e):
+    if e["type"] not in type_to_pdf_fn:
+        raise ValueError("pdf not implemented for element: %s." % e["type"])
+    return type_to_pdf_fn[e["type"]](ctx, e)
+
+
+# NOTE: same traversal as stz.iter_tikz_commands.
+def iter_pdf_commands(ctx, e):
+    iter_stack = [iter([e])]
+    while len(iter_stack) > 0:
+        for e_i in iter_stack[-1]:
+            if isinstance(e_i, list):
+                assert len(e_i) > 0
+                iter_stack.append(iter(e_i))
+                break
+            # NOTE: strings are tikz code (and the end of transform groups).
+            elif isinstance(e_i, str):
+                if e_i == "Q":
+                    yield e_i
+            elif e_i["type"] == "group":
+                iter_stack.append(iter(e_i["e_lst"]))
+                break
+            elif e_i["type"] == "transform_group":
+                if e_i["emit_as_scope"]:
+                    yield "q " + pdf_matrix(e_i["matrix"])
+                    iter_stack.append(iter([e_i["e_lst"], "Q"]))
+                else:
+                    iter_stack.append(iter([stz.apply_transform_group(e_i)]))
+                break
+            elif (e_i["type"] == "symbol_instance" and
+                  not e_i["symbol"]["emit_as_pic"]):
+                iter_stack.append(
+                    iter([
+                        stz.apply_affine_matrix(e_i["symbol"]["e_lst"],
+                                                e_i["matrix"])
+                    ]))
+                break
+            else:
+                yield pdf_command(ctx, e_i)
+        else:
+            iter_stack.pop()
+
+
+#### writing the file
+# NOTE: keeps the offsets of the objects for the cross-reference table.
+def pdf_writer(f):
+    return {"f": f, "pos": 0, "offsets": {}, "num_objects": 0}
+
+
+def new_object_id(w):
+    w["num_objects"] += 1
+    return w["num_objects"]
+
+
+def write_bytes(w, b):
+    w["f"].write(b)
+    w["pos"] += len(b)
+
+
+def write_object(w, obj_id, s):
+    w["offsets"][obj_id] = w["pos"]
+    write_bytes(w, ("%d 0 obj\n%s\nendobj\n" % (obj_id, s)).encode("latin-1"))
+
+
+# NOTE: the stream is compressed as it is generated; its length is written
+# afterwards as a separate object.
+def write_stream_object(w, obj_id, dict_str, lines, chunk_size=1 << 16):
+    length_id = new_object_id(w)
+    w["offsets"][obj_id] = w["pos"]
+    write_bytes(w,
+                ("%d 0 obj\n<< %s /Length %d 0 R /Filter /FlateDecode >>\n"
+                 "stream\n" % (obj_id, dict_str, length_id)).encode("latin-1"))
+    start_pos = w["pos"]
+    compressor = zlib.compressobj(6)
+    buf = []
+    buf_size = 0
+    for line in lines:
+        buf.append(line)
+        buf_size += len(line)
+        if buf_size > chunk_size:
+            buf.append("")
+            write_bytes(w,
+                        compressor.compress("\n".join(buf).encode("latin-1")))
+            buf = []
+            buf_size = 0
+    buf.append("")
+    write_bytes(w, compressor.compress("\n".join(buf).encode("latin-1")))
+    write_bytes(w, compressor.flush())
+    length = w["pos"] - start_pos
+    write_bytes(w, b"\nendstream\nendobj\n")
+    write_object(w, length_id, "%d" % length)
+
+
+def resources_str(ctx):
+    fonts = []
+    for font in sorted(ctx["fonts"]):
+        encoding = "" if font == "sym" else " /Encoding /WinAnsiEncoding"
+        fonts.append("/%s << /Type /Font /Subtype /Type1 /BaseFont /%s%s >>" %
+                     (font_name(ctx, font), base_fonts[font], encoding))
+    gstates = [
+        "/%s << /CA %s /ca %s >>" %
+        (name, num(stroke_opacity), num(fill_opacity))
+        for (stroke_opacity, fill_opacity), name in ctx["gstates"].items()
+    ]
+    xobjects = [
+        "/%s %d 0 R" % (name, obj_id)
+        for name, obj_id in ctx["symbols"].values()
+    ]
+    return "<< /ProcSet [/PDF /Text] /Font << %s >> /ExtGState << %s >> " \
+        "/XObject << %s >> >>" % (" ".join(fonts), " ".join(gstates),
+                                  " ".join(xobjects))
+
+
+# NOTE: f is a file-like object opened for writing bytes.
+def write_pdf(e, f, name2color_in_rgb=None, padding=0.1):
+    ctx = pdf_context(name2color_in_rgb)
+    (x1, y1), (x2, y2) = te.estimated_figure_bbox(e)
+    x1 -= padding
+    y1 += padding
+    x2 += padding
+    y2 -= padding
+
+    w = pdf_writer(f)
+    write_bytes(w, b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    catalog_id = new_object_id(w)
+    pages_id = new_object_id(w)
+    page_id = new_object_id(w)
+    resources_id = new_object_id(w)
+    content_id = new_object_id(w)
+    # NOTE: symbols are form xobjects (in local coordinates; the bbox does not
+    # clip them).
+    symbols = [sym for sym in stz.collect_symbols(e) if sym["emit_as_pic"]]
+    for sym in symbols:
+        ctx["symbols"][sym["name"]] = ("S%d" % (len(ctx["symbols"]) + 1),
+                                       new_object_id(w))
+    for sym in symbols:
+        write_stream_object(
+            w, ctx["symbols"][sym["name"]][1],
+            "/Type /XObject /Subtype /Form /BBox [-10000 -10000 10000 10000] "
+            "/Resources %d 0 R" % resources_id,
+            iter_pdf_commands(ctx, sym["e_lst"]))
+
+    # NOTE: cm to pt with the bottom left corner of the figure at the origin.
+    s = cm_in_pt
+    header = "%s 0 0 %s %s %s cm 10 M" % (num(s), num(s), num(
+        -x1 * s), num(-y2 * s))
+    write_stream_object(w, content_id, "",
+                        itertools.chain([header], iter_pdf_commands(ctx, e)))
+    write_object(w, resources_id, resources_str(ctx))
+    write_object(
+        w, page_id,
+        "<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources %d 0 R "
+        "/Contents %d 0 R >>" % (pages_id, num((x2 - x1) * s), num(
+            (y1 - y2) * s), resources_id, content_id))
+    write_object(w, pages_id,
+                 "<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page_id)
+    write_object(w, catalog_id, "<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    xref_pos = w["pos"]
+    n = w["num_objects"] + 1
+    xref = ["xref", "0 %d" % n, "0000000000 65535 f "]
+    for obj_id in range(1, n):
+        xref.append("%010d 00000 n " % w["offsets"][obj_id])
+    xref.append(
+        "trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" %
+        (n, catalog_id, xref_pos))
+    write_bytes(w, "\n".join(xref).encode("latin-1"))
+
+
+def draw_to_pdf(e, filepath, name2color_in_rgb=None, padding=0.1):
+    with open(filepath, 'wb') as f:
+        write_pdf(e, f, name2color_in_rgb, padding)
@@ -0,0 +1,661 @@
+# -*- coding: utf-8 -*-
+
+# raster backend for previews and thumbnails (png with numpy only; no tex or
+# other programs). the elements are flattened to polygons in pixel
+# coordinates: beziers, arcs, circles, and rounded corners become polylines,
+# and strokes become one quad per segment. polygons are filled with a
+# vectorized scanline algorithm: the crossings of their edges with a few
+# sub-scanlines per pixel row are accumulated at their exact horizontal
+# position and integrated with a cumulative sum along each row, which gives
+# anti-aliased coverage (nonzero rule). primitives with the same color and
+# opacity are filled together when nothing drawn between them overlaps them, and
+# the coverage of many such batches is computed in a single pass. text is drawn
+# as placeholder boxes (with the extent estimated by text_extent.py) and images
+# as gray boxes.
+#
+# NOTE: measured at 100 dpi (single core): a 50x50 graph (about 10k elements
+# with dashed arrows and labels) takes about 0.65s and 10k random overlapping
+# circles, rectangles, dashed arrows, and beziers take about 1.1s. the time is
+# split between the per-element work in python (about 50us per element) and
+# sorting the scanline crossings, so large scenes do not render well under a
+# second.
+#
+# draw_to_png(e, "figure.png", dpi=150, name2color_in_rgb=name2color)
+
+import math
+import struct
+import zlib
+import numpy as np
+import sane_tikz.core as stz
+import sane_tikz.text_extent as te
+import sane_tikz.tikz_style as ts
+
+# NOTE: batches are checked for overlap on a coarse grid over the image (with
+# cells of this size in pixels). the coverage of up to num_batches_per_pass
+# batches is computed together.
+occupancy_cell_size = 4
+num_batches_per_pass = 256
+
+# NOTE: maximum distance (in pixels) between a curve and its polyline.
+flattening_tolerance = 0.2
+
+text_placeholder_opacity = 0.3
+image_placeholder_rgb = (220, 220, 220)
+
+
+def renderer(bbox, dpi, name2color_in_rgb=None, num_subscanlines=4):
+    (x1, y1), (x2, y2) = bbox
+    scale = dpi / 2.54
+    width = max(1, int(math.ceil((x2 - x1) * scale)))
+    height = max(1, int(math.ceil((y1 - y2) * scale)))
+    return {
+        # NOTE: maps cm to pixels (y pointing down).
+        "matrix": [[scale, 0.0, -x1 * scale], [0.0, -scale, y1 * scale]],
+        "scale":
+            scale,
+        "width":
+            width,
+        "height":
+            height,
+        "img":
+            np.ones((height, width, 3), dtype=np.float32),
+        "name2color":
+            name2color_in_rgb,
+        "styles": {},
+        "num_subscanlines":
+            num_subscanlines,
+        # NOTE: index of the last batch that covers each cell (-1 if none).
+        "last_batch":
+            np.full((-(-height // occupancy_cell_size),
+                     -(-width // occupancy_cell_size)),
+                    -1,
+                    dtype=np.int64),
+        "batches": [],
+        "key_to_batch": {}
+    }
+
+
+def renderer_style(r, tikz_str, draw=True):
+    key = (tikz_str, draw)
+    if key not in r["styles"]:
+        r["styles"][key] = ts.parse_style(tikz_str, r["name2color"], draw)
+    return r["styles"][key]
+
+
+def transformed(cs_arr, m):
+    cs_arr = np.asarray(cs_arr, dtype=np.float64).reshape(-1, 2)
+    return cs_arr @ np.array([[m[0][0], m[1][0]], [m[0][1], m[1][1]]
+                             ]) + np.array([m[0][2], m[1][2]])
+
+
+# NOTE: pixels per unit of length (for choosing the number of segments).
+def pixels_per_unit(m):
+    return math.sqrt(abs(m[0][0] * m[1][1] - m[0][1] * m[1][0]))
+
+
+def num_curve_segments(radius_in_pixels, fraction=1.0):
+    n = math.pi * math.sqrt(
+        max(radius_in_pixels, 0.0) / (2.0 * flattening_tolerance))
+    return int(min(max(math.ceil(n * fraction), 4), 1024))
+
+
+#### batches of primitives with the same color and opacity
+# NOTE: fills are polygons and strokes are (polyline, is_closed, half width,
+# has_caps) in pixels. batches are drawn in order. the primitive joins the last
+# batch with the same key unless a batch after it overlaps the primitive.
+def add_primitive(r, key, fills, strokes):
+    pts_lst = fills + [s[0] for s in strokes]
+    pts = pts_lst[0] if len(pts_lst) == 1 else np.concatenate(pts_lst)
+    hw = max([s[2] for s in strokes]) if len(strokes) > 0 else 0.0
+    x1, y1 = pts.min(axis=0).tolist()
+    x2, y2 = pts.max(axis=0).tolist()
+    if x2 + hw < 0.0 or y2 + hw < 0.0 or x1 - hw > r["width"] or y1 - hw > r[
+            "height"]:
+        return
+    # NOTE: cells of the occupancy grid (slices clip the ones past the end).
+    k = occupancy_cell_size
+    i1 = max(int((x1 - hw) // k), 0)
+    j1 = max(int((y1 - hw) // k), 0)
+    i2 = int((x2 + hw) // k) + 1
+    j2 = int((y2 + hw) // k) + 1
+    cells = r["last_batch"][j1:j2, i1:i2]
+    batches = r["batches"]
+    batch = r["key_to_batch"].get(key)
+    if batch is None or batch["index"] < cells.max(initial=-1):
+        batch = {"key": key, "index": len(batches), "fills": [], "strokes": []}
+        batches.append(batch)
+        r["key_to_batch"][key] = batch
+    batch["fills"].extend(fills)
+    batch["strokes"].extend(strokes)
+    cells[...] = batch["index"]
+
+
+def flush_batches(r):
+    batches = r["batches"]
+    for i in range(0, len(batches), num_batches_per_pass):
+        draw_batches(r, batches[i:i + num_batches_per_pass])
+    r["batches"] = []
+    r["key_to_batch"] = {}
+    r["last_batch"][...] = -1
+
+
+# NOTE: returns the edges (x1, y1, x2, y2, w) of the polygons, with w such
+# that all the polygons wind in the same direction, and the index of the
+# polygon of each edge.
+def polygon_edges(polygons):
+    lens = np.array([len(p) for p in polygons])
+    pts = np.concatenate(polygons)
+    starts = np.cumsum(lens) - lens
+    nxt = np.arange(len(pts)) + 1
+    nxt[starts + lens - 1] = starts
+    p = pts
+    q = pts[nxt]
+    cross = p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+    w = np.repeat(np.sign(np.add.reduceat(cross, starts)), lens)
+    ids = np.repeat(np.arange(len(polygons)), lens)
+    return p[:, 0], p[:, 1], q[:, 0], q[:, 1], w, ids
+
+
+# NOTE: one quad per segment. segments are extended by the half width at the
+# joints (and at the ends with caps) so that consecutive quads overlap. also
+# returns the index of the stroke of each edge.
+def stroke_edges(strokes):
+    lens = np.array([len(s[0]) for s in strokes])
+    is_closed = np.repeat(np.array([s[1] for s in strokes], dtype=bool), lens)
+    hw = np.repeat(np.array([s[2] for s in strokes]), lens)
+    has_caps = np.repeat(np.array([s[3] for s in strokes], dtype=bool), lens)
+    pts = np.concatenate([s[0] for s in strokes])
+    n = np.repeat(lens, lens)
+    k = np.arange(len(pts)) - np.repeat(np.cumsum(lens) - lens, lens)
+    idx = np.arange(len(pts))
+    is_seg = (is_closed | (k < n - 1)) & (n >= 2)
+    last = k == n - 1
+    p = pts[idx[is_seg]]
+    q = pts[np.where(last, idx - (n - 1), idx + 1)[is_seg]]
+    ext_p = (is_closed | (k > 0) | has_caps)[is_seg]
+    ext_q = (is_closed | (k < n - 2) | has_caps)[is_seg]
+    hw = hw[is_seg]
+    ids = np.repeat(np.arange(len(strokes)), lens)[is_seg]
+
+    d = q - p
+    length = np.sqrt((d * d).sum(axis=1))
+    keep = length > 0.0
+    p, q, d, length, hw = p[keep], q[keep], d[keep], length[keep], hw[keep]
+    ids = ids[keep]
+    u = d / length[:, None]
+    p = p - u * (hw * ext_p[keep])[:, None]
+    q = q + u * (hw * ext_q[keep])[:, None]
+    nrm = np.stack([-u[:, 1], u[:, 0]], axis=1) * hw[:, None]
+    corners = [p + nrm, q + nrm, q - nrm, p - nrm]
+    x1 = np.concatenate([c[:, 0] for c in corners])
+    y1 = np.concatenate([c[:, 1] for c in corners])
+    x2 = np.concatenate([c[:, 0] for c in corners[1:] + corners[:1]])
+    y2 = np.concatenate([c[:, 1] for c in corners[1:] + corners[:1]])
+    # NOTE: the quads wind in the opposite direction of positive area.
+    return x1, y1, x2, y2, -np.ones(len(x1)), np.tile(ids, 4)
+
+
+# NOTE: coverage of the pixels of num_layers (height, width) images by the
+# edges with s sub-scanlines per pixel row (layer gives the image of each
+# edge). returns the indices of the covered pixels (in the flattened images,
+# one after the other) and their coverage. the crossings are accumulated at
+# their exact horizontal position (split between two pixels); sorted, their
+# cumulative sum is the winding number up to the next crossing, so the pixels
+# between crossings are filled as runs (the cost is proportional to the
+# covered area, not to the extent of the primitives).
+def coverage(x1, y1, x2, y2, w, layer, num_layers, width, height, s):
+    dy = y2 - y1
+    m = dy != 0.0
+    x1, y1, x2, y2, w, dy = x1[m], y1[m], x2[m], y2[m], w[m], dy[m]
+    layer = layer[m]
+    y_lo = np.minimum(y1, y2)
+    y_hi = np.maximum(y1, y2)
+    # NOTE: sub-scanline j is at (j + 0.5) / s (crossed if in [y_lo, y_hi)).
+    j_lo = np.maximum(np.ceil(y_lo * s - 0.5), 0).astype(np.int64)
+    j_hi = np.minimum(np.ceil(y_hi * s - 0.5), height * s).astype(np.int64)
+    counts = np.maximum(j_hi - j_lo, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    ids = np.repeat(np.arange(len(counts)), counts)
+    j = (np.repeat(j_lo, counts) + np.arange(total) -
+         np.repeat(np.cumsum(counts) - counts, counts))
+    yc = (j + 0.5) / s
+    x = x1[ids] + (yc - y1[ids]) * ((x2 - x1) / dy)[ids]
+    winding = (np.sign(dy) * w)[ids]
+    x = np.clip(x, 0.0, float(width))
+    px = np.floor(x).astype(np.int64)
+    frac = x - px
+    # NOTE: two extra columns for the crossings at the right border.
+    acc_width = width + 2
+    flat = (layer[ids] * height + j // s) * acc_width + px
+    flat = np.concatenate([flat, flat + 1])
+    vals = np.concatenate([winding * (1.0 - frac), winding * frac])
+    # NOTE: edges with many crossings are accumulated over the whole images
+    # (instead of sorting the crossings).
+    size = num_layers * height * acc_width
+    if len(flat) * 16 > size:
+        acc = np.bincount(flat, vals, size)
+        keys = np.flatnonzero(acc)
+        c = np.cumsum(acc[keys])
+    else:
+        order = np.argsort(flat)
+        flat = flat[order]
+        starts = np.flatnonzero(np.concatenate([[True], flat[1:] != flat[:-1]]))
+        keys = flat[starts]
+        c = np.cumsum(np.add.reduceat(vals[order], starts))
+    cov = np.minimum(np.abs(c) / s, 1.0)
+    # NOTE: each row adds up to zero, so runs do not cross rows (the end of
+    # the row is only a guard against rounding).
+    row_end = (keys // acc_width) * acc_width + width
+    run_start = keys + 1
+    run_end = np.minimum(np.append(keys[1:], 0), row_end)
+    lens = np.where(cov > 1e-6, np.maximum(run_end - run_start, 0), 0)
+    num = int(lens.sum())
+    run_idx = (np.repeat(run_start, lens) + np.arange(num) -
+               np.repeat(np.cumsum(lens) - lens, lens))
+    idx = np.concatenate([keys, run_idx])
+    cov = np.concatenate([cov, np.repeat(cov, lens)])
+    col = idx % acc_width
+    keep = (col < width) & (cov > 0.0)
+    return (idx // acc_width * width + col)[keep], cov[keep]
+
+
+# NOTE: the coverage of the batches is computed in a single pass (each batch
+# in its own layer) and the batches are then blended in order.
+def draw_batches(r, batches):
+    edges = []
+    fills = [p for b in batches for p in b["fills"]]
+    if len(fills) > 0:
+        fill_layers = np.repeat(np.arange(len(batches)),
+                                [len(b["fills"]) for b in batches])
+        x1, y1, x2, y2, w, ids = polygon_edges(fills)
+        edges.append((x1, y1, x2, y2, w, fill_layers[ids]))
+    strokes = [x for b in batches for x in b["strokes"]]
+    if len(strokes) > 0:
+        stroke_layers = np.repeat(np.arange(len(batches)),
+                                  [len(b["strokes"]) for b in batches])
+        x1, y1, x2, y2, w, ids = stroke_edges(strokes)
+        edges.append((x1, y1, x2, y2, w, stroke_layers[ids]))
+    x1, y1, x2, y2, w, layer = [np.concatenate(v) for v in zip(*edges)]
+    width = r["width"]
+    height = r["height"]
+    idx, cov = coverage(x1, y1, x2, y2, w, layer, len(batches), width, height,
+                        r["num_subscanlines"])
+    if len(idx) == 0:
+        return
+    size = width * height
+    pixel_layer = idx // size
+    order = np.argsort(pixel_layer, kind="stable")
+    idx = idx[order] - pixel_layer[order] * size
+    cov = cov[order]
+    ends = np.searchsorted(pixel_layer[order], np.arange(1, len(batches) + 1))
+    img = r["img"].reshape(-1, 3)
+    start = 0
+    for b, end in zip(batches, ends.tolist()):
+        if end > start:
+            rgb, opacity = b["key"]
+            color = np.array(rgb, dtype=np.float32) / 255.0
+            b_idx = idx[start:end]
+            alpha = (cov[start:end] * opacity).astype(np.float32)[:, None]
+            v = img[b_idx]
+            img[b_idx] = v + (color - v) * alpha
+        start = end
+
+
+#### drawing elements (all coordinates in pixels)
+# NOTE: returns the start and end (as arc lengths) of the dashes along a path
+# of length total. the dashes of all the periods of the pattern are found at
+# once (the pattern is repeated if it has an odd number of lengths so that the
+# even entries are on).
+def dash_ranges(total, pattern):
+    if len(pattern) % 2 == 1:
+        pattern = list(pattern) * 2
+    offsets = np.cumsum([0.0] + list(pattern))
+    period = offsets[-1]
+    base = np.arange(max(int(math.ceil(total / period)), 1)) * period
+    starts = (base[:, None] + offsets[0:-1:2][None, :]).ravel()
+    ends = (base[:, None] + offsets[1::2][None, :]).ravel()
+    keep = starts < total
+    return starts[keep], np.minimum(ends[keep], total)
+
+
+def dashed_polylines(pts, is_closed, pattern):
+    if is_closed:
+        pts = np.concatenate([pts, pts[:1]])
+    if sum(pattern) <= 0.0:
+        return [pts]
+    # NOTE: single segments (the most common case) are interpolated directly.
+    if len(pts) == 2:
+        d = pts[1] - pts[0]
+        total = math.sqrt(d[0] * d[0] + d[1] * d[1])
+        starts, ends = dash_ranges(total, pattern)
+        if total == 0.0:
+            return [pts[[0, 0]] for _ in starts]
+        t = np.stack([starts, ends], axis=1)[:, :, None] / total
+        return list(pts[0] + t * d)
+    seg_lengths = np.sqrt((np.diff(pts, axis=0)**2).sum(axis=1))
+    s = np.concatenate([[0.0], np.cumsum(seg_lengths)])
+    starts, ends = dash_ranges(s[-1], pattern)
+    start_pts = np.stack(
+        [np.interp(starts, s, pts[:, 0]),
+         np.interp(starts, s, pts[:, 1])],
+        axis=1)
+    end_pts = np.stack(
+        [np.interp(ends, s, pts[:, 0]),
+         np.interp(ends, s, pts[:, 1])], axis=1)
+    # NOTE: the points of the polyline strictly inside each dash.
+    lo = np.searchsorted(s, starts, side="right").tolist()
+    hi = np.searchsorted(s, ends, side="left").tolist()
+    two_pts = np.stack([start_pts, end_pts], axis=1)
+    out = []
+    for i in range(len(starts)):
+        if lo[i] >= hi[i]:
+            out.append(two_pts[i])
+        else:
+            out.append(
+                np.concatenate(
+                    [start_pts[i:i + 1], pts[lo[i]:hi[i]], end_pts[i:i + 1]]))
+    return out
+
+
+# NOTE: the end of the path is moved back to the base of the arrow head.
+def add_arrow_head(pts, at_start, line_width, fills):
+    k = 0 if at_start else len(pts) - 1
+    step = 1 if at_start else -1
+    tip = pts[k].tolist()
+    i = k + step
+    while 0 <= i < len(pts) and pts[i].tolist() == tip:
+        i += step
+    if not 0 <= i < len(pts):
+        return pts
+    from_cs = pts[i].tolist()
+    fills.append(np.array(ts.arrow_head_coords(tip, from_cs, line_width)))
+    dx = tip[0] - from_cs[0]
+    dy = tip[1] - from_cs[1]
+    f = 1.0 - min(8.0 * line_width / math.sqrt(dx * dx + dy * dy), 1.0)
+    end = [[from_cs[0] + f * dx, from_cs[1] + f * dy]]
+    if at_start:
+        return np.concatenate([end, pts[i:]])
+    return np.concatenate([pts[:i + 1], end])
+
+
+# NOTE: fills and strokes the polyline (in pixels) with the style. arrow heads
+# are only added to open paths.
+def draw_polyline(r, pts, is_closed, style, fill=True):
+    if fill and style["fill"] is not None and len(pts) >= 3:
+        add_primitive(r, (style["fill"], style["fill_opacity"]), [pts], [])
+    if style["stroke"] is None or len(pts) < 2:
+        return
+    line_width = style["line_width"] * r["scale"]
+    opacity = style["stroke_opacity"]
+    # NOTE: lines thinner than a pixel are drawn one pixel wide and lighter.
+    if line_width < 1.0:
+        opacity *= max(line_width, 0.0)
+        line_width = 1.0
+    fills = []
+    if not is_closed:
+        if style["end_arrow"]:
+            pts = add_arrow_head(pts, False, line_width, fills)
+        if style["start_arrow"]:
+            pts = add_arrow_head(pts, True, line_width, fills)
+    dashes = ts.dash_lengths(style)
+    if len(dashes) > 0:
+        polylines = dashed_polylines(pts, is_closed,
+                                     [x * r["scale"] for x in dashes])
+        has_caps = style["line_cap"] != "butt"
+        strokes = [(p, False, line_width / 2.0, has_caps) for p in polylines]
+    else:
+        strokes = [(pts, is_closed, line_width / 2.0, style["line_cap"]
+                    != "butt")]
+    if len(strokes) > 0 or len(fills) > 0:
+        add_primitive(r, (style["stroke"], opacity), fills, strokes)
+
+
+# NOTE: quadratic curves between the points at distance radius from each
+# corner (as in svg.path_data).
+def rounded_corner_coords(pts, is_closed, radius):
+    n = len(pts)
+    if radius <= 0.0 or n < 3:
+        return pts
+    t = np.linspace(0.0, 1.0, 6).reshape(1, -1, 1)
+    if is_closed:
+        cs = pts
+        prev_cs = np.roll(pts, 1, axis=0)
+        next_cs = np.roll(pts, -1, axis=0)
+    else:
+        cs = pts[1:-1]
+        prev_cs = pts[:-2]
+        next_cs = pts[2:]
+    cut_cs = []
+    for other_cs in [prev_cs, next_cs]:
+        d = other_cs - cs
+        length = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+        safe_length = np.where(length == 0.0, 1.0, length)
+        f = np.where(length == 0.0, 0.0,
+                     np.minimum(radius, length / 2.0) / safe_length)
+        cut_cs.append((cs + f[:, None] * d)[:, None, :])
+    cs = cs[:, None, :]
+    out = ((1.0 - t)**2 * cut_cs[0] + 2.0 * t * (1.0 - t) * cs +
+           t**2 * cut_cs[1]).reshape(-1, 2)
+    if is_closed:
+        return out
+    return np.concatenate([pts[:1], out, pts[-1:]])
+
+
+def raster_path(r, e, m, is_closed):
+    style = renderer_style(r, e["tikz_str"])
+    pts = transformed(e["cs_lst"], m)
+    if style["rounded_corners"] > 0.0:
+        pts = rounded_corner_coords(pts, is_closed,
+                                    style["rounded_corners"] * r["scale"])
+    draw_polyline(r, pts, is_closed, style)
+
+
+def raster_open_path(r, e, m):
+    raster_path(r, e, m, False)
+
+
+def raster_closed_path(r, e, m):
+    raster_path(r, e, m, True)
+
+
+unit_circle_cache = {}
+
+
+# NOTE: the polygons have the same area as the circle.
+def unit_circle_coords(n):
+    if n not in unit_circle_cache:
+        a = np.linspace(0.0, 2.0 * math.pi, n, endpoint=False)
+        f = math.sqrt(2.0 * math.pi / (n * math.sin(2.0 * math.pi / n)))
+        unit_circle_cache[n] = f * np.stack([np.cos(a), np.sin(a)], axis=1)
+    return unit_circle_cache[n]
+
+
+def draw_ellipse(r, center_cs, rx, ry, tikz_str, m):
+    n = num_curve_segments(max(rx, ry) * pixels_per_unit(m))
+    pts = unit_circle_coords(n) * [rx, ry] + center_cs
+    draw_polyline(r, transformed(pts, m), True, renderer_style(r, tikz_str))
+
+
+def raster_circle(r, e, m):
+    draw_ellipse(r, e["center_cs"], e["radius"], e["radius"], e["tikz_str"], m)
+
+
+def raster_ellipse(r, e, m):
+    draw_ellipse(r, e["center_cs"], e["horizontal_radius"],
+                 e["vertical_radius"], e["tikz_str"], m)
+
+
+# NOTE: the arc starts at center_cs (as in tikz).
+def draw_arc(r, start_cs, rx, ry, start_angle, end_angle, tikz_str, m):
+    a0 = stz.degrees_to_radians(start_angle)
+    a1 = stz.degrees_to_radians(end_angle)
+    cx = start_cs[0] - rx * math.cos(a0)
+    cy = start_cs[1] - ry * math.sin(a0)
+    n = num_curve_segments(
+        max(rx, ry) * pixels_per_unit(m),
+        abs(a1 - a0) / (2.0 * math.pi))
+    a = np.linspace(a0, a1, n + 1)
+    pts = np.stack([cx + rx * np.cos(a), cy + ry * np.sin(a)], axis=1)
+    draw_polyline(r, transformed(pts, m), False, renderer_style(r, tikz_str))
+
+
+def raster_circular_arc(r, e, m):
+    draw_arc(r, e["center_cs"], e["radius"], e["radius"], e["start_angle"],
+             e["end_angle"], e["tikz_str"], m)
+
+
+def raster_elliptical_arc(r, e, m):
+    draw_arc(r, e["center_cs"], e["horizontal_radius"], e["vertical_radius"],
+             e["start_angle"], e["end_angle"], e["tikz_str"], m)
+
+
+bezier_basis_cache = {}
+
+
+# NOTE: (n + 1, 4) matrix with the bernstein polynomials at n + 1 equally
+# spaced values of t (the points of the curve are this times the controls).
+def bezier_basis(n):
+    if n not in bezier_basis_cache:
+        t = np.linspace(0.0, 1.0, n + 1)
+        u = 1.0 - t
+        bezier_basis_cache[n] = np.stack(
+            [u * u * u, 3.0 * u * u * t, 3.0 * u * t * t, t * t * t], axis=1)
+    return bezier_basis_cache[n]
+
+
+def raster_bezier(r, e, m):
+    ctrl = transformed([e["from_cs"], e["c1_cs"], e["c2_cs"], e["to_cs"]], m)
+    length = np.sqrt((np.diff(ctrl, axis=0)**2).sum(axis=1)).sum()
+    n = num_curve_segments(length / 4.0)
+    pts = bezier_basis(n) @ ctrl
+    draw_polyline(r, pts, False, renderer_style(r, e["tikz_str"]))
+
+
+def rotated_box_coords(cs, x1, y1, x2, y2, angle):
+    pts = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+    if angle != 0.0:
+        pts = [stz.rotate_coords(p, [0.0, 0.0], angle) for p in pts]
+    return [[cs[0] + p[0], cs[1] + p[1]] for p in pts]
+
+
+# NOTE: the text is a box over the area that it takes (as estimated).
+def raster_latex(r, e, m):
+    ((x1, y1), (x2, y2)), xsep, ysep, _, opts, _ = te.estimated_node_box(
+        e["expr"], e["tikz_str"])
+    style = renderer_style(r, e["tikz_str"], draw=False)
+    if style["stroke"] is not None or style["fill"] is not None:
+        pts = rotated_box_coords(e["cs"], x1, y1, x2, y2, opts["rotate"])
+        draw_polyline(r, transformed(pts, m), True, style)
+    if style["text"] is not None and x2 - x1 > 2.0 * xsep:
+        pts = rotated_box_coords(e["cs"], x1 + xsep, y1 - ysep, x2 - xsep,
+                                 y2 + ysep, opts["rotate"])
+        add_primitive(
+            r,
+            (style["text"], text_placeholder_opacity * style["text_opacity"]),
+            [transformed(pts, m)], [])
+
+
+def raster_image(r, e, m):
+    (x1, y1), (x2, y2) = stz.bbox_image(e)
+    pts = transformed([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], m)
+    add_primitive(r, (image_placeholder_rgb, 1.0), [pts], [])
+
+
+# NOTE: new element types can be drawn by registering a function of the
+# renderer, the element, and the matrix from its coordinates to pixels
+# (which adds the primitives with draw_polyline or add_primitive).
+type_to_raster_fn = {
+    "open_path": raster_open_path,
+    "closed_path": raster_closed_path,
+    "circle": raster_circle,
+    "ellipse": raster_ellipse,
+    "circular_arc": raster_circular_arc,
+    "elliptical_arc": raster_elliptical_arc,
+    "bezier": raster_bezier,
+    "latex": raster_latex,
+    "image": raster_image
+}
+
+
+def register_raster_fn(type_name, raster_fn):
+    type_to_raster_fn[type_name] = raster_fn
+
+
+# NOTE: transform groups and symbol instances compose their matrix with the
+# current one (their elements are not copied).
+def draw_elements(r, e):
+    iter_stack = [(iter([e]), r["matrix"])]
+    while len(iter_stack) > 0:
+        it, m = iter_stack[-1]
+        for e_i in it:
+            if isinstance(e_i, list):
+                iter_stack.append((iter(e_i), m))
+                break
+            # NOTE: strings are tikz code.
+            elif isinstance(e_i, str):
+                continue
+            elif e_i["type"] == "group":
+                iter_stack.append((iter(e_i["e_lst"]), m))
+                break
+            elif e_i["type"] == "transform_group":
+                iter_stack.append(
+                    (iter(e_i["e_lst"]),
+                     stz.compose_affine_matrices(m, e_i["matrix"])))
+                break
+            elif e_i["type"] == "symbol_instance":
+                iter_stack.append(
+                    (iter(e_i["symbol"]["e_lst"]),
+                     stz.compose_affine_matrices(m, e_i["matrix"])))
+                break
+            elif e_i["type"] in type_to_raster_fn:
+                type_to_raster_fn[e_i["type"]](r, e_i, m)
+            else:
+                raise ValueError("raster not implemented for element: %s." %
+                                 e_i["type"])
+        else:
+            iter_stack.pop()
+
+
+# NOTE: returns the image as a (height, width, 3) uint8 array (white
+# background).
+def render(e, dpi=100, name2color_in_rgb=None, padding=0.1, num_subscanlines=4):
+    (x1, y1), (x2, y2) = te.estimated_figure_bbox(e)
+    r = renderer([[x1 - padding, y1 + padding], [x2 + padding, y2 - padding]],
+                 dpi, name2color_in_rgb, num_subscanlines)
+    draw_elements(r, e)
+    flush_batches(r)
+    return np.round(np.clip(r["img"], 0.0, 1.0) * 255.0).astype(np.uint8)
+
+
+def png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data +
+            struct.pack(">I",
+                        zlib.crc32(tag + data) & 0xffffffff))
+
+
+# NOTE: img is a (height, width, 3) uint8 array.
+def write_png(filepath, img):
+    height, width, _ = img.shape
+    rows = np.concatenate(
+        [np.zeros((height, 1), dtype=np.uint8),
+         img.reshape(height, -1)],
+        axis=1)
+    with open(filepath, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(
+            png_chunk(b"IHDR",
+                      struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(png_chunk(b"IEND", b""))
+
+
+def draw_to_png(e,
+                filepath,
+                dpi=100,
+                name2color_in_rgb=None,
+                padding=0.1,
+                num_subscanlines=4):
+    write_png(filepath,
+              render(e, dpi, name2color_in_rgb, padding, num_subscanlines))
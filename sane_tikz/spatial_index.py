@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+# uniform grid over the bboxes of elements for answering region, point, and
+# overlap queries without looking at every element.
+#
+# index = spatial_index(e)  # indexes the leaf elements of e.
+# query_region(index, top_left_cs, bottom_right_cs)
+# query_point(index, cs)
+# overlapping_pairs(index)
+# translate_indexed(index, e, delta_x, delta_y)
+#
+# for many queries at once, overlapping_pairs_between works on numpy arrays of
+# bboxes directly.
+
+import math
+import numpy as np
+import sane_tikz.core as stz
+
+# NOTE: elements spanning more cells than this are kept in a separate list
+# (checked for every query) so that they don't fill up the grid.
+max_cells_per_element = 64
+
+
+def spatial_index(e, cell_size=None, leaves_only=True):
+    e_lst = list(stz.iter_leaf_elements(e)) if leaves_only else list(e)
+    bboxes = [stz.bbox(e_i) for e_i in e_lst]
+    if cell_size is None:
+        cell_size = default_cell_size(bboxes)
+    index = {
+        "cell_size": cell_size,
+        "cells": {},
+        "large_ids": set(),
+        "id_to_e": {},
+        "id_to_bbox": {},
+        "id_to_cells": {}
+    }
+    for e_i, b in zip(e_lst, bboxes):
+        insert_with_bbox(index, e_i, b)
+    return index
+
+
+# NOTE: about twice the typical element size (a cell holds few elements).
+def default_cell_size(bboxes):
+    sizes = sorted([max(stz.x_length(b), stz.y_length(b)) for b in bboxes])
+    sizes = [x for x in sizes if x > 0.0]
+    if len(sizes) == 0:
+        return 1.0
+    return 2.0 * sizes[len(sizes) // 2]
+
+
+def cell_range(index, bbox):
+    s = index["cell_size"]
+    (x1, y1), (x2, y2) = bbox
+    return (int(math.floor(x1 / s)), int(math.floor(x2 / s)),
+            int(math.floor(y2 / s)), int(math.floor(y1 / s)))
+
+
+def insert(index, e):
+    insert_with_bbox(index, e, stz.bbox(e))
+
+
+def insert_with_bbox(index, e, bbox):
+    k = id(e)
+    assert k not in index["id_to_e"]
+    index["id_to_e"][k] = e
+    index["id_to_bbox"][k] = bbox
+    i1, i2, j1, j2 = cell_range(index, bbox)
+    if (i2 - i1 + 1) * (j2 - j1 + 1) > max_cells_per_element:
+        index["large_ids"].add(k)
+        index["id_to_cells"][k] = []
+    else:
+        cells = [(i, j) for i in range(i1, i2 + 1) for j in range(j1, j2 + 1)]
+        for c in cells:
+            index["cells"].setdefault(c, set()).add(k)
+        index["id_to_cells"][k] = cells
+
+
+def remove(index, e):
+    k = id(e)
+    for c in index["id_to_cells"].pop(k):
+        ids = index["cells"][c]
+        ids.discard(k)
+        if len(ids) == 0:
+            del index["cells"][c]
+    index["large_ids"].discard(k)
+    del index["id_to_e"][k]
+    del index["id_to_bbox"][k]
+
+
+# NOTE: call after changing an indexed element (e.g., after placing it).
+def update(index, e):
+    remove(index, e)
+    insert(index, e)
+
+
+# NOTE: e can also be a list or group whose leaf elements are indexed. the
+# indexed elements are found before translating so that the index and the
+# figure stay in agreement.
+def translate_indexed(index, e, delta_x, delta_y):
+    id_to_e = index["id_to_e"]
+    if not isinstance(e, list) and id(e) in id_to_e:
+        indexed_e_lst = [e]
+    else:
+        indexed_e_lst = [
+            e_i for e_i in stz.iter_leaf_elements(e) if id(e_i) in id_to_e
+        ]
+    stz.translate(e, delta_x, delta_y)
+    for e_i in indexed_e_lst:
+        b = [
+            stz.translate_coords(cs, delta_x, delta_y)
+            for cs in index["id_to_bbox"][id(e_i)]
+        ]
+        remove(index, e_i)
+        insert_with_bbox(index, e_i, b)
+
+
+def candidate_ids(index, bbox):
+    i1, i2, j1, j2 = cell_range(index, bbox)
+    ids = set(index["large_ids"])
+    cells = index["cells"]
+    # NOTE: for large regions, it is cheaper to go over the non-empty cells.
+    if (i2 - i1 + 1) * (j2 - j1 + 1) > len(cells):
+        for (i, j), cell_ids in cells.items():
+            if i1 <= i and i <= i2 and j1 <= j and j <= j2:
+                ids.update(cell_ids)
+    else:
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                cell_ids = cells.get((i, j))
+                if cell_ids is not None:
+                    ids.update(cell_ids)
+    return ids
+
+
+def query_region(index, top_left_cs, bottom_right_cs):
+    bbox = [top_left_cs, bottom_right_cs]
+    return [
+        index["id_to_e"][k]
+        for k in candidate_ids(index, bbox)
+        if stz.do_bboxes_overlap(bbox, index["id_to_bbox"][k])
+    ]
+
+
+def query_point(index, cs):
+    return query_region(index, cs, cs)
+
+
+def query_element(index, e):
+    k = id(e)
+    return [e_i for e_i in query_region(index, *stz.bbox(e)) if id(e_i) != k]
+
+
+# NOTE: pairs are only compared if they share a cell (or one of them is large).
+def overlapping_pairs(index):
+    id_to_bbox = index["id_to_bbox"]
+    pairs = set()
+    for cell_ids in index["cells"].values():
+        cell_ids = sorted(cell_ids)
+        for a in range(len(cell_ids)):
+            for b in range(a + 1, len(cell_ids)):
+                pairs.add((cell_ids[a], cell_ids[b]))
+    large_ids = index["large_ids"]
+    for k in large_ids:
+        for other_k in candidate_ids(index, id_to_bbox[k]):
+            if other_k != k:
+                pairs.add((min(k, other_k), max(k, other_k)))
+
+    id_to_e = index["id_to_e"]
+    return [(id_to_e[k], id_to_e[other_k])
+            for (k, other_k) in pairs
+            if stz.do_bboxes_overlap(id_to_bbox[k], id_to_bbox[other_k])]
+
+
+#### batch queries (numpy)
+# NOTE: bboxes are given as a (n, 4) array with rows [x1, y1, x2, y2], where
+# [x1, y1] is the top left and [x2, y2] is the bottom right.
+def bboxes_to_array(bboxes):
+    return np.array([[b[0][0], b[0][1], b[1][0], b[1][1]] for b in bboxes],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def cells_of_bboxes_array(arr, cell_size, i_origin, j_origin):
+    i1 = np.floor(arr[:, 0] / cell_size).astype(np.int64) - i_origin
+    i2 = np.floor(arr[:, 2] / cell_size).astype(np.int64) - i_origin
+    j1 = np.floor(arr[:, 3] / cell_size).astype(np.int64) - j_origin
+    j2 = np.floor(arr[:, 1] / cell_size).astype(np.int64) - j_origin
+    return i1, i2, j1, j2
+
+
+# NOTE: returns (ids, cell keys) with one entry per cell covered by each bbox.
+def expand_cells(ids, i1, i2, j1, j2, num_j):
+    ni = i2 - i1 + 1
+    nj = j2 - j1 + 1
+    counts = ni * nj
+    total = int(counts.sum())
+    starts = np.cumsum(counts) - counts
+    k = np.arange(total, dtype=np.int64) - np.repeat(starts, counts)
+    nj_rep = np.repeat(nj, counts)
+    ci = np.repeat(i1, counts) + k // nj_rep
+    cj = np.repeat(j1, counts) + k % nj_rep
+    return np.repeat(ids, counts), ci * num_j + cj
+
+
+def brute_force_overlapping_pairs(arr, other_arr):
+    mask = ((arr[:, None, 0] <= other_arr[None, :, 2]) &
+            (other_arr[None, :, 0] <= arr[:, None, 2]) &
+            (arr[:, None, 3] <= other_arr[None, :, 1]) &
+            (other_arr[None, :, 3] <= arr[:, None, 1]))
+    return np.nonzero(mask)
+
+
+# NOTE: returns arrays (ids, other_ids) with all the pairs of overlapping bboxes
+# between arr and other_arr (each pair once). bboxes are hashed into a uniform
+# grid and only bboxes sharing a cell are compared. if other_arr is arr, each
+# unordered pair is returned once (with ids < other_ids).
+def overlapping_pairs_between(arr, other_arr, cell_size=None):
+    is_self = other_arr is arr
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    if len(arr) == 0 or len(other_arr) == 0:
+        return empty
+    if cell_size is None:
+        cell_size = default_cell_size(
+            [[[r[0], r[1]], [r[2], r[3]]] for r in other_arr[:1000]])
+
+    both = np.concatenate([arr, other_arr])
+    i_origin = int(np.floor(both[:, 0].min() / cell_size))
+    j_origin = int(np.floor(both[:, 3].min() / cell_size))
+    i1, i2, j1, j2 = cells_of_bboxes_array(arr, cell_size, i_origin, j_origin)
+    oi1, oi2, oj1, oj2 = cells_of_bboxes_array(other_arr, cell_size, i_origin,
+                                               j_origin)
+    num_j = int(max(j2.max(), oj2.max())) + 1
+
+    # large bboxes are compared against everything directly.
+    large = (i2 - i1 + 1) * (j2 - j1 + 1) > max_cells_per_element
+    other_large = (oi2 - oi1 + 1) * (oj2 - oj1 + 1) > max_cells_per_element
+    ids = np.nonzero(~large)[0]
+    other_ids = np.nonzero(~other_large)[0]
+
+    a_ids, a_keys = expand_cells(ids, i1[ids], i2[ids], j1[ids], j2[ids], num_j)
+    b_ids, b_keys = expand_cells(other_ids, oi1[other_ids], oi2[other_ids],
+                                 oj1[other_ids], oj2[other_ids], num_j)
+    order = np.argsort(b_keys, kind="stable")
+    b_ids = b_ids[order]
+    b_keys = b_keys[order]
+    lo = np.searchsorted(b_keys, a_keys, side="left")
+    hi = np.searchsorted(b_keys, a_keys, side="right")
+    counts = hi - lo
+    starts = np.cumsum(counts) - counts
+    k = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(starts, counts)
+    pair_a = np.repeat(a_ids, counts)
+    pair_keys = np.repeat(a_keys, counts)
+    pair_b = b_ids[np.repeat(lo, counts) + k]
+    if is_self:
+        m = pair_a < pair_b
+        pair_a = pair_a[m]
+        pair_b = pair_b[m]
+        pair_keys = pair_keys[m]
+
+    a = arr[pair_a]
+    b = other_arr[pair_b]
+    overlap = ((a[:, 0] <= b[:, 2]) & (b[:, 0] <= a[:, 2]) &
+               (a[:, 3] <= b[:, 1]) & (b[:, 3] <= a[:, 1]))
+    # NOTE: a pair sharing several cells is only kept in the cell with the
+    # bottom left corner of the intersection of the bboxes.
+    ref_i = np.floor(np.maximum(a[:, 0], b[:, 0]) / cell_size).astype(
+        np.int64) - i_origin
+    ref_j = np.floor(np.maximum(a[:, 3], b[:, 3]) / cell_size).astype(
+        np.int64) - j_origin
+    keep = overlap & (ref_i * num_j + ref_j == pair_keys)
+    pair_a_lst = [pair_a[keep]]
+    pair_b_lst = [pair_b[keep]]
+
+    large_ids = np.nonzero(large)[0]
+    if len(large_ids) > 0:
+        la, lb = brute_force_overlapping_pairs(arr[large_ids], other_arr)
+        la = large_ids[la]
+        if is_self:
+            # pairs of two large bboxes would show up twice otherwise.
+            m = ~large[lb] | (la < lb)
+            la, lb = np.minimum(la[m], lb[m]), np.maximum(la[m], lb[m])
+        pair_a_lst.append(la)
+        pair_b_lst.append(lb)
+    other_large_ids = np.nonzero(other_large)[0]
+    if len(other_large_ids) > 0 and not is_self:
+        la, lb = brute_force_overlapping_pairs(arr[ids],
+                                               other_arr[other_large_ids])
+        pair_a_lst.append(ids[la])
+        pair_b_lst.append(other_large_ids[lb])
+    return np.concatenate(pair_a_lst), np.concatenate(pair_b_lst)
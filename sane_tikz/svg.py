@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+# svg backend (no tex needed). the elements are written as they are visited
+# (as in iter_tikz), so memory does not grow with the size of the figure. the
+# coordinates are kept in cm (the viewBox is the bbox of the figure with y
+# pointing down). the tikz options of each element are mapped to svg
+# attributes with tikz_style.py. latex elements become svg text: the
+# expression is approximated with unicode (see text_extent.text_runs) and
+# placed in the box estimated by text_extent.py. strings (raw tikz code) are
+# skipped.
+#
+# draw_to_svg(e, "figure.svg", name2color)
+
+import math
+import sane_tikz.core as stz
+import sane_tikz.text_extent as te
+import sane_tikz.tikz_style as ts
+
+num = stz.stripped_number_to_str_fn(4)
+
+font_families = {
+    "rm": "'Latin Modern Roman', 'CMU Serif', 'Times New Roman', serif",
+    "it": "'Latin Modern Roman', 'CMU Serif', 'Times New Roman', serif",
+    "bf": "'Latin Modern Roman', 'CMU Serif', 'Times New Roman', serif",
+    "sf": "'Latin Modern Sans', 'CMU Sans Serif', Helvetica, Arial, sans-serif",
+    "tt": "'Latin Modern Mono', 'CMU Typewriter Text', Courier, monospace"
+}
+
+
+def escape_xml(s):
+    return (s.replace("&", "&amp;").replace("<", "&lt;").replace(
+        ">", "&gt;").replace('"', "&quot;"))
+
+
+# NOTE: svg has y pointing down.
+def svg_coords(cs):
+    return "%s,%s" % (num(cs[0]), num(-cs[1]))
+
+
+def svg_matrix(m):
+    return "matrix(%s %s %s %s %s %s)" % (num(
+        m[0][0]), num(-m[1][0]), num(-m[0][1]), num(m[1][1]), num(
+            m[0][2]), num(-m[1][2]))
+
+
+# NOTE: the state of a drawing (styles are parsed once per tikz_str).
+def svg_context(name2color_in_rgb=None):
+    return {"name2color": name2color_in_rgb, "styles": {}, "markers": set()}
+
+
+def context_style(ctx, tikz_str, draw=True):
+    key = (tikz_str, draw)
+    if key not in ctx["styles"]:
+        ctx["styles"][key] = ts.parse_style(tikz_str, ctx["name2color"], draw)
+    return ctx["styles"][key]
+
+
+# NOTE: arrow heads are markers (one per color, defined where first used).
+def arrow_marker(ctx, rgb):
+    color = stz.rgb_to_hex(rgb)
+    marker_id = "arrow" + color[1:]
+    lines = []
+    if marker_id not in ctx["markers"]:
+        ctx["markers"].add(marker_id)
+        lines.append(
+            '<defs><marker id="%s" viewBox="0 0 10 10" refX="10" refY="5" '
+            'markerWidth="10" markerHeight="10" markerUnits="strokeWidth" '
+            'orient="auto-start-reverse"><path d="M0,1.5 L10,5 L0,8.5 z" '
+            'fill="%s"/></marker></defs>' % (marker_id, color))
+    return marker_id, lines
+
+
+# NOTE: returns the attributes for the style and the lines that have to be
+# written before the element (e.g., marker definitions).
+def style_attrs(ctx, style, with_arrows=False):
+    attrs = []
+    lines = []
+    if style["stroke"] is None:
+        attrs.append('stroke="none"')
+    else:
+        attrs.append('stroke="%s"' % stz.rgb_to_hex(style["stroke"]))
+        attrs.append('stroke-width="%s"' % num(style["line_width"]))
+        if style["stroke_opacity"] != 1.0:
+            attrs.append('stroke-opacity="%s"' % num(style["stroke_opacity"]))
+        dashes = ts.dash_lengths(style)
+        if len(dashes) > 0:
+            attrs.append('stroke-dasharray="%s"' %
+                         " ".join([num(x) for x in dashes]))
+        if style["line_cap"] != "butt":
+            attrs.append('stroke-linecap="%s"' % style["line_cap"])
+        if style["line_join"] != "miter":
+            attrs.append('stroke-linejoin="%s"' % style["line_join"])
+        if with_arrows and (style["start_arrow"] or style["end_arrow"]):
+            marker_id, lines = arrow_marker(ctx, style["stroke"])
+            if style["start_arrow"]:
+                attrs.append('marker-start="url(#%s)"' % marker_id)
+            if style["end_arrow"]:
+                attrs.append('marker-end="url(#%s)"' % marker_id)
+    if style["fill"] is None:
+        attrs.append('fill="none"')
+    else:
+        attrs.append('fill="%s"' % stz.rgb_to_hex(style["fill"]))
+        if style["fill_opacity"] != 1.0:
+            attrs.append('fill-opacity="%s"' % num(style["fill_opacity"]))
+    return " ".join(attrs), lines
+
+
+def svg_shape(ctx, tag, geometry_attrs, tikz_str, with_arrows=False):
+    attrs, lines = style_attrs(ctx, context_style(ctx, tikz_str), with_arrows)
+    lines.append("<%s %s %s/>" % (tag, geometry_attrs, attrs))
+    return "\n".join(lines)
+
+
+# NOTE: rounded corners are quadratic curves between the points at distance
+# radius from each corner (at most half of each side).
+def path_data(cs_lst, is_closed, radius=0.0):
+    cs_lst = stz.coords_lst_to_tuples(cs_lst)
+    n = len(cs_lst)
+    if radius <= 0.0 or n < 3:
+        d = "M" + " L".join([svg_coords(cs) for cs in cs_lst])
+        return d + " Z" if is_closed else d
+
+    def cut(cs, other_cs):
+        dx = other_cs[0] - cs[0]
+        dy = other_cs[1] - cs[1]
+        length = math.sqrt(dx * dx + dy * dy)
+        if length == 0.0:
+            return cs
+        t = min(radius, length / 2.0) / length
+        return [cs[0] + t * dx, cs[1] + t * dy]
+
+    parts = []
+    for i in range(n) if is_closed else range(1, n - 1):
+        cs = cs_lst[i]
+        parts.append("%s Q%s %s" %
+                     (svg_coords(cut(cs, cs_lst[i - 1])), svg_coords(cs),
+                      svg_coords(cut(cs, cs_lst[(i + 1) % n]))))
+    if is_closed:
+        return "M" + " L".join(parts) + " Z"
+    return "M%s L%s L%s" % (svg_coords(
+        cs_lst[0]), " L".join(parts), svg_coords(cs_lst[-1]))
+
+
+def svg_path(ctx, e, is_closed):
+    style = context_style(ctx, e["tikz_str"])
+    d = path_data(e["cs_lst"], is_closed, style["rounded_corners"])
+    return svg_shape(ctx, "path", 'd="%s"' % d, e["tikz_str"], not is_closed)
+
+
+def svg_open_path(ctx, e):
+    return svg_path(ctx, e, False)
+
+
+def svg_closed_path(ctx, e):
+    return svg_path(ctx, e, True)
+
+
+def svg_circle(ctx, e):
+    cs = e["center_cs"]
+    return svg_shape(
+        ctx, "circle",
+        'cx="%s" cy="%s" r="%s"' % (num(cs[0]), num(-cs[1]), num(e["radius"])),
+        e["tikz_str"])
+
+
+def svg_ellipse(ctx, e):
+    cs = e["center_cs"]
+    return svg_shape(
+        ctx, "ellipse", 'cx="%s" cy="%s" rx="%s" ry="%s"' %
+        (num(cs[0]), num(-cs[1]), num(
+            e["horizontal_radius"]), num(e["vertical_radius"])), e["tikz_str"])
+
+
+# NOTE: the arc starts at center_cs (as in tikz) and is split into pieces of
+# at most 180 degrees (svg arcs between antipodal points are ambiguous).
+def arc_path_data(start_cs, rx, ry, start_angle, end_angle):
+    a0 = stz.degrees_to_radians(start_angle)
+    a1 = stz.degrees_to_radians(end_angle)
+    cx = start_cs[0] - rx * math.cos(a0)
+    cy = start_cs[1] - ry * math.sin(a0)
+    num_pieces = max(1, int(math.ceil(abs(a1 - a0) / math.pi - 1.0e-9)))
+    # NOTE: counterclockwise (increasing angles) is sweep 0 with y down.
+    sweep = 0 if a1 >= a0 else 1
+    parts = ["M" + svg_coords(start_cs)]
+    for k in range(1, num_pieces + 1):
+        a = a0 + (a1 - a0) * k / float(num_pieces)
+        parts.append(
+            "A%s,%s 0 0 %d %s" %
+            (num(rx), num(ry), sweep,
+             svg_coords([cx + rx * math.cos(a), cy + ry * math.sin(a)])))
+    return " ".join(parts)
+
+
+def svg_circular_arc(ctx, e):
+    d = arc_path_data(e["center_cs"], e["radius"], e["radius"],
+                      e["start_angle"], e["end_angle"])
+    return svg_shape(ctx, "path", 'd="%s"' % d, e["tikz_str"], True)
+
+
+def svg_elliptical_arc(ctx, e):
+    d = arc_path_data(e["center_cs"], e["horizontal_radius"],
+                      e["vertical_radius"], e["start_angle"], e["end_angle"])
+    return svg_shape(ctx, "path", 'd="%s"' % d, e["tikz_str"], True)
+
+
+def svg_bezier(ctx, e):
+    d = "M%s C%s %s %s" % (svg_coords(e["from_cs"]), svg_coords(
+        e["c1_cs"]), svg_coords(e["c2_cs"]), svg_coords(e["to_cs"]))
+    return svg_shape(ctx, "path", 'd="%s"' % d, e["tikz_str"], True)
+
+
+def node_alignment(tikz_str):
+    for s in te.split_tikz_options(tikz_str):
+        if s.startswith("align"):
+            return s.split("=", 1)[1].strip()
+    return "center"
+
+
+def run_attrs(run, node_font, node_size):
+    _, font, size, _ = run
+    attrs = []
+    if font_families[font] != font_families[node_font]:
+        attrs.append('font-family="%s"' % font_families[font])
+    if (font == "bf") != (node_font == "bf"):
+        attrs.append('font-weight="%s"' %
+                     ("bold" if font == "bf" else "normal"))
+    if (font == "it") != (node_font == "it"):
+        attrs.append('font-style="%s"' %
+                     ("italic" if font == "it" else "normal"))
+    if size != node_size:
+        attrs.append('font-size="%s"' % num(size * te.pt_in_cm))
+    return attrs
+
+
+# NOTE: the box of the node is the one estimated by text_extent.py (the text
+# is not wrapped for text width). the lines are aligned with the align option
+# and rotated around the coordinates of the node.
+def svg_latex(ctx, e):
+    ((x1, y1), (x2, y2)), xsep, ysep, h, opts, state = te.estimated_node_box(
+        e["expr"], e["tikz_str"])
+    em = state["size"]
+    x, y = e["cs"]
+
+    lines = []
+    if opts["rotate"] != 0.0:
+        lines.append(
+            '<g transform="rotate(%s %s)">' %
+            (num(-opts["rotate"]), svg_coords(e["cs"]).replace(",", " ")))
+    style = context_style(ctx, e["tikz_str"], draw=False)
+    if style["stroke"] is not None or style["fill"] is not None:
+        attrs, marker_lines = style_attrs(ctx, style)
+        lines.extend(marker_lines)
+        lines.append(
+            '<rect x="%s" y="%s" width="%s" height="%s" %s/>' %
+            (num(x + x1), num(-(y + y1)), num(x2 - x1), num(y1 - y2), attrs))
+
+    align = node_alignment(e["tikz_str"])
+    if align == "left":
+        text_x, anchor = x + x1 + xsep, "start"
+    elif align == "right":
+        text_x, anchor = x + x2 - xsep, "end"
+    else:
+        text_x, anchor = x + (x1 + x2) / 2.0, "middle"
+    font = state["font"]
+    text_attrs = [
+        'x="%s"' % num(text_x),
+        'font-size="%s"' % num(em * te.pt_in_cm),
+        'text-anchor="%s"' % anchor
+    ]
+    if font_families[font] != font_families["rm"]:
+        text_attrs.append('font-family="%s"' % font_families[font])
+    if font == "bf":
+        text_attrs.append('font-weight="bold"')
+    elif font == "it":
+        text_attrs.append('font-style="italic"')
+    text_rgb = style["text"] if style["text"] is not None else (0, 0, 0)
+    text_attrs.append('fill="%s"' % stz.rgb_to_hex(text_rgb))
+    if style["text_opacity"] != 1.0:
+        text_attrs.append('fill-opacity="%s"' % num(style["text_opacity"]))
+
+    baseline_y = y + y1 - ysep - h
+    for line in te.text_runs(e["expr"], em, font):
+        tspans = []
+        shift = 0.0
+        for run in line:
+            attrs = run_attrs(run, font, em)
+            if run[3] != shift:
+                attrs.append('dy="%s"' % num(-(run[3] - shift) * te.pt_in_cm))
+                shift = run[3]
+            tspans.append(
+                "<tspan%s>%s</tspan>" %
+                ("".join([" " + a for a in attrs]), escape_xml(run[0])))
+        if len(tspans) > 0:
+            lines.append(
+                '<text xml:space="preserve" y="%s" %s>%s</text>' %
+                (num(-baseline_y), " ".join(text_attrs), "".join(tspans)))
+        baseline_y -= te.baselineskip_factor * em * te.pt_in_cm
+    if opts["rotate"] != 0.0:
+        lines.append("</g>")
+    return "\n".join(lines)
+
+
+def svg_image(ctx, e):
+    x, y = e["top_left_cs"]
+    return ('<image href="%s" x="%s" y="%s" width="%s" height="%s" '
+            'preserveAspectRatio="none"/>' %
+            (escape_xml(e["filepath"]), num(x), num(-y), num(
+                e["width"]), num(e["height"])))
+
+
+def svg_symbol_instance(ctx, e):
+    return '<use href="#%s" transform="%s"/>' % (escape_xml(
+        e["symbol"]["name"]), svg_matrix(e["matrix"]))
+
+
+# NOTE: new element types can be drawn by registering a function of the
+# context and the element that returns the svg code.
+type_to_svg_fn = {
+    "open_path": svg_open_path,
+    "closed_path": svg_closed_path,
+    "circle": svg_circle,
+    "ellipse": svg_ellipse,
+    "circular_arc": svg_circular_arc,
+    "elliptical_arc": svg_elliptical_arc,
+    "bezier": svg_bezier,
+    "latex": svg_latex,
+    "image": svg_image,
+    "symbol_instance": svg_symbol_instance
+}
+
+
+def register_svg_fn(type_name, svg_fn):
+    type_to_svg_fn[type_name] = svg_fn
+
+
+def svg_command(ctx, e):
+    if e["type"] not in type_to_svg_fn:
+        raise ValueError("svg not implemented for element: %s." % e["type"])
+    return type_to_svg_fn[e["type"]](ctx, e)
+
+
+# NOTE: same traversal as stz.iter_tikz_commands.
+def iter_svg_commands(ctx, e):
+    iter_stack = [iter([e])]
+    while len(iter_stack) > 0:
+        for e_i in iter_stack[-1]:
+            if isinstance(e_i, list):
+                assert len(e_i) > 0
+                iter_stack.append(iter(e_i))
+                break
+            # NOTE: strings are tikz code (and the end of svg groups).
+            elif isinstance(e_i, str):
+                if e_i == "</g>":
+                    yield e_i
+            elif e_i["type"] == "group":
+                iter_stack.append(iter(e_i["e_lst"]))
+                break
+            elif e_i["type"] == "transform_group":
+                if e_i["emit_as_scope"]:
+                    yield '<g transform="%s">' % svg_matrix(e_i["matrix"])
+                    iter_stack.append(iter([e_i["e_lst"], "</g>"]))
+                else:
+                    iter_stack.append(iter([stz.apply_transform_group(e_i)]))
+                break
+            elif (e_i["type"] == "symbol_instance" and
+                  not e_i["symbol"]["emit_as_pic"]):
+                iter_stack.append(
+                    iter([
+                        stz.apply_affine_matrix(e_i["symbol"]["e_lst"],
+                                                e_i["matrix"])
+                    ]))
+                break
+            else:
+                yield svg_command(ctx, e_i)
+        else:
+            iter_stack.pop()
+
+
+def iter_svg(e, name2color_in_rgb=None, padding=0.1):
+    ctx = svg_context(name2color_in_rgb)
+    (x1, y1), (x2, y2) = te.estimated_figure_bbox(e)
+    x1 -= padding
+    y1 += padding
+    x2 += padding
+    y2 -= padding
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield ('<svg xmlns="http://www.w3.org/2000/svg" '
+           'xmlns:xlink="http://www.w3.org/1999/xlink" width="%scm" '
+           'height="%scm" viewBox="%s %s %s %s" stroke-miterlimit="10" '
+           'font-family="%s">' %
+           (num(x2 - x1), num(y1 - y2), num(x1), num(-y1), num(x2 - x1),
+            num(y1 - y2), font_families["rm"]))
+    # NOTE: symbols are defined once (in local coordinates).
+    for sym in stz.collect_symbols(e):
+        if sym["emit_as_pic"]:
+            yield '<defs><g id="%s">' % escape_xml(sym["name"])
+            for line in iter_svg_commands(ctx, sym["e_lst"]):
+                yield line
+            yield "</g></defs>"
+    for line in iter_svg_commands(ctx, e):
+        yield line
+    yield "</svg>"
+
+
+def draw_to_svg_lines(e, name2color_in_rgb=None, padding=0.1):
+    return list(iter_svg(e, name2color_in_rgb, padding))
+
+
+# NOTE: f is a file-like object opened for writing text.
+def write_svg(e, f, name2color_in_rgb=None, padding=0.1):
+    stz.write_lines(f, iter_svg(e, name2color_in_rgb, padding))
+
+
+def draw_to_svg(e, filepath, name2color_in_rgb=None, padding=0.1):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        write_svg(e, f, name2color_in_rgb, padding)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+# exact extent of latex elements measured by tex. each measurement starts a
+# single tex process and sends all the missing expressions to it in one batch
+# (each one is typeset in a box and its width, height, and depth are printed
+# back). measurements are cached on disk keyed by (preamble, font size, node
+# options, expression), so later runs do not start tex at all. expressions
+# that tex cannot typeset are recorded as failed and fall back to the
+# estimate. requires a tex distribution (pdflatex by default); see
+# text_extent.py for an estimate that does not.
+#
+# measure_latex_elements(e)  # measures the latex elements of e.
+# use_measured_latex_bboxes()  # stz.bbox now uses the measurements.
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import sane_tikz.core as stz
+import sane_tikz.text_extent as te
+
+default_cache_filepath = os.path.join(os.path.expanduser("~"), ".cache",
+                                      "sane_tikz", "tex_extents.json")
+start_marker = "SANE_TIKZ_QUERY:"
+query_marker = "SANE_TIKZ_EXTENT:"
+done_marker = "SANE_TIKZ_DONE"
+
+# (preamble_lines, font_size_in_pt, expr, tikz_str) -> [width, height, depth]
+# of the text (in pt), or None if tex could not typeset it.
+measured_extents = {}
+# NOTE: preamble and font size of the last measurement; used by
+# measured_relative_bbox.
+measured_config = {"preamble_lines": None, "font_size_in_pt": None}
+
+# NOTE: these options are applied when computing the bbox of the node from the
+# extent of the text (see te.node_relative_bbox), so they are not measured.
+unmeasured_option_keys = {
+    "anchor", "rotate", "inner sep", "inner xsep", "inner ysep", "outer sep",
+    "draw", "fill", "line width", "above", "below", "left", "right",
+    "above left", "above right", "below left", "below right"
+}
+
+
+# NOTE: same packages as the standalone files written by stz.
+def default_preamble_lines():
+    return [
+        line for line in stz.tikz_standalone_header_lines()[1:]
+        if not line.startswith("\\begin")
+    ]
+
+
+def measured_tikz_str(tikz_str):
+    opts = [
+        s for s in te.split_tikz_options(tikz_str)
+        if s.split("=", 1)[0].strip() not in unmeasured_option_keys
+    ]
+    return ", ".join(["inner sep=0pt", "outer sep=0pt", "anchor=base"] + opts)
+
+
+# NOTE: the markers carry the index of the query, so that the errors printed
+# between them can be assigned to it.
+def query_tex_str(idx, expr, tikz_str):
+    return ("\\typeout{%s%d}"
+            "\\sbox0{\\begin{tikzpicture}[baseline=(n.base)]"
+            "\\node[%s] (n) {%s};\\end{tikzpicture}}"
+            "\\typeout{%s%d:\\the\\wd0,\\the\\ht0,\\the\\dp0}" %
+            (start_marker, idx, measured_tikz_str(tikz_str), expr, query_marker,
+             idx))
+
+
+# NOTE: unbalanced braces or a comment would swallow the queries that follow,
+# so these are not sent to tex.
+def is_self_contained_tex_str(s):
+    depth = 0
+    escaped = False
+    for ch in s:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == "%":
+            return False
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def start_tex_worker(preamble_lines=None,
+                     font_size_in_pt=None,
+                     latex_cmd="pdflatex"):
+    if preamble_lines is None:
+        preamble_lines = default_preamble_lines()
+    if font_size_in_pt is None:
+        font_size_in_pt = te.base_font_size_in_pt
+    if shutil.which(latex_cmd) is None:
+        raise ValueError("TeX command not found: %s." % latex_cmd)
+
+    dirpath = tempfile.mkdtemp(prefix="sane_tikz_")
+    # NOTE: keeps tex from wrapping the lines it prints.
+    env = dict(os.environ, max_print_line="100000")
+    # NOTE: scrollmode keeps going after an error (and still reads the input
+    # from the terminal), so one bad expression does not stop the batch.
+    p = subprocess.Popen([latex_cmd, "-interaction=scrollmode"],
+                         cwd=dirpath,
+                         env=env,
+                         stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT,
+                         universal_newlines=True,
+                         encoding="utf-8",
+                         errors="replace")
+    worker = {
+        "process": p,
+        "dirpath": dirpath,
+        "preamble_lines": preamble_lines,
+        "font_size_in_pt": font_size_in_pt
+    }
+    lines = (["\\documentclass[%gpt]{standalone}" % font_size_in_pt] +
+             preamble_lines +
+             ["\\begin{document}",
+              "\\typeout{%s}" % done_marker])
+    p.stdin.write("\n".join(lines) + "\n")
+    p.stdin.flush()
+    read_tex_output_until(worker, done_marker)
+    return worker
+
+
+# NOTE: returns the lines printed by tex up to the one with the marker.
+def read_tex_output_until(worker, marker):
+    p = worker["process"]
+    lines = []
+    while True:
+        line = p.stdout.readline()
+        if line == "":
+            raise ValueError("TeX stopped unexpectedly:\n%s" %
+                             "".join(lines[-40:]))
+        lines.append(line)
+        if marker in line:
+            return lines
+
+
+def stop_tex_worker(worker):
+    p = worker["process"]
+    if p.poll() is None:
+        try:
+            if not p.stdin.closed:
+                p.stdin.write("\\end{document}\n")
+                p.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+    shutil.rmtree(worker["dirpath"], ignore_errors=True)
+
+
+def parse_tex_length_in_pt(s):
+    assert s.endswith("pt")
+    return float(s[:-2])
+
+
+# NOTE: returns [width, height, depth] (in pt), or None if tex printed an error
+# for it, for each (expr, tikz_str) query, and the number of queries that tex
+# got to (all of them unless it stopped early). the queries are written by a
+# separate thread so that tex does not block on a full output pipe while we
+# are still writing. the input is closed after them, so tex cannot wait for
+# more input if an error made it read past the end of the batch.
+def measure_with_tex_worker(worker, query_lst):
+    p = worker["process"]
+
+    def write_queries():
+        try:
+            for idx, (expr, tikz_str) in enumerate(query_lst):
+                if (is_self_contained_tex_str(expr) and
+                        is_self_contained_tex_str(tikz_str)):
+                    p.stdin.write(query_tex_str(idx, expr, tikz_str) + "\n")
+            p.stdin.write("\\typeout{%s}\n" % done_marker)
+            p.stdin.write("\\end{document}\n")
+            p.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    writer = threading.Thread(target=write_queries)
+    writer.start()
+    out = [None] * len(query_lst)
+    num_reached = 0
+    idx = None
+    failed = False
+    try:
+        while True:
+            line = p.stdout.readline()
+            if line == "":
+                break
+            if line.startswith(start_marker):
+                idx = int(line[len(start_marker):])
+                num_reached = idx + 1
+                failed = False
+            elif line.startswith("!"):
+                failed = True
+            elif line.startswith(query_marker):
+                idx_s, s = line[len(query_marker):].split(":", 1)
+                if int(idx_s) == idx and not failed:
+                    out[idx] = [
+                        parse_tex_length_in_pt(x) for x in s.strip().split(",")
+                    ]
+            elif line.startswith(done_marker):
+                num_reached = len(query_lst)
+                break
+    finally:
+        writer.join()
+    return out, num_reached
+
+
+def cache_key(preamble_lines, font_size_in_pt, expr, tikz_str):
+    s = json.dumps([preamble_lines, font_size_in_pt, tikz_str, expr])
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+def load_cache(filepath):
+    if filepath is None or not os.path.isfile(filepath):
+        return {}
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def save_cache(filepath, cache):
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_filepath, filepath)
+
+
+# NOTE: returns [width, height, depth] (in pt), or None if tex could not
+# typeset it, for each (expr, tikz_str) query. tex is only started if some
+# query is not in the cache (once for all of them, and again for the ones
+# after an expression that made tex stop). failures are cached too, as tex
+# would fail on them again.
+def measure_text_extents(query_lst,
+                         preamble_lines=None,
+                         font_size_in_pt=None,
+                         latex_cmd="pdflatex",
+                         cache_filepath=default_cache_filepath):
+    if preamble_lines is None:
+        preamble_lines = default_preamble_lines()
+    if font_size_in_pt is None:
+        font_size_in_pt = te.base_font_size_in_pt
+
+    cache = load_cache(cache_filepath)
+    keys = [
+        cache_key(preamble_lines, font_size_in_pt, expr, tikz_str)
+        for (expr, tikz_str) in query_lst
+    ]
+    missing = {}
+    for k, q in zip(keys, query_lst):
+        if k not in cache and k not in missing:
+            missing[k] = q
+
+    if len(missing) > 0:
+        missing_keys = list(missing.keys())
+        missing_queries = list(missing.values())
+        idx = 0
+        while idx < len(missing_queries):
+            worker = start_tex_worker(preamble_lines, font_size_in_pt,
+                                      latex_cmd)
+            try:
+                extents, num_reached = measure_with_tex_worker(
+                    worker, missing_queries[idx:])
+            finally:
+                stop_tex_worker(worker)
+            # NOTE: the last query reached is the one tex stopped on.
+            num_reached = max(num_reached, 1)
+            for k, x in zip(missing_keys[idx:idx + num_reached],
+                            extents[:num_reached]):
+                cache[k] = x
+            idx += num_reached
+        if cache_filepath is not None:
+            save_cache(cache_filepath, cache)
+    return [cache[k] for k in keys]
+
+
+# NOTE: also goes into transform groups and symbols.
+def iter_latex_elements(e):
+    if isinstance(e, list):
+        for e_i in e:
+            for e_j in iter_latex_elements(e_i):
+                yield e_j
+    elif e["type"] == "latex":
+        yield e
+    elif e["type"] == "symbol_instance":
+        for e_j in iter_latex_elements(e["symbol"]["e_lst"]):
+            yield e_j
+    elif "e_lst" in e:
+        for e_j in iter_latex_elements(e["e_lst"]):
+            yield e_j
+
+
+# NOTE: returns the number of distinct (expr, tikz_str) pairs measured.
+def measure_latex_elements(e,
+                           preamble_lines=None,
+                           font_size_in_pt=None,
+                           latex_cmd="pdflatex",
+                           cache_filepath=default_cache_filepath):
+    if preamble_lines is None:
+        preamble_lines = default_preamble_lines()
+    if font_size_in_pt is None:
+        font_size_in_pt = te.base_font_size_in_pt
+    measured_config["preamble_lines"] = preamble_lines
+    measured_config["font_size_in_pt"] = font_size_in_pt
+
+    query_lst = []
+    keys = []
+    for e_i in iter_latex_elements(e):
+        q = (e_i["expr"], e_i["tikz_str"])
+        k = measured_key(preamble_lines, font_size_in_pt, *q)
+        if k not in measured_extents:
+            measured_extents[k] = None
+            query_lst.append(q)
+            keys.append(k)
+    try:
+        extents = measure_text_extents(query_lst, preamble_lines,
+                                       font_size_in_pt, latex_cmd,
+                                       cache_filepath)
+    except Exception:
+        for k in keys:
+            del measured_extents[k]
+        raise
+    for k, x in zip(keys, extents):
+        measured_extents[k] = x
+    return len(query_lst)
+
+
+# NOTE: same fields as cache_key, but cheaper to compute.
+def measured_key(preamble_lines, font_size_in_pt, expr, tikz_str):
+    return (tuple(preamble_lines), font_size_in_pt, expr, tikz_str)
+
+
+# NOTE: falls back to the estimate for expressions that were not measured with
+# the preamble and font size of the last measurement.
+def measured_relative_bbox(expr, tikz_str=""):
+    font_size_in_pt = measured_config["font_size_in_pt"]
+    x = (None if font_size_in_pt is None else measured_extents.get(
+        measured_key(measured_config["preamble_lines"], font_size_in_pt, expr,
+                     tikz_str)))
+    if x is None:
+        return te.estimated_relative_bbox(expr, tikz_str)
+    opts, state = te.node_options_and_font(tikz_str)
+    # NOTE: the font size of the node relative to that of the document.
+    em = state["size"] * font_size_in_pt / te.base_font_size_in_pt
+    return te.node_relative_bbox(x[0], x[1], x[2], opts, em)
+
+
+def measured_bbox_latex(e):
+    (x1, y1), (x2, y2) = measured_relative_bbox(e["expr"], e["tikz_str"])
+    x, y = e["cs"]
+    return [[x + x1, y + y1], [x + x2, y + y2]]
+
+
+def use_measured_latex_bboxes(enable=True):
+    stz.type_to_fns["latex"]["bbox"] = (measured_bbox_latex
+                                        if enable else stz.bbox_latex)
@@ -0,0 +1,842 @@
+# -*- coding: utf-8 -*-
+
+# approximate extent of latex elements (i.e., tikz nodes) without running tex.
+# the expression is typeset with the advance widths of computer modern (the
+# default font; latin modern has the same metrics) taking into account size
+# commands (\scriptsize, \Huge, ...), font commands (\textbf, ...), math mode
+# (subscripts, superscripts, fractions), line breaks, and the options of the
+# node (font, text width, inner sep, anchor, rotate). results are memoized per
+# (expr, tikz_str).
+#
+# use_estimated_latex_bboxes()  # stz.bbox now uses the estimate for latex.
+
+import re
+import sane_tikz.core as stz
+
+# NOTE: the standalone class uses 10pt by default.
+base_font_size_in_pt = 10.0
+pt_in_cm = 2.54 / 72.27
+
+# size of the font (in pt) for the 10pt classes.
+size_command_to_pt = {
+    "tiny": 5.0,
+    "scriptsize": 7.0,
+    "footnotesize": 8.0,
+    "small": 9.0,
+    "normalsize": 10.0,
+    "large": 12.0,
+    "Large": 14.4,
+    "LARGE": 17.28,
+    "huge": 20.74,
+    "Huge": 24.88
+}
+
+# advance widths (in pt) for a 10pt font.
+# NOTE: from the tfm files of cmr10 (roman) and cmmi10 (math italic).
+cmr10_widths = {
+    "a": 5.0, "b": 5.556, "c": 4.444, "d": 5.556, "e": 4.444, "f": 3.056,
+    "g": 5.0, "h": 5.556, "i": 2.778, "j": 3.056, "k": 5.278, "l": 2.778,
+    "m": 8.333, "n": 5.556, "o": 5.0, "p": 5.556, "q": 5.278, "r": 3.917,
+    "s": 3.944, "t": 3.889, "u": 5.556, "v": 5.278, "w": 7.222, "x": 5.278,
+    "y": 5.278, "z": 4.444,
+    "A": 7.5, "B": 7.083, "C": 7.222, "D": 7.639, "E": 6.806, "F": 6.528,
+    "G": 7.847, "H": 7.5, "I": 3.611, "J": 5.139, "K": 7.778, "L": 6.25,
+    "M": 9.167, "N": 7.5, "O": 7.778, "P": 6.806, "Q": 7.778, "R": 7.361,
+    "S": 5.556, "T": 7.222, "U": 7.5, "V": 7.5, "W": 10.278, "X": 7.5,
+    "Y": 7.5, "Z": 6.111,
+    "0": 5.0, "1": 5.0, "2": 5.0, "3": 5.0, "4": 5.0, "5": 5.0, "6": 5.0,
+    "7": 5.0, "8": 5.0, "9": 5.0,
+    ".": 2.778, ",": 2.778, ":": 2.778, ";": 2.778, "!": 2.778, "?": 4.722,
+    "(": 3.889, ")": 3.889, "[": 2.778, "]": 2.778, "-": 3.333, "+": 7.778,
+    "=": 7.778, "/": 5.0, "'": 2.778, "`": 2.778, "\"": 5.0, "*": 5.0,
+    "&": 7.778, "%": 8.333, "@": 7.778, "#": 8.333, "$": 5.0, "<": 7.778,
+    ">": 7.778, "|": 2.778, "{": 5.0, "}": 5.0, "_": 5.0
+} # yapf: disable
+
+cmmi10_widths = {
+    "a": 5.286, "b": 4.292, "c": 4.328, "d": 5.204, "e": 4.656, "f": 4.896,
+    "g": 4.770, "h": 5.762, "i": 3.445, "j": 4.118, "k": 5.208, "l": 2.980,
+    "m": 8.780, "n": 6.002, "o": 4.847, "p": 5.035, "q": 4.464, "r": 4.511,
+    "s": 4.688, "t": 3.611, "u": 5.725, "v": 4.847, "w": 7.159, "x": 5.715,
+    "y": 4.903, "z": 4.650,
+    "A": 7.5, "B": 7.590, "C": 7.145, "D": 8.280, "E": 7.377, "F": 6.431,
+    "G": 7.865, "H": 8.313, "I": 4.396, "J": 5.545, "K": 8.493, "L": 6.806,
+    "M": 9.701, "N": 8.035, "O": 7.628, "P": 6.420, "Q": 7.906, "R": 7.593,
+    "S": 6.132, "T": 5.844, "U": 6.828, "V": 5.833, "W": 9.444, "X": 8.285,
+    "Y": 5.809, "Z": 6.826
+} # yapf: disable
+
+# NOTE: other fonts are approximated by scaling the roman widths. up is
+# roman in math mode (e.g., \mathrm).
+font_width_factors = {"rm": 1.0, "up": 1.0, "bf": 1.15, "it": 0.98, "sf": 0.95}
+tt_width = 5.25
+default_width = 5.0
+
+# math symbols (in pt for a 10pt font).
+symbol_widths = {
+    "alpha": 6.40, "beta": 5.66, "gamma": 5.18, "delta": 4.44,
+    "epsilon": 4.06, "varepsilon": 4.66, "zeta": 4.38, "eta": 4.97,
+    "theta": 4.69, "iota": 3.54, "kappa": 5.76, "lambda": 5.83, "mu": 6.03,
+    "nu": 4.96, "xi": 4.38, "pi": 5.70, "rho": 5.17, "sigma": 5.71,
+    "tau": 4.37, "upsilon": 5.40, "phi": 5.96, "varphi": 6.54, "chi": 6.26,
+    "psi": 6.51, "omega": 6.22,
+    "Gamma": 6.25, "Delta": 8.33, "Theta": 7.78, "Lambda": 6.94,
+    "Xi": 6.67, "Pi": 7.5, "Sigma": 7.22, "Phi": 7.22, "Psi": 7.78,
+    "Omega": 7.22,
+    "cdot": 2.78, "times": 7.78, "pm": 7.78, "mp": 7.78, "div": 7.78,
+    "leq": 7.78, "geq": 7.78, "le": 7.78, "ge": 7.78, "neq": 7.78,
+    "approx": 7.78, "sim": 7.78, "equiv": 7.78, "in": 6.67, "notin": 6.67,
+    "subset": 7.78, "subseteq": 7.78, "cup": 6.67, "cap": 6.67,
+    "to": 10.0, "rightarrow": 10.0, "leftarrow": 10.0, "mapsto": 10.0,
+    "Rightarrow": 10.0, "leftrightarrow": 10.0, "infty": 10.0,
+    "partial": 5.56, "nabla": 8.33, "forall": 5.56, "exists": 5.56,
+    "ldots": 11.72, "cdots": 11.72, "dots": 11.72, "sum": 10.56,
+    "prod": 9.44, "int": 4.17, "log": 12.78, "exp": 15.56, "max": 16.67,
+    "min": 13.89, "sin": 11.67, "cos": 12.78, "ell": 4.17, "prime": 2.75,
+    "langle": 3.89, "rangle": 3.89, "mid": 2.78, "|": 5.0, "%": 8.333,
+    "$": 5.0, "&": 7.778, "#": 8.333, "_": 5.0, "{": 5.0, "}": 5.0
+} # yapf: disable
+
+# NOTE: get the spacing of binary operators and relations in math mode.
+math_binary_operators = set("+-*") | {
+    "cdot", "times", "pm", "mp", "div", "cup", "cap"
+}
+math_relations = set("=<>:") | {
+    "leq", "geq", "le", "ge", "neq", "approx", "sim", "equiv", "in", "notin",
+    "subset", "subseteq", "to", "rightarrow", "leftarrow", "mapsto",
+    "Rightarrow", "leftrightarrow", "mid"
+}
+
+# spacing commands (in em).
+spacing_commands = {
+    ",": 3.0 / 18,
+    ":": 4.0 / 18,
+    ";": 5.0 / 18,
+    "!": -3.0 / 18,
+    "quad": 1.0,
+    "qquad": 2.0,
+    "enspace": 0.5,
+    "hfill": 0.0
+}
+
+font_commands = {
+    "bf": "bf",
+    "bfseries": "bf",
+    "it": "it",
+    "itshape": "it",
+    "em": "it",
+    "rm": "rm",
+    "rmfamily": "rm",
+    "normalfont": "rm",
+    "sf": "sf",
+    "sffamily": "sf",
+    "tt": "tt",
+    "ttfamily": "tt"
+}
+
+# commands with one argument typeset in a given font (math off for text).
+font_arg_commands = {
+    "textbf": ("bf", False),
+    "textit": ("it", False),
+    "emph": ("it", False),
+    "textrm": ("rm", False),
+    "textsf": ("sf", False),
+    "texttt": ("tt", False),
+    "text": ("rm", False),
+    "mbox": ("rm", False),
+    "textnormal": ("rm", False),
+    "mathbf": ("bf", True),
+    "boldsymbol": ("bf", True),
+    "mathit": ("it", True),
+    "mathrm": ("up", True),
+    "mathsf": ("sf", True),
+    "mathtt": ("tt", True),
+    "operatorname": ("up", True)
+}
+
+# commands whose arguments do not show up (e.g., \textcolor{red}{x}).
+num_ignored_args = {
+    "color": 1,
+    "textcolor": 1,
+    "vspace": 1,
+    "hspace": 1,
+    "label": 1,
+    "phantom": 1,
+    "left": 0,
+    "right": 0,
+    "big": 0,
+    "Big": 0,
+    "bigg": 0,
+    "Bigg": 0,
+    "displaystyle": 0,
+    "textstyle": 0,
+    "centering": 0,
+    "raggedright": 0,
+    "raggedleft": 0,
+    "noindent": 0,
+    "strut": 0,
+    "limits": 0,
+    "nolimits": 0
+}
+
+# heights and depths (in pt for a 10pt font).
+x_height = 4.31
+ascender_height = 6.94
+cap_height = 6.83
+descender_depth = 1.94
+delimiter_height = 7.5
+delimiter_depth = 2.5
+math_axis_height = 2.5
+superscript_shift = 3.63
+subscript_shift = 1.5
+script_scale = 0.7
+baselineskip_factor = 1.2
+
+tall_chars = set("bdfhklt0123456789!?'`\"/%&@#$*")
+deep_chars = set("gjpqy,;")
+delimiter_chars = set("()[]{}|")
+
+token_regex = re.compile(r"\\[a-zA-Z]+\*?|\\.|\s+|.", re.DOTALL)
+extent_cache = {}
+node_options_cache = {}
+node_text_extent_cache = {}
+
+
+def tokenize(expr):
+    return token_regex.findall(expr)
+
+
+def char_metrics(c, state):
+    s = state["size"] / 10.0
+    font = state["font"]
+    if font == "tt":
+        w = tt_width
+    elif state["math"] and font == "rm" and c in cmmi10_widths:
+        w = cmmi10_widths[c]
+    else:
+        w = cmr10_widths.get(c, default_width) * font_width_factors.get(
+            font, 1.0)
+
+    if c in delimiter_chars:
+        h, d = delimiter_height, delimiter_depth
+    elif c.isupper():
+        h, d = cap_height, 0.0
+    elif c in tall_chars:
+        h, d = ascender_height, 0.0
+    else:
+        h, d = x_height, 0.0
+    if c in deep_chars:
+        d = descender_depth
+    return w * s, h * s + state["shift"], d * s - state["shift"]
+
+
+def symbol_metrics(name, state):
+    s = state["size"] / 10.0
+    w = symbol_widths.get(name, default_width)
+    if name in ("sum", "prod", "int"):
+        h, d = delimiter_height, delimiter_depth
+    else:
+        h, d = ascender_height, 0.0
+    return w * s, h * s + state["shift"], d * s - state["shift"]
+
+
+def add_box(lines, w, h, d):
+    lines[-1].append(("box", w, h, d))
+
+
+# NOTE: kerns are not breakable; glue is (i.e., spaces between words).
+def add_kern(lines, w):
+    lines[-1].append(("kern", w, 0.0, 0.0))
+
+
+def add_glue(lines, w):
+    lines[-1].append(("glue", w, 0.0, 0.0))
+
+
+def add_math_spacing(lines, name, state):
+    em = state["size"]
+    if name in math_binary_operators:
+        add_kern(lines, 2.0 * em * 4.0 / 18)
+    elif name in math_relations:
+        add_kern(lines, 2.0 * em * 5.0 / 18)
+
+
+# NOTE: returns the tokens of the next argument (a group or a single token)
+# and the position after it. leading spaces are skipped.
+def read_argument(tokens, i):
+    while i < len(tokens) and tokens[i].isspace():
+        i += 1
+    if i >= len(tokens):
+        return [], i
+    if tokens[i] != "{":
+        return [tokens[i]], i + 1
+    depth = 0
+    start = i + 1
+    while i < len(tokens):
+        if tokens[i] == "{":
+            depth += 1
+        elif tokens[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return tokens[start:i], i + 1
+        i += 1
+    return tokens[start:], i
+
+
+def skip_optional_argument(tokens, i):
+    j = i
+    while j < len(tokens) and tokens[j].isspace():
+        j += 1
+    if j < len(tokens) and tokens[j] == "[":
+        while j < len(tokens) and tokens[j] != "]":
+            j += 1
+        return j + 1
+    return i
+
+
+def script_state(state, t):
+    out = dict(state)
+    out["size"] = state["size"] * script_scale
+    if t == "^":
+        out["shift"] = state["shift"] + superscript_shift * state["size"] / 10.0
+    else:
+        out["shift"] = state["shift"] - subscript_shift * state["size"] / 10.0
+    return out
+
+
+# NOTE: a single line box (line breaks inside are ignored).
+def measure_box(tokens, state):
+    lines = [[]]
+    typeset(tokens, dict(state), lines)
+    w = sum([x[1] for line in lines for x in line])
+    h = max([x[2] for line in lines for x in line] + [0.0])
+    d = max([x[3] for line in lines for x in line] + [0.0])
+    return w, h, d
+
+
+def typeset_fraction(tokens, i, state, lines):
+    num, i = read_argument(tokens, i)
+    den, i = read_argument(tokens, i)
+    frac_state = dict(state)
+    frac_state["size"] = state["size"] * script_scale
+    frac_state["shift"] = 0.0
+    num_w, num_h, num_d = measure_box(num, frac_state)
+    den_w, den_h, den_d = measure_box(den, frac_state)
+    s = state["size"] / 10.0
+    axis = math_axis_height * s
+    gap = 1.5 * s
+    add_kern(lines, 1.2 * s)
+    add_box(lines, max(num_w,
+                       den_w), axis + gap + num_d + num_h + state["shift"],
+            den_h + den_d + gap - axis - state["shift"])
+    add_kern(lines, 1.2 * s)
+    return i
+
+
+# NOTE: appends the boxes, kerns, and glue of the tokens to lines (a list of
+# lists; a new list is started for each line break). state holds the font
+# size (in pt), font, math mode, and vertical shift (for scripts).
+def typeset(tokens, state, lines):
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        i += 1
+        if t == "{":
+            arg, i = read_argument(tokens, i - 1)
+            typeset(arg, dict(state), lines)
+        elif t == "}":
+            continue
+        elif t == "$":
+            state["math"] = not state["math"]
+        elif t.isspace():
+            if not state["math"]:
+                add_glue(lines, state["size"] / 3.0)
+        elif t == "~":
+            add_kern(lines, state["size"] / 3.0)
+        elif state["math"] and (t == "_" or t == "^"):
+            arg, i = read_argument(tokens, i)
+            typeset(arg, script_state(state, t), lines)
+        elif t.startswith("\\") and len(t) > 1:
+            name = t[1:].rstrip("*")
+            if name in ("\\", "newline", "linebreak"):
+                i = skip_optional_argument(tokens, i)
+                lines.append([])
+            elif name in size_command_to_pt:
+                state["size"] = (size_command_to_pt[name] *
+                                 base_font_size_in_pt / 10.0)
+            elif name in font_commands:
+                state["font"] = font_commands[name]
+            elif name in font_arg_commands:
+                arg, i = read_argument(tokens, i)
+                arg_state = dict(state)
+                arg_state["font"], arg_state["math"] = font_arg_commands[name]
+                typeset(arg, arg_state, lines)
+            elif name in ("frac", "dfrac", "tfrac", "binom"):
+                i = typeset_fraction(tokens, i, state, lines)
+            elif name == "sqrt":
+                i = skip_optional_argument(tokens, i)
+                arg, i = read_argument(tokens, i)
+                w, h, d = measure_box(arg, state)
+                s = state["size"] / 10.0
+                add_box(lines, w + 8.33 * s, h + 1.0 * s, d)
+            elif name in spacing_commands:
+                add_kern(lines, spacing_commands[name] * state["size"])
+            elif name == " ":
+                add_glue(lines, state["size"] / 3.0)
+            elif name in num_ignored_args:
+                for _ in range(num_ignored_args[name]):
+                    _, i = read_argument(tokens, i)
+            else:
+                # NOTE: unknown commands are measured as a symbol.
+                if state["math"]:
+                    add_math_spacing(lines, name, state)
+                add_box(lines, *symbol_metrics(name, state))
+                if state["math"]:
+                    add_math_spacing(lines, name, state)
+        else:
+            if state["math"]:
+                add_math_spacing(lines, t, state)
+            add_box(lines, *char_metrics(t, state))
+            if state["math"]:
+                add_math_spacing(lines, t, state)
+
+
+# NOTE: greedy line breaking at glue; lines wider than text_width (in pt)
+# are broken at the last glue that fits.
+def break_lines(lines, text_width):
+    out = []
+    for line in lines:
+        current = []
+        width = 0.0
+        for j, x in enumerate(line):
+            if x[0] == "glue" and current:
+                # width of the next word.
+                word_width = 0.0
+                for y in line[j + 1:]:
+                    if y[0] == "glue":
+                        break
+                    word_width += y[1]
+                if width + x[1] + word_width > text_width:
+                    out.append(current)
+                    current = []
+                    width = 0.0
+                    continue
+            if x[0] == "glue" and not current:
+                continue
+            current.append(x)
+            width += x[1]
+        out.append(current)
+    return out
+
+
+# NOTE: returns (width, height, depth) of the text (in pt) with the depth of
+# the last line below the baseline of the first line.
+def text_extent_in_pt(expr, size_in_pt, font="rm", text_width=None):
+    lines = [[]]
+    state = {"size": size_in_pt, "font": font, "math": False, "shift": 0.0}
+    typeset(tokenize(expr), state, lines)
+    if text_width is not None:
+        lines = break_lines(lines, text_width)
+    else:
+        # NOTE: spaces at the ends of lines do not count.
+        lines = [[x for x in line] for line in lines]
+        for line in lines:
+            while line and line[-1][0] == "glue":
+                line.pop()
+            while line and line[0][0] == "glue":
+                line.pop(0)
+
+    widths = [sum([x[1] for x in line]) for line in lines]
+    heights = [
+        max([x[2]
+             for x in line] + [x_height * size_in_pt / 10.0])
+        for line in lines
+    ]
+    depths = [max([x[3] for x in line] + [0.0]) for line in lines]
+    width = max(widths) if text_width is None else text_width
+    height = heights[0]
+    depth = depths[-1]
+    for k in range(1, len(lines)):
+        depth += max(baselineskip_factor * size_in_pt,
+                     depths[k - 1] + heights[k] + 1.0)
+    return width, height, depth
+
+
+#### text runs (for drawing text without tex)
+# NOTE: unicode for the symbol commands (commands not here are written by name,
+# e.g., \log as log).
+symbol_to_unicode = {
+    "alpha": "\u03b1", "beta": "\u03b2", "gamma": "\u03b3",
+    "delta": "\u03b4", "epsilon": "\u03f5", "varepsilon": "\u03b5",
+    "zeta": "\u03b6", "eta": "\u03b7", "theta": "\u03b8", "iota": "\u03b9",
+    "kappa": "\u03ba", "lambda": "\u03bb", "mu": "\u03bc", "nu": "\u03bd",
+    "xi": "\u03be", "pi": "\u03c0", "rho": "\u03c1", "sigma": "\u03c3",
+    "tau": "\u03c4", "upsilon": "\u03c5", "phi": "\u03d5",
+    "varphi": "\u03c6", "chi": "\u03c7", "psi": "\u03c8", "omega": "\u03c9",
+    "Gamma": "\u0393", "Delta": "\u0394", "Theta": "\u0398",
+    "Lambda": "\u039b", "Xi": "\u039e", "Pi": "\u03a0", "Sigma": "\u03a3",
+    "Phi": "\u03a6", "Psi": "\u03a8", "Omega": "\u03a9",
+    "cdot": "\u22c5", "times": "\u00d7", "pm": "\u00b1", "mp": "\u2213",
+    "div": "\u00f7", "leq": "\u2264", "geq": "\u2265", "le": "\u2264",
+    "ge": "\u2265", "neq": "\u2260", "approx": "\u2248", "sim": "\u223c",
+    "equiv": "\u2261", "in": "\u2208", "notin": "\u2209",
+    "subset": "\u2282", "subseteq": "\u2286", "cup": "\u222a",
+    "cap": "\u2229", "to": "\u2192", "rightarrow": "\u2192",
+    "leftarrow": "\u2190", "mapsto": "\u21a6", "Rightarrow": "\u21d2",
+    "leftrightarrow": "\u2194", "infty": "\u221e", "partial": "\u2202",
+    "nabla": "\u2207", "forall": "\u2200", "exists": "\u2203",
+    "ldots": "\u2026", "cdots": "\u22ef", "dots": "\u2026",
+    "sum": "\u2211", "prod": "\u220f", "int": "\u222b", "ell": "\u2113",
+    "prime": "\u2032", "langle": "\u27e8", "rangle": "\u27e9", "mid": "|",
+    "|": "\u2016", "sqrt": "\u221a", "%": "%", "$": "$", "&": "&", "#": "#",
+    "_": "_", "{": "{", "}": "}", "textbackslash": "\\"
+} # yapf: disable
+
+
+def add_run(lines, text, state):
+    font = state["font"]
+    if state["math"] and font == "rm" and text.isalpha():
+        font = "it"
+    elif font == "up":
+        font = "rm"
+    key = (font, state["size"], state["shift"])
+    line = lines[-1]
+    if len(line) > 0 and line[-1][1:] == key:
+        line[-1] = (line[-1][0] + text,) + key
+    else:
+        line.append((text,) + key)
+
+
+def add_math_run(lines, text, name, state):
+    if name in math_binary_operators or name in math_relations:
+        text = "\u2009" + text + "\u2009"
+    add_run(lines, text, state)
+
+
+# NOTE: same as typeset, but appends runs of text (text, font, size, shift)
+# that approximate the expression with unicode (e.g., $\alpha_1$ is an italic
+# alpha followed by a smaller 1 shifted down). fractions are written inline.
+def typeset_runs(tokens, state, lines):
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        i += 1
+        if t == "{":
+            arg, i = read_argument(tokens, i - 1)
+            typeset_runs(arg, dict(state), lines)
+        elif t == "}":
+            continue
+        elif t == "$":
+            state["math"] = not state["math"]
+        elif t.isspace():
+            if not state["math"]:
+                add_run(lines, " ", state)
+        elif t == "~":
+            add_run(lines, "\u00a0", state)
+        elif state["math"] and (t == "_" or t == "^"):
+            arg, i = read_argument(tokens, i)
+            typeset_runs(arg, script_state(state, t), lines)
+        elif t.startswith("\\") and len(t) > 1:
+            name = t[1:].rstrip("*")
+            if name in ("\\", "newline", "linebreak"):
+                i = skip_optional_argument(tokens, i)
+                lines.append([])
+            elif name in size_command_to_pt:
+                state["size"] = (size_command_to_pt[name] *
+                                 base_font_size_in_pt / 10.0)
+            elif name in font_commands:
+                state["font"] = font_commands[name]
+            elif name in font_arg_commands:
+                arg, i = read_argument(tokens, i)
+                arg_state = dict(state)
+                arg_state["font"], arg_state["math"] = font_arg_commands[name]
+                typeset_runs(arg, arg_state, lines)
+            elif name in ("frac", "dfrac", "tfrac", "binom"):
+                num, i = read_argument(tokens, i)
+                den, i = read_argument(tokens, i)
+                typeset_runs(num, dict(state), lines)
+                add_run(lines, "/", state)
+                typeset_runs(den, dict(state), lines)
+            elif name in spacing_commands or name == " ":
+                if spacing_commands.get(name, 1.0) > 0.0:
+                    add_run(lines, " ", state)
+            elif name in num_ignored_args:
+                for _ in range(num_ignored_args[name]):
+                    _, i = read_argument(tokens, i)
+            else:
+                text = symbol_to_unicode.get(name, name)
+                if state["math"]:
+                    up_state = dict(state)
+                    if text.isalpha() and len(text) > 1:
+                        up_state["font"] = "up"
+                    add_math_run(lines, text, name, up_state)
+                else:
+                    add_run(lines, text, state)
+        elif state["math"]:
+            add_math_run(lines, "\u2212" if t == "-" else t, t, state)
+        else:
+            add_run(lines, t, state)
+
+
+# NOTE: returns the lines of the expression as lists of runs of text (text,
+# font, size in pt, baseline shift in pt).
+def text_runs(expr, size_in_pt, font="rm"):
+    lines = [[]]
+    state = {"size": size_in_pt, "font": font, "math": False, "shift": 0.0}
+    typeset_runs(tokenize(expr), state, lines)
+    # NOTE: spaces at the ends of lines do not count.
+    for line in lines:
+        while line and line[0][0].lstrip(" ") == "":
+            line.pop(0)
+        while line and line[-1][0].rstrip(" ") == "":
+            line.pop()
+        if line:
+            line[0] = (line[0][0].lstrip(" "),) + line[0][1:]
+            line[-1] = (line[-1][0].rstrip(" "),) + line[-1][1:]
+    return lines
+
+
+def split_tikz_options(tikz_str):
+    out = []
+    depth = 0
+    current = ""
+    for c in tikz_str:
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+        if c == "," and depth == 0:
+            out.append(current.strip())
+            current = ""
+        else:
+            current += c
+    out.append(current.strip())
+    return [x for x in out if x != ""]
+
+
+def tex_length_in_pt(s, em_in_pt):
+    m = re.match(r"^\s*([-+]?[0-9]*\.?[0-9]+)\s*([a-z]*)\s*$", s)
+    if m is None:
+        raise ValueError("Could not parse length: %s." % s)
+    x = float(m.group(1))
+    unit = m.group(2)
+    unit_to_pt = {
+        "pt": 1.0,
+        "": 1.0,
+        "cm": 1.0 / pt_in_cm,
+        "mm": 0.1 / pt_in_cm,
+        "in": 72.27,
+        "bp": 72.27 / 72.0,
+        "em": em_in_pt,
+        "ex": em_in_pt * x_height / 10.0
+    }
+    if unit not in unit_to_pt:
+        raise ValueError("Unit not implemented for length: %s." % s)
+    return x * unit_to_pt[unit]
+
+
+# NOTE: lengths with tex macros (e.g., 0.5\linewidth) cannot be evaluated
+# without tex; default is returned for them.
+def node_length_in_pt(s, em_in_pt, default):
+    if s is None:
+        return default
+    try:
+        return tex_length_in_pt(s, em_in_pt)
+    except ValueError:
+        return default
+
+
+# NOTE: position of each anchor in the box, as fractions of the width and
+# of the height from the bottom left corner.
+anchor_to_fractions = {
+    "center": (0.5, 0.5),
+    "north": (0.5, 1.0),
+    "south": (0.5, 0.0),
+    "west": (0.0, 0.5),
+    "east": (1.0, 0.5),
+    "north west": (0.0, 1.0),
+    "north east": (1.0, 1.0),
+    "south west": (0.0, 0.0),
+    "south east": (1.0, 0.0)
+}
+
+placement_to_anchor = {
+    "above": "south",
+    "below": "north",
+    "left": "east",
+    "right": "west",
+    "above left": "south east",
+    "above right": "south west",
+    "below left": "north east",
+    "below right": "north west"
+}
+
+
+def parse_node_options(tikz_str):
+    opts = {
+        "font_expr": "",
+        "anchor": "center",
+        "text_width": None,
+        "inner_xsep": None,
+        "inner_ysep": None,
+        "rotate": 0.0
+    }
+    for s in split_tikz_options(tikz_str):
+        if "=" in s:
+            k, v = [x.strip() for x in s.split("=", 1)]
+        else:
+            k, v = s, None
+        if v is None:
+            if k in placement_to_anchor:
+                opts["anchor"] = placement_to_anchor[k]
+        elif k == "font":
+            opts["font_expr"] = v.strip("{}")
+        elif k == "anchor":
+            opts["anchor"] = v
+        elif k == "text width":
+            opts["text_width"] = v
+        elif k == "inner sep":
+            opts["inner_xsep"] = v
+            opts["inner_ysep"] = v
+        elif k == "inner xsep":
+            opts["inner_xsep"] = v
+        elif k == "inner ysep":
+            opts["inner_ysep"] = v
+        elif k == "rotate":
+            # NOTE: angles that are tex expressions (e.g., 90/2) are not
+            # evaluated; the node is taken as not rotated.
+            try:
+                opts["rotate"] = float(v.strip("{}"))
+            except ValueError:
+                opts["rotate"] = 0.0
+    return opts
+
+
+# NOTE: returns the parsed options and the font state (size and font) of the
+# node. memoized.
+def node_options_and_font(tikz_str):
+    if tikz_str not in node_options_cache:
+        opts = parse_node_options(tikz_str)
+        # the font option sets the size and font of the whole node.
+        state = {
+            "size": base_font_size_in_pt,
+            "font": "rm",
+            "math": False,
+            "shift": 0.0
+        }
+        typeset(tokenize(opts["font_expr"]), state, [[]])
+        node_options_cache[tikz_str] = (opts, state)
+    return node_options_cache[tikz_str]
+
+
+# NOTE: returns the bbox of the node relative to its coordinates (in cm) as
+# [[x1, y1], [x2, y2]] (top left and bottom right) given the extent of its
+# text (in pt). em is the size of the font of the node (in pt).
+def node_relative_bbox(w, h, d, opts, em):
+    # NOTE: tikz uses inner sep=.3333em by default.
+    xsep = node_length_in_pt(opts["inner_xsep"], em, em / 3.0)
+    ysep = node_length_in_pt(opts["inner_ysep"], em, em / 3.0)
+    width = (w + 2.0 * xsep) * pt_in_cm
+    height = (h + d + 2.0 * ysep) * pt_in_cm
+
+    anchor = opts["anchor"]
+    if anchor in ("base", "mid", "base west", "base east", "mid west",
+                  "mid east"):
+        if anchor.startswith("base"):
+            y_above = (d + ysep) * pt_in_cm
+        else:
+            y_above = (d + ysep + x_height * em / 20.0) * pt_in_cm
+        fx = {
+            "": 0.5,
+            "west": 0.0,
+            "east": 1.0
+        }[anchor.split(" ")[-1] if " " in anchor else ""]
+        fy = y_above / height
+    elif anchor in anchor_to_fractions:
+        fx, fy = anchor_to_fractions[anchor]
+    else:
+        raise ValueError("Anchor not implemented for latex element: %s." %
+                         anchor)
+
+    cs_lst = [[-fx * width, (1.0 - fy) * height],
+              [(1.0 - fx) * width, (1.0 - fy) * height],
+              [-fx * width, -fy * height], [(1.0 - fx) * width, -fy * height]]
+    if opts["rotate"] != 0.0:
+        cs_lst = [
+            stz.rotate_coords(cs, [0.0, 0.0], opts["rotate"]) for cs in cs_lst
+        ]
+    return [[min([cs[0] for cs in cs_lst]),
+             max([cs[1] for cs in cs_lst])],
+            [max([cs[0] for cs in cs_lst]),
+             min([cs[1] for cs in cs_lst])]]
+
+
+# NOTE: (width, height, depth) of the text of a node with these options.
+# memoized.
+def node_text_extent_in_pt(expr, tikz_str=""):
+    key = (expr, tikz_str)
+    if key not in node_text_extent_cache:
+        opts, state = node_options_and_font(tikz_str)
+        em = state["size"]
+        # NOTE: a text width that cannot be parsed means no line breaking.
+        text_width = node_length_in_pt(opts["text_width"], em, None)
+        node_text_extent_cache[key] = text_extent_in_pt(expr, em, state["font"],
+                                                        text_width)
+    return node_text_extent_cache[key]
+
+
+# NOTE: returns the bbox of the node relative to its coordinates (in cm) as
+# [[x1, y1], [x2, y2]] (top left and bottom right). memoized.
+def estimated_relative_bbox(expr, tikz_str=""):
+    key = (expr, tikz_str)
+    if key in extent_cache:
+        return extent_cache[key]
+
+    opts, state = node_options_and_font(tikz_str)
+    w, h, d = node_text_extent_in_pt(expr, tikz_str)
+    b = node_relative_bbox(w, h, d, opts, state["size"])
+    extent_cache[key] = b
+    return b
+
+
+# NOTE: for drawing the node without tex. returns the box of the node relative
+# to its coordinates before rotation (in cm), the inner separations (in cm),
+# the height of the first line (in cm), and the options and font state.
+def estimated_node_box(expr, tikz_str=""):
+    opts, state = node_options_and_font(tikz_str)
+    em = state["size"]
+    w, h, d = node_text_extent_in_pt(expr, tikz_str)
+    unrotated_opts = dict(opts)
+    unrotated_opts["rotate"] = 0.0
+    b = node_relative_bbox(w, h, d, unrotated_opts, em)
+    xsep = node_length_in_pt(opts["inner_xsep"], em, em / 3.0)
+    ysep = node_length_in_pt(opts["inner_ysep"], em, em / 3.0)
+    return b, xsep * pt_in_cm, ysep * pt_in_cm, h * pt_in_cm, opts, state
+
+
+def estimated_size(e):
+    (x1, y1), (x2, y2) = estimated_relative_bbox(e["expr"], e["tikz_str"])
+    return x2 - x1, y1 - y2
+
+
+def estimated_bbox_latex(e):
+    (x1, y1), (x2, y2) = estimated_relative_bbox(e["expr"], e["tikz_str"])
+    x, y = e["cs"]
+    return [[x + x1, y + y1], [x + x2, y + y2]]
+
+
+# NOTE: the bbox of the figure with the estimated extents of the latex
+# elements (e.g., for the backends that draw without tex).
+def estimated_figure_bbox(e):
+    bboxes = [stz.bbox(e)]
+    for e_i in stz.iter_leaf_elements(e):
+        if e_i["type"] == "latex":
+            bboxes.append(estimated_bbox_latex(e_i))
+    return stz.bbox_union(bboxes)
+
+
+# NOTE: latex elements are points for stz.bbox by default (see
+# core.bbox_latex). this changes it for all the figure code after the call.
+def use_estimated_latex_bboxes(enable=True):
+    stz.type_to_fns["latex"]["bbox"] = (estimated_bbox_latex
+                                        if enable else stz.bbox_latex)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# interpretation of the tikz options of elements (the tikz_str) for the
+# backends that draw without tex (e.g., svg.py). only the options produced by
+# formatting.py and the common tikz ones are understood (colors, opacities,
+# line widths, dash patterns, arrow heads, and rounded corners); the others are
+# ignored. colors are named xcolor colors, mixes such as red!50!blue, or the
+# names in name2color_in_rgb (as for the standalone tex header).
+#
+# style = parse_style("draw=red, line width=0.1cm, -latex", name2color)
+# style["stroke"], style["line_width"], style["end_arrow"]
+
+import sane_tikz.text_extent as te
+
+pt_in_cm = te.pt_in_cm
+
+# NOTE: the predefined colors of xcolor (and the ones loaded by tikz).
+xcolor_named_colors = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "red": (255, 0, 0),
+    "green": (0, 255, 0),
+    "blue": (0, 0, 255),
+    "cyan": (0, 255, 255),
+    "magenta": (255, 0, 255),
+    "yellow": (255, 255, 0),
+    "gray": (128, 128, 128),
+    "darkgray": (64, 64, 64),
+    "lightgray": (191, 191, 191),
+    "brown": (191, 128, 64),
+    "lime": (191, 255, 0),
+    "olive": (128, 128, 0),
+    "orange": (255, 128, 0),
+    "pink": (255, 191, 191),
+    "purple": (191, 0, 64),
+    "teal": (0, 128, 128),
+    "violet": (128, 0, 128)
+}
+
+# line widths (in pt) of the tikz width keys.
+line_width_keys = {
+    "ultra thin": 0.1,
+    "very thin": 0.2,
+    "thin": 0.4,
+    "semithick": 0.6,
+    "thick": 0.8,
+    "very thick": 1.2,
+    "ultra thick": 1.6
+}
+
+# dash patterns (in pt) as lists of on and off lengths. None stands for the
+# line width (dots).
+dash_patterns = {
+    "solid": [],
+    "dashed": [3.0, 3.0],
+    "densely dashed": [3.0, 2.0],
+    "loosely dashed": [3.0, 6.0],
+    "dotted": [None, 2.0],
+    "densely dotted": [None, 1.0],
+    "loosely dotted": [None, 4.0],
+    "dashdotted": [3.0, 2.0, None, 2.0],
+    "densely dashdotted": [3.0, 1.0, None, 1.0],
+    "loosely dashdotted": [3.0, 4.0, None, 4.0]
+}
+
+# NOTE: the names of tips that can appear in arrow specifications
+# (e.g., -latex, <->, -{Latex[length=2mm]}).
+arrow_tip_names = set(
+    ["", "<", ">", "latex", "Latex", "stealth", "Stealth", "to", "To", ">>"])
+
+
+def mixed_color(rgb, other_rgb, pct):
+    a = pct / 100.0
+    return tuple([
+        int(round(a * rgb[i] + (1.0 - a) * other_rgb[i], 0)) for i in range(3)
+    ])
+
+
+# NOTE: xcolor expressions: c, c!p (with white), and c1!p!c2 (chained from the
+# left, e.g., c1!p1!c2!p2!c3). returns None for unknown colors.
+def color_to_rgb(s, name2color_in_rgb=None):
+    parts = [x.strip() for x in s.split("!")]
+
+    def named(name):
+        if name2color_in_rgb is not None and name in name2color_in_rgb:
+            return tuple(name2color_in_rgb[name])
+        return xcolor_named_colors.get(name)
+
+    rgb = named(parts[0])
+    k = 1
+    while rgb is not None and k < len(parts):
+        try:
+            pct = float(parts[k])
+        except ValueError:
+            return None
+        other_rgb = named(parts[k + 1]) if k + 1 < len(parts) else (255, 255,
+                                                                    255)
+        if other_rgb is None:
+            return None
+        rgb = mixed_color(rgb, other_rgb, pct)
+        k += 2
+    return rgb
+
+
+def defined_color_to_rgb(s, name2color_in_rgb=None):
+    rgb = color_to_rgb(s, name2color_in_rgb)
+    if rgb is None:
+        raise ValueError("Color not defined: %s." % s)
+    return rgb
+
+
+def length_in_cm(s, default):
+    x = te.node_length_in_pt(s, te.base_font_size_in_pt, None)
+    return default if x is None else x * pt_in_cm
+
+
+def arrow_tips(s):
+    if "-" not in s or "=" in s:
+        return None
+    start, end = s.split("-", 1)
+    start = start.strip().strip("{}").split("[")[0]
+    end = end.strip().strip("{}").split("[")[0]
+    if start not in arrow_tip_names or end not in arrow_tip_names:
+        return None
+    return start != "", end != ""
+
+
+# NOTE: returns a dict with the style of the element. stroke and fill are rgb
+# tuples or None (no stroke or no fill); lengths are in cm. draw says whether
+# the element is stroked by default (\draw vs \node).
+def parse_style(tikz_str, name2color_in_rgb=None, draw=True):
+    color = (0, 0, 0)
+    stroke = "color" if draw else None
+    fill = None
+    text = "color"
+    style = {
+        "line_width": 0.4 * pt_in_cm,
+        "stroke_opacity": 1.0,
+        "fill_opacity": 1.0,
+        "text_opacity": 1.0,
+        "dash": "solid",
+        "start_arrow": False,
+        "end_arrow": False,
+        "rounded_corners": 0.0,
+        "line_cap": "butt",
+        "line_join": "miter"
+    }
+    for s in te.split_tikz_options(tikz_str):
+        if "=" in s:
+            k, v = [x.strip() for x in s.split("=", 1)]
+        else:
+            k, v = s, None
+        if k == "draw":
+            stroke = "color" if v is None else (
+                None if v == "none" else defined_color_to_rgb(
+                    v, name2color_in_rgb))
+        elif k == "fill":
+            fill = "color" if v is None else (
+                None if v == "none" else defined_color_to_rgb(
+                    v, name2color_in_rgb))
+        elif k == "text":
+            text = defined_color_to_rgb(v, name2color_in_rgb)
+        elif k == "color":
+            color = defined_color_to_rgb(v, name2color_in_rgb)
+        elif k == "line width":
+            style["line_width"] = length_in_cm(v, style["line_width"])
+        elif k in line_width_keys:
+            style["line_width"] = line_width_keys[k] * pt_in_cm
+        elif k == "opacity":
+            style["stroke_opacity"] = style["fill_opacity"] = style[
+                "text_opacity"] = float(v)
+        elif k in ["line opacity", "draw opacity"]:
+            style["stroke_opacity"] = float(v)
+        elif k == "fill opacity":
+            style["fill_opacity"] = float(v)
+        elif k == "text opacity":
+            style["text_opacity"] = float(v)
+        elif k in dash_patterns:
+            style["dash"] = k
+        elif k == "rounded corners":
+            style["rounded_corners"] = (4.0 * pt_in_cm if v is None else
+                                        length_in_cm(v, 4.0 * pt_in_cm))
+        elif k == "sharp corners":
+            style["rounded_corners"] = 0.0
+        elif k == "line cap":
+            style["line_cap"] = v
+        elif k == "line join":
+            style["line_join"] = v
+        elif v is None and arrow_tips(k) is not None:
+            style["start_arrow"], style["end_arrow"] = arrow_tips(k)
+        elif v is None and color_to_rgb(k, name2color_in_rgb) is not None:
+            color = color_to_rgb(k, name2color_in_rgb)
+
+    style["stroke"] = color if stroke == "color" else stroke
+    style["fill"] = color if fill == "color" else fill
+    style["text"] = color if text == "color" else text
+    return style
+
+
+# NOTE: the dash pattern (in cm) for the style (empty for solid lines).
+def dash_lengths(style):
+    return [(style["line_width"] if x is None else x * pt_in_cm)
+            for x in dash_patterns[style["dash"]]]
+
+
+# NOTE: arrow heads are triangles 10 line widths long and 7 wide (the same as
+# the svg markers). returns the corners (back, tip, back) given the end of the
+# path and the point before it.
+def arrow_head_coords(tip_cs, from_cs, line_width):
+    dx = tip_cs[0] - from_cs[0]
+    dy = tip_cs[1] - from_cs[1]
+    length = (dx * dx + dy * dy)**0.5
+    if length == 0.0:
+        return None
+    ux = dx / length
+    uy = dy / length
+    back_x = tip_cs[0] - 10.0 * line_width * ux
+    back_y = tip_cs[1] - 10.0 * line_width * uy
+    hw = 3.5 * line_width
+    return [[back_x - hw * uy, back_y + hw * ux], [tip_cs[0], tip_cs[1]],
+            [back_x + hw * uy, back_y - hw * ux]]
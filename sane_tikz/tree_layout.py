@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+# tidy tree layout (reingold-tilford, in the linear time version of walker's
+# algorithm by buchheim, juenger, and leipert). the tree is given by a list of
+# elements and the index of the parent of each one (None for the root).
+# siblings are kept in the order of the list. the bboxes of the elements are
+# used for the spacing between neighbors and between levels, and each element
+# is translated once at the end.
+#
+# tree_layout(e_lst, parent_lst, [0.0, 0.0], orientation="top_down")
+# edges = tree_connectors(e_lst, parent_lst, orientation="top_down")
+
+import sane_tikz.core as stz
+
+orientations = ["top_down", "bottom_up", "left_right", "right_left"]
+
+
+def tree_children(parent_lst):
+    children = [[] for _ in parent_lst]
+    roots = []
+    for i, p in enumerate(parent_lst):
+        if p is None:
+            roots.append(i)
+        else:
+            children[p].append(i)
+    assert len(roots) == 1
+    return roots[0], children
+
+
+# NOTE: nested trees are given as (e, [subtree, ...]).
+def tree_from_nested(nested):
+    e_lst = []
+    parent_lst = []
+    stack = [(nested, None)]
+    while len(stack) > 0:
+        (e, subtrees), p = stack.pop()
+        parent_lst.append(p)
+        e_lst.append(e)
+        i = len(e_lst) - 1
+        for t in reversed(subtrees):
+            stack.append((t, i))
+    return e_lst, parent_lst
+
+
+# NOTE: children before parents and left subtrees before right ones.
+def postorder(root, children):
+    order = []
+    stack = [root]
+    while len(stack) > 0:
+        v = stack.pop()
+        order.append(v)
+        stack.extend(children[v])
+    order.reverse()
+    return order
+
+
+# NOTE: returns the position of each node along the sibling axis (0 for the
+# root) given the breadth of each node. see buchheim et al., "improving
+# walker's algorithm to run in linear time" (2002).
+def tidy_tree_positions(root, children, parent_lst, breadth_lst,
+                        sibling_spacing, subtree_spacing):
+    n = len(parent_lst)
+    prelim = [0.0] * n
+    mod = [0.0] * n
+    shift = [0.0] * n
+    change = [0.0] * n
+    thread = [None] * n
+    ancestor = list(range(n))
+    number = [0] * n
+    left_sibling = [None] * n
+    leftmost_sibling = [None] * n
+    for v in range(n):
+        for k, w in enumerate(children[v]):
+            number[w] = k
+            if k > 0:
+                left_sibling[w] = children[v][k - 1]
+                leftmost_sibling[w] = children[v][0]
+    # NOTE: the default ancestor of the children of each node (see apportion).
+    default_ancestor = [None] * n
+
+    def distance(v, w):
+        if parent_lst[v] == parent_lst[w]:
+            s = sibling_spacing
+        else:
+            s = subtree_spacing
+        return (breadth_lst[v] + breadth_lst[w]) / 2.0 + s
+
+    def next_left(v):
+        return children[v][0] if len(children[v]) > 0 else thread[v]
+
+    def next_right(v):
+        return children[v][-1] if len(children[v]) > 0 else thread[v]
+
+    def move_subtree(wl, wr, s):
+        num_subtrees = float(number[wr] - number[wl])
+        change[wr] -= s / num_subtrees
+        shift[wr] += s
+        change[wl] += s / num_subtrees
+        prelim[wr] += s
+        mod[wr] += s
+
+    def apportion(v, da):
+        w = left_sibling[v]
+        if w is None:
+            return da
+        vir = vor = v
+        vil = w
+        vol = leftmost_sibling[v]
+        sir = sor = mod[v]
+        sil = mod[vil]
+        sol = mod[vol]
+        while next_right(vil) is not None and next_left(vir) is not None:
+            vil = next_right(vil)
+            vir = next_left(vir)
+            vol = next_left(vol)
+            vor = next_right(vor)
+            ancestor[vor] = v
+            s = (prelim[vil] + sil) - (prelim[vir] + sir) + distance(vil, vir)
+            if s > 0.0:
+                a = ancestor[vil]
+                if parent_lst[a] != parent_lst[v]:
+                    a = da
+                move_subtree(a, v, s)
+                sir += s
+                sor += s
+            sil += mod[vil]
+            sir += mod[vir]
+            sol += mod[vol]
+            sor += mod[vor]
+        if next_right(vil) is not None and next_right(vor) is None:
+            thread[vor] = next_right(vil)
+            mod[vor] += sil - sor
+        if next_left(vir) is not None and next_left(vol) is None:
+            thread[vol] = next_left(vir)
+            mod[vol] += sir - sol
+            da = v
+        return da
+
+    def execute_shifts(v):
+        s = 0.0
+        c = 0.0
+        for w in reversed(children[v]):
+            prelim[w] += s
+            mod[w] += s
+            c += change[w]
+            s += shift[w] + c
+
+    # first walk (each node is finished after its subtree and left siblings).
+    for v in postorder(root, children):
+        w = left_sibling[v]
+        if len(children[v]) == 0:
+            prelim[v] = 0.0 if w is None else prelim[w] + distance(w, v)
+        else:
+            execute_shifts(v)
+            midpoint = (prelim[children[v][0]] + prelim[children[v][-1]]) / 2.0
+            if w is None:
+                prelim[v] = midpoint
+            else:
+                prelim[v] = prelim[w] + distance(w, v)
+                mod[v] = prelim[v] - midpoint
+        p = parent_lst[v]
+        if p is not None:
+            if w is None:
+                default_ancestor[p] = v
+            default_ancestor[p] = apportion(v, default_ancestor[p])
+
+    # second walk (accumulates the modifiers from the root down).
+    pos = [0.0] * n
+    depth = [0] * n
+    stack = [(root, -prelim[root])]
+    while len(stack) > 0:
+        v, m = stack.pop()
+        pos[v] = prelim[v] + m
+        for w in children[v]:
+            depth[w] = depth[v] + 1
+            stack.append((w, m + mod[v]))
+    return pos, depth
+
+
+# NOTE: the centers of the nodes of each level are on a line. the distance
+# between consecutive lines is given by the largest nodes of each level.
+def level_positions(depth, length_lst, level_spacing):
+    num_levels = max(depth) + 1
+    max_lengths = [0.0] * num_levels
+    for d, x in zip(depth, length_lst):
+        if x > max_lengths[d]:
+            max_lengths[d] = x
+    level_pos = [0.0] * num_levels
+    for d in range(1, num_levels):
+        level_pos[d] = (level_pos[d - 1] +
+                        (max_lengths[d - 1] + max_lengths[d]) / 2.0 +
+                        level_spacing)
+    return level_pos
+
+
+# NOTE: the center of the root bbox goes to root_cs. for top_down and
+# bottom_up, siblings go from left to right; for left_right and right_left,
+# from top to bottom.
+def tree_layout(e_lst,
+                parent_lst,
+                root_cs,
+                orientation="top_down",
+                sibling_spacing=0.5,
+                subtree_spacing=1.0,
+                level_spacing=1.0):
+    assert orientation in orientations
+    assert len(e_lst) == len(parent_lst)
+    root, children = tree_children(parent_lst)
+    bboxes = [stz.bbox(e) for e in e_lst]
+    widths = [x2 - x1 for ((x1, _), (x2, _)) in bboxes]
+    heights = [y1 - y2 for ((_, y1), (_, y2)) in bboxes]
+    is_vertical = orientation in ["top_down", "bottom_up"]
+    if is_vertical:
+        breadth_lst, length_lst = widths, heights
+    else:
+        breadth_lst, length_lst = heights, widths
+
+    pos, depth = tidy_tree_positions(root, children, parent_lst, breadth_lst,
+                                     sibling_spacing, subtree_spacing)
+    level_pos = level_positions(depth, length_lst, level_spacing)
+    sign = 1.0 if orientation in ["bottom_up", "left_right"] else -1.0
+    for i, e in enumerate(e_lst):
+        (x1, y1), (x2, y2) = bboxes[i]
+        if is_vertical:
+            x = root_cs[0] + pos[i]
+            y = root_cs[1] + sign * level_pos[depth[i]]
+        else:
+            x = root_cs[0] + sign * level_pos[depth[i]]
+            y = root_cs[1] - pos[i]
+        delta_x = x - (x1 + x2) / 2.0
+        delta_y = y - (y1 + y2) / 2.0
+        if delta_x != 0.0 or delta_y != 0.0:
+            stz.translate(e, delta_x, delta_y)
+
+
+# NOTE: connects the sides of the bboxes that face each other.
+def bbox_side_connector_fn(orientation="top_down", tikz_str=""):
+    from_fn, to_fn = {
+        "top_down": (stz.bottom_center_coords, stz.top_center_coords),
+        "bottom_up": (stz.top_center_coords, stz.bottom_center_coords),
+        "left_right": (stz.right_center_coords, stz.left_center_coords),
+        "right_left": (stz.left_center_coords, stz.right_center_coords)
+    }[orientation]
+
+    def fn(e_from, e_to):
+        return stz.line_segment(stz.coords_from_bbox_with_fn(e_from, from_fn),
+                                stz.coords_from_bbox_with_fn(e_to, to_fn),
+                                tikz_str)
+
+    return fn
+
+
+# NOTE: for nodes drawn as circles of the same radius (centered in their bbox).
+def circle_connector_fn(radius, tikz_str=""):
+
+    def fn(e_from, e_to):
+        from_cs = stz.center_coords(e_from)
+        to_cs = stz.center_coords(e_to)
+        out_angle = stz.vector_to_angle([from_cs, to_cs])
+        return stz.line_segment_between_circles(from_cs, radius, out_angle,
+                                                to_cs, radius,
+                                                out_angle + 180.0, tikz_str)
+
+    return fn
+
+
+# NOTE: one connector from each parent to each of its children.
+def tree_connectors(e_lst,
+                    parent_lst,
+                    orientation="top_down",
+                    connector_fn=None):
+    if connector_fn is None:
+        connector_fn = bbox_side_connector_fn(orientation)
+    return [
+        connector_fn(e_lst[p], e)
+        for e, p in zip(e_lst, parent_lst)
+        if p is not None
+    ]